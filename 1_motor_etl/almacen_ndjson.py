@@ -0,0 +1,302 @@
+"""
+Almacén NDJSON comprimido de los meses OCDS (1_database/ndjson/<mes>/).
+
+Cada mes se reescribe en partes de N registros (una línea JSON por registro, zstd o gzip)
+más un indice.json con el conteo y tamaño de cada parte. Así:
+- el disco baja 5-10x frente al JSON plano,
+- se puede leer desde cualquier parte sin recorrer el archivo desde el inicio,
+- las partes se pueden parsear en paralelo (mapear_partes).
+
+Uso desde cargador o scripts de análisis:
+    for r in almacen_ndjson.iterar_registros_archivo(ruta_json): ...
+Usa las partes si están vigentes y, si no, el JSON original (motor_parseo).
+Con patron=motor_parseo.patron_tipos([...]) las líneas/registros que no lo contienen
+se descartan sin parsearlos.
+
+CLI (etapa opcional post-descarga, también disponible como descargador.py --ndjson):
+    python almacen_ndjson.py --registros 5000 --compresion zstd --borrar-json
+"""
+import os
+import io
+import sys
+import json
+import gzip
+import time
+import shutil
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import motor_parseo
+
+try:
+    import zstandard
+except ImportError:  # gzip como respaldo
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- CONFIGURACIÓN ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(script_dir)
+CARPETA_DATABASE = os.path.join(parent_dir, "1_database")
+CARPETA_NDJSON = os.path.join(CARPETA_DATABASE, "ndjson")
+
+REGISTROS_POR_PARTE = 5000
+COMPRESION_DEFECTO = "zstd" if zstandard is not None else "gzip"
+NIVEL_DEFECTO = {"zstd": 9, "gzip": 6}
+EXTENSION = {"zstd": ".ndjson.zst", "gzip": ".ndjson.gz"}
+NOMBRE_INDICE = "indice.json"
+VERSION_INDICE = 1
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+
+# --- 1. RUTAS E ÍNDICE ---
+def carpeta_mes(nombre_base: str, raiz: Optional[str] = None) -> str:
+    return os.path.join(raiz or CARPETA_NDJSON, nombre_base)
+
+def leer_indice(nombre_base: str, raiz: Optional[str] = None) -> Optional[Dict]:
+    ruta = os.path.join(carpeta_mes(nombre_base, raiz), NOMBRE_INDICE)
+    if not os.path.exists(ruta): return None
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            indice = json.load(f)
+        return indice if indice.get("version") == VERSION_INDICE else None
+    except (OSError, ValueError):
+        return None
+
+def raiz_de(ruta_json: str, raiz: Optional[str]) -> str:
+    """Las partes viven en <carpeta del JSON>/ndjson salvo que se indique otra raíz."""
+    return raiz or os.path.join(os.path.dirname(os.path.abspath(ruta_json)), "ndjson")
+
+def _firma_origen(ruta_json: str) -> Dict:
+    st = os.stat(ruta_json)
+    return {"archivo": os.path.basename(ruta_json), "bytes": st.st_size, "mtime": int(st.st_mtime)}
+
+def necesita_conversion(ruta_json: str, raiz: Optional[str] = None) -> bool:
+    """El JSON existe y no hay partes, o las partes son de una versión anterior del archivo."""
+    if not os.path.exists(ruta_json): return False
+    indice = leer_indice(os.path.basename(ruta_json)[:-5], raiz_de(ruta_json, raiz))
+    if not indice: return True
+    origen = _firma_origen(ruta_json)
+    return (indice["origen"]["bytes"], indice["origen"]["mtime"]) != (origen["bytes"], origen["mtime"])
+
+def partes_vigentes(ruta_json: str, raiz: Optional[str] = None) -> bool:
+    """True si las partes reemplazan al JSON (JSON borrado tras convertir, o sin cambios desde la conversión)."""
+    return leer_indice(os.path.basename(ruta_json)[:-5], raiz_de(ruta_json, raiz)) is not None and not necesita_conversion(ruta_json, raiz)
+
+# --- 2. COMPRESIÓN ---
+def _validar_compresion(compresion: str):
+    if compresion not in EXTENSION:
+        raise ValueError(f"Compresión no soportada: {compresion}")
+    if compresion == "zstd" and zstandard is None:
+        raise RuntimeError("El paquete 'zstandard' no está instalado (pip install zstandard) o use --compresion gzip")
+
+def _abrir_escritura(ruta: str, compresion: str, nivel: int):
+    if compresion == "zstd":
+        return zstandard.ZstdCompressor(level=nivel, write_checksum=True).stream_writer(open(ruta, "wb"))
+    return gzip.open(ruta, "wb", compresslevel=nivel)
+
+def _abrir_lectura(ruta: str, compresion: str):
+    if compresion == "zstd":
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(ruta, "rb"), closefd=True))
+    return gzip.open(ruta, "rb")
+
+def _dumps(registro: Dict) -> bytes:
+    if orjson is not None:
+        try: return orjson.dumps(registro)
+        except TypeError: pass  # enteros fuera de 64 bits, etc.
+    return json.dumps(registro, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# --- 3. ESCRITURA ---
+iterar_json = motor_parseo.iterar_json
+
+def convertir(ruta_json: str, registros_por_parte: int = REGISTROS_POR_PARTE,
+              compresion: str = COMPRESION_DEFECTO, nivel: Optional[int] = None,
+              raiz: Optional[str] = None) -> Dict:
+    """
+    Reescribe un mes en partes NDJSON comprimidas. Se escribe en <mes>.tmp y se renombra al final,
+    de modo que un corte a mitad nunca deja un índice que apunte a partes incompletas.
+    """
+    _validar_compresion(compresion)
+    nivel = nivel or NIVEL_DEFECTO[compresion]
+    nombre_base = os.path.basename(ruta_json)[:-5]
+    destino = carpeta_mes(nombre_base, raiz_de(ruta_json, raiz))
+    temporal = destino + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    origen = _firma_origen(ruta_json)
+    partes: List[Dict] = []
+    salida, en_parte = None, 0
+
+    def cerrar_parte():
+        salida.close()
+        ruta = os.path.join(temporal, partes[-1]["archivo"])
+        partes[-1].update(registros=en_parte, bytes=os.path.getsize(ruta))
+
+    try:
+        for registro in iterar_json(ruta_json):
+            if salida is None or en_parte >= registros_por_parte:
+                if salida is not None: cerrar_parte()
+                nombre_parte = f"parte_{len(partes):05d}{EXTENSION[compresion]}"
+                partes.append({"archivo": nombre_parte})
+                salida = _abrir_escritura(os.path.join(temporal, nombre_parte), compresion, nivel)
+                en_parte = 0
+            salida.write(_dumps(registro) + b"\n")
+            en_parte += 1
+        if salida is not None: cerrar_parte()
+    except Exception:
+        if salida is not None:
+            try: salida.close()
+            except Exception: pass
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+
+    indice = {
+        "version": VERSION_INDICE,
+        "nombre_base": nombre_base,
+        "compresion": compresion,
+        "registros_por_parte": registros_por_parte,
+        "total_registros": sum(p["registros"] for p in partes),
+        "bytes_comprimidos": sum(p["bytes"] for p in partes),
+        "origen": origen,
+        "creado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "partes": partes,
+    }
+    with open(os.path.join(temporal, NOMBRE_INDICE), "w", encoding="utf-8") as f:
+        json.dump(indice, f, indent=1)
+
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporal, destino)
+    return indice
+
+# --- 4. LECTURA ---
+def _leer_parte_ruta(ruta: str, compresion: str, patron=None) -> Iterator[Dict]:
+    with _abrir_lectura(ruta, compresion) as f:
+        yield from motor_parseo.iterar_lineas(f, patron)
+
+def leer_parte(nombre_base: str, numero: int, raiz: Optional[str] = None) -> Iterator[Dict]:
+    """Registros de una sola parte (acceso directo, sin leer las anteriores)."""
+    indice = leer_indice(nombre_base, raiz)
+    if not indice: raise FileNotFoundError(f"No hay partes NDJSON para {nombre_base}")
+    _validar_compresion(indice["compresion"])
+    ruta = os.path.join(carpeta_mes(nombre_base, raiz), indice["partes"][numero]["archivo"])
+    return _leer_parte_ruta(ruta, indice["compresion"])
+
+def iterar_registros(nombre_base: str, desde: int = 0, raiz: Optional[str] = None, patron=None) -> Iterator[Dict]:
+    """
+    Todos los registros del mes en orden, empezando por el registro 'desde' (salta partes enteras).
+    'patron' es un prefiltro en bytes por línea (ver motor_parseo.patron_tipos).
+    """
+    indice = leer_indice(nombre_base, raiz)
+    if not indice: raise FileNotFoundError(f"No hay partes NDJSON para {nombre_base}")
+    _validar_compresion(indice["compresion"])
+    carpeta = carpeta_mes(nombre_base, raiz)
+    acumulado = 0
+    for parte in indice["partes"]:
+        if acumulado + parte["registros"] <= desde:
+            acumulado += parte["registros"]
+            continue
+        saltar = max(0, desde - acumulado)
+        ruta = os.path.join(carpeta, parte["archivo"])
+        if saltar == 0:
+            yield from _leer_parte_ruta(ruta, indice["compresion"], patron)
+        else:
+            with _abrir_lectura(ruta, indice["compresion"]) as f:
+                lineas = (linea for i, linea in enumerate(f) if i >= saltar)
+                yield from motor_parseo.iterar_lineas(lineas, patron)
+        acumulado += parte["registros"]
+
+def iterar_registros_con_numero(nombre_base: str, raiz: Optional[str] = None, patron=None) -> Iterator[Tuple[int, Dict]]:
+    """(número de registro en el mes, registro). El número sirve como 'desde' de iterar_registros."""
+    indice = leer_indice(nombre_base, raiz)
+    if not indice: raise FileNotFoundError(f"No hay partes NDJSON para {nombre_base}")
+    _validar_compresion(indice["compresion"])
+    carpeta = carpeta_mes(nombre_base, raiz)
+    acumulado = 0
+    for parte in indice["partes"]:
+        with _abrir_lectura(os.path.join(carpeta, parte["archivo"]), indice["compresion"]) as f:
+            for i, linea in enumerate(f):
+                if patron is not None and not patron.search(linea): continue
+                if linea.strip(): yield acumulado + i, motor_parseo.cargar_trozo(linea)[0]
+        acumulado += parte["registros"]
+
+def iterar_registros_archivo(ruta_json: str, raiz: Optional[str] = None, patron=None) -> Iterator[Dict]:
+    """Punto de entrada para consumidores: partes NDJSON si están vigentes, si no el JSON original."""
+    if partes_vigentes(ruta_json, raiz):
+        return iterar_registros(os.path.basename(ruta_json)[:-5], raiz=raiz_de(ruta_json, raiz), patron=patron)
+    return motor_parseo.iterar_json(ruta_json, patron)
+
+def _aplicar_a_parte(args):
+    ruta, compresion, funcion = args
+    return funcion(list(_leer_parte_ruta(ruta, compresion)))
+
+def mapear_partes(nombre_base: str, funcion: Callable[[List[Dict]], object],
+                  procesos: Optional[int] = None, raiz: Optional[str] = None) -> List:
+    """
+    Aplica funcion(lista_de_registros) a cada parte en un pool de procesos y devuelve
+    los resultados en el orden de las partes. funcion debe ser de nivel módulo (picklable).
+    """
+    indice = leer_indice(nombre_base, raiz)
+    if not indice: raise FileNotFoundError(f"No hay partes NDJSON para {nombre_base}")
+    _validar_compresion(indice["compresion"])
+    carpeta = carpeta_mes(nombre_base, raiz)
+    trabajos = [(os.path.join(carpeta, p["archivo"]), indice["compresion"], funcion) for p in indice["partes"]]
+    with ProcessPoolExecutor(max_workers=procesos) as exe:
+        return list(exe.map(_aplicar_a_parte, trabajos))
+
+# --- 5. COMPACTACIÓN POR LOTES ---
+def compactar(carpeta: str = CARPETA_DATABASE, nombres: Optional[List[str]] = None,
+              registros_por_parte: int = REGISTROS_POR_PARTE, compresion: str = COMPRESION_DEFECTO,
+              nivel: Optional[int] = None, borrar_json: bool = False, forzar: bool = False,
+              raiz: Optional[str] = None) -> List[Dict]:
+    """Convierte los meses pendientes de la carpeta (o solo 'nombres'). Devuelve los índices creados."""
+    _validar_compresion(compresion)
+    if nombres is None:
+        nombres = sorted(f[:-5] for f in os.listdir(carpeta) if f.endswith(".json") and not f.startswith("temp_"))
+    creados = []
+    for nombre_base in nombres:
+        ruta_json = os.path.join(carpeta, f"{nombre_base}.json")
+        if not os.path.exists(ruta_json) or not (forzar or necesita_conversion(ruta_json, raiz)):
+            continue
+        inicio = time.time()
+        try:
+            indice = convertir(ruta_json, registros_por_parte, compresion, nivel, raiz)
+        except Exception as e:
+            logging.error(f"❌ NDJSON {nombre_base}: {e}")
+            continue
+        ratio = indice["origen"]["bytes"] / max(indice["bytes_comprimidos"], 1)
+        logging.info(f"🗜️ {nombre_base}: {indice['total_registros']} registros en {len(indice['partes'])} partes, "
+                     f"{indice['origen']['bytes'] / 1024 / 1024:.1f} MB -> {indice['bytes_comprimidos'] / 1024 / 1024:.1f} MB "
+                     f"({ratio:.1f}x) en {time.time() - inicio:.1f}s")
+        if borrar_json:
+            os.remove(ruta_json)
+        creados.append(indice)
+    return creados
+
+def main():
+    parser = argparse.ArgumentParser(description="Reescribe los JSON mensuales como partes NDJSON comprimidas")
+    parser.add_argument("--registros", type=int, default=REGISTROS_POR_PARTE, help="Registros por parte")
+    parser.add_argument("--compresion", choices=sorted(EXTENSION), default=COMPRESION_DEFECTO)
+    parser.add_argument("--nivel", type=int, default=None, help="Nivel de compresión (zstd 1-22, gzip 1-9)")
+    parser.add_argument("--meses", nargs="+", default=None, help="nombre_base a convertir (por defecto todos)")
+    parser.add_argument("--borrar-json", action="store_true", help="Elimina el JSON original tras convertir")
+    parser.add_argument("--forzar", action="store_true", help="Reconvierte aunque las partes estén vigentes")
+    args = parser.parse_args()
+
+    logging.info(f"🚀 ALMACÉN NDJSON ({args.compresion}, {args.registros} registros por parte)")
+    if not os.path.exists(CARPETA_DATABASE): return
+    creados = compactar(nombres=args.meses, registros_por_parte=args.registros, compresion=args.compresion,
+                        nivel=args.nivel, borrar_json=args.borrar_json, forzar=args.forzar)
+    logging.info(f"🏁 {len(creados)} meses convertidos.")
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        try: sys.stdout.reconfigure(encoding="utf-8")
+        except: pass
+    main()
@@ -0,0 +1,155 @@
+"""
+Backfill histórico: descarga y carga meses de años anteriores con todos los procedimientos
+(o los de --tipos), de a un mes y sin competir con la carga diaria.
+
+- Ritmo: descarga con límite de peticiones/s y MB/s (motor async de descargador.py), pausa entre
+  meses, tope de meses por ejecución y ventana horaria opcional (p. ej. 22-6, de noche).
+- Reanudable: un mes queda hecho cuando control_cargas lo registra con tipos_cargados que cubren
+  los pedidos. Si se corta a mitad de un mes, la próxima ejecución lo vuelve a cargar (lo ya
+  escrito sale sin cambios por huella). Los meses ya cargados no se vuelven a descargar.
+- Orden: del mes más reciente al más antiguo, para que la historia más útil llegue primero.
+
+Conviene usar los mismos tipos que la carga diaria (CARGADOR_TIPOS): el índice de ocid guarda con
+qué tipos se indexó cada mes y reindexa si cambian.
+
+Uso:
+    python backfill.py --anios 2019 2020 2021 2022 2023 --tipos "*" --pausa 120 --ventana 22-6
+    python backfill.py --anios 2018 --max-meses 3 --max-bandwidth 2
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import cargador
+import descargador
+import indice_ocid
+import cache_parquet
+from cargador import CARPETA_ENTRADA
+
+ESPERA_VENTANA = 300  # segundos entre comprobaciones fuera de la ventana horaria
+
+# --- 1. RITMO ---
+def leer_ventana(texto: Optional[str]) -> Optional[Tuple[int, int]]:
+    """'22-6' -> (22, 6). La ventana puede cruzar la medianoche."""
+    if not texto: return None
+    inicio, fin = (int(h) for h in texto.split("-"))
+    return inicio % 24, fin % 24
+
+def en_ventana(ventana: Optional[Tuple[int, int]], ahora: Optional[datetime] = None) -> bool:
+    if ventana is None: return True
+    inicio, fin = ventana
+    hora = (ahora or datetime.now()).hour
+    if inicio == fin: return True
+    return inicio <= hora < fin if inicio < fin else (hora >= inicio or hora < fin)
+
+def esperar_ventana(ventana: Optional[Tuple[int, int]]):
+    avisado = False
+    while not en_ventana(ventana):
+        if not avisado:
+            logging.info(f"🌙 Fuera de la ventana {ventana[0]:02d}-{ventana[1]:02d} h. Esperando...")
+            avisado = True
+        time.sleep(ESPERA_VENTANA)
+
+# --- 2. MESES ---
+def meses_del_backfill(anios: List[int], refrescar_links: bool = False) -> List[Dict[str, str]]:
+    """Links de descarga de los años pedidos, del más reciente al más antiguo."""
+    links = descargador.encontrar_links_de_descarga(anios, forzar=refrescar_links)
+    return sorted(links, key=lambda item: item["nombre_base"], reverse=True)
+
+def meses_hechos(conn, tipos) -> Dict[str, str]:
+    """Meses ya cargados con éxito con todos los 'tipos' pedidos -> tipos_cargados."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT nombre_archivo, tipos_cargados FROM control_cargas WHERE estado = 'EXITO'")
+    hechos = {archivo: clave for archivo, clave in cursor.fetchall() if cargador.cubre_tipos(clave, tipos)}
+    cursor.close()
+    return hechos
+
+def en_disco(archivo: str) -> bool:
+    """JSON o partes NDJSON del mes."""
+    return cache_parquet.firma_origen(os.path.join(CARPETA_ENTRADA, archivo)) is not None
+
+def descargar_mes(item: Dict[str, str], peticiones_seg: Optional[float], max_bytes_seg: Optional[float]) -> Dict[str, str]:
+    if descargador.aiohttp is None:
+        return descargador.tarea_descarga(item)
+    resultados = asyncio.run(descargador.descargar_todos_async(
+        [item], concurrencia=1, por_host=1, peticiones_seg=peticiones_seg, max_bytes_seg=max_bytes_seg))
+    return resultados[0]
+
+# --- 3. CARGA DE UN MES ---
+def cargar_mes(conn, archivo: str, tipos, bulk: bool = False) -> Dict:
+    # El índice de ocid necesita todos los meses en disco, no solo este, para saber qué versión es la más nueva
+    archivos = cargador.listar_archivos_entrada()
+    indice_ocid.olvidar(archivos)
+    indice_ocid.actualizar([os.path.join(CARPETA_ENTRADA, a) for a in archivos], tipos)
+    firma = cargador.firma_archivo(archivo)
+    reemplazados = indice_ocid.reemplazados(archivo)
+    resumen = cargador.procesar_archivo(os.path.join(CARPETA_ENTRADA, archivo), conn, archivo, bulk,
+                                        reemplazados=reemplazados, tipos=tipos)
+    if "error" in resumen:
+        cargador.registrar_fallo(conn, archivo, resumen["error"])  # queda pendiente para la próxima ejecución
+    else:
+        cargador.registrar_carga(conn, archivo, resumen, firma, tipos)
+    return resumen
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Backfill histórico con límite de ritmo y reanudable")
+    parser.add_argument("--anios", nargs="+", type=int, required=True, help="Años a completar (p. ej. 2019 2020)")
+    parser.add_argument("--tipos", nargs="+", default=None,
+                        help="Procedimientos a cargar ('*' = todos). Por defecto los del cargador (CARGADOR_TIPOS)")
+    parser.add_argument("--pausa", type=float, default=60, help="Segundos de pausa entre meses")
+    parser.add_argument("--max-meses", type=int, default=0, help="Meses a cargar en esta ejecución (0 = todos)")
+    parser.add_argument("--ventana", default=None, help="Horas en que puede trabajar, p. ej. 22-6 (por defecto siempre)")
+    parser.add_argument("--rps", type=float, default=1, help="Peticiones por segundo al portal (0 = sin límite)")
+    parser.add_argument("--max-bandwidth", type=float, default=2, help="MB/s máximos de descarga (0 = sin límite)")
+    parser.add_argument("--bulk", action="store_true", default=cargador.BULK_DEFECTO, help="Carga con LOAD DATA (ver cargador.py)")
+    parser.add_argument("--refresh-links", action="store_true", help="Ignora la caché de links del descargador")
+    args = parser.parse_args()
+
+    tipos = cargador.leer_tipos(args.tipos) if args.tipos else cargador.TIPOS_PROCEDIMIENTO
+    ventana = leer_ventana(args.ventana)
+    logging.info(f"🚀 BACKFILL (Años: {', '.join(map(str, args.anios))}, Tipos: {cargador.clave_tipos(tipos)}, "
+                 f"Pausa: {args.pausa:.0f}s, Ventana: {args.ventana or 'siempre'})")
+
+    conn = cargador.obtener_conexion(args.bulk)
+    try:
+        if args.bulk and not cargador.local_infile_habilitado(conn):
+            logging.warning("⚠️ El servidor tiene local_infile=OFF. Se usa la escritura por lotes.")
+            args.bulk = False
+        cargador.preparar_tablas_control(conn)
+        hechos = meses_hechos(conn, tipos)
+        pendientes = [item for item in meses_del_backfill(args.anios, args.refresh_links) if f"{item['nombre_base']}.json" not in hechos]
+        logging.info(f"📋 {len(pendientes)} meses pendientes ({len(hechos)} ya cargados con esos tipos)")
+        if args.max_meses: pendientes = pendientes[:args.max_meses]
+
+        cargados = 0
+        for i, item in enumerate(pendientes):
+            esperar_ventana(ventana)
+            archivo = f"{item['nombre_base']}.json"
+            inicio = time.time()
+            if not en_disco(archivo):
+                r = descargar_mes(item, args.rps or None, args.max_bandwidth * 1024 * 1024 or None)
+                if r["estado"] == "FALLO" or not en_disco(archivo):
+                    logging.error(f"❌ {archivo}: descarga fallida ({r.get('mensaje') or r['estado']}). Queda para la próxima ejecución.")
+                    continue
+            if not conn.is_connected(): conn.reconnect(attempts=3, delay=5)
+            resumen = cargar_mes(conn, archivo, tipos, args.bulk)
+            if "error" in resumen:
+                logging.error(f"❌ {archivo}: carga fallida ({resumen['error']}). Queda para la próxima ejecución.")
+                continue
+            cargados += 1
+            logging.info(f"✅ {archivo}: {resumen['registros']} procesos en {time.time() - inicio:.1f}s "
+                         f"({resumen['nuevos']} nuevos) [{i + 1}/{len(pendientes)}]")
+            if i + 1 < len(pendientes) and args.pausa:
+                time.sleep(args.pausa)
+        logging.info(f"🏁 {cargados} meses cargados.")
+    except KeyboardInterrupt: logging.warning("🛑 Interrumpido. La próxima ejecución sigue desde el último mes registrado.")
+    finally:
+        if conn.is_connected(): conn.close()
+
+if __name__ == "__main__":
+    main()
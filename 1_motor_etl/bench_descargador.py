@@ -0,0 +1,130 @@
+"""
+Benchmark del descargador contra un servidor OECE falso local.
+
+Compara el pool de 3 hilos original (requests.get sin sesión, un handshake por archivo)
+con el motor de hilos actual (sesión compartida) y el motor async.
+El servidor simula el costo de abrir conexión (handshake TLS) y la latencia al primer byte.
+
+Uso:
+    python bench_descargador.py --meses 24 --mb 8 --handshake-ms 150 --latencia-ms 80
+"""
+import os
+import sys
+import gzip
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import requests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+import descargador
+
+def crear_servidor(payload: bytes, sha: str, handshake_s: float, latencia_s: float, max_bytes_seg: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive real
+
+        def setup(self):
+            time.sleep(handshake_s)  # costo de conexión nueva
+            super().setup()
+
+        def do_GET(self):
+            time.sleep(latencia_s)
+            cuerpo = sha.encode() if self.path.startswith("/sha") else payload
+            self.send_response(200)
+            self.send_header("ETag", '"bench"')
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            # Ancho de banda por conexión, para que la concurrencia importe
+            paso = 256 * 1024
+            for i in range(0, len(cuerpo), paso):
+                self.wfile.write(cuerpo[i:i + paso])
+                if max_bytes_seg: time.sleep(paso / max_bytes_seg)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+def tarea_original(item, carpeta):
+    """Réplica del worker V3.4: requests.get suelto, temporal y segunda pasada de gzip."""
+    ruta_temp = os.path.join(carpeta, f"temp_{item['nombre_base']}.json")
+    ruta_final = os.path.join(carpeta, f"{item['nombre_base']}.json")
+    with requests.get(item["json_url"], stream=True, timeout=600) as r:
+        r.raise_for_status()
+        with open(ruta_temp, "wb") as f:
+            for chunk in r.iter_content(chunk_size=1024*1024):
+                f.write(chunk)
+    with gzip.open(ruta_temp, "rb") as f_in, open(ruta_final, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(ruta_temp)
+    requests.get(item["sha_url"], timeout=30)
+
+def medir(nombre, items, bytes_totales, funcion):
+    carpeta = tempfile.mkdtemp(prefix="bench_desc_")
+    descargador.db_folder_path = carpeta
+    descargador.carpeta_cuarentena = os.path.join(carpeta, "cuarentena")
+    try:
+        inicio = time.perf_counter()
+        funcion(carpeta)
+        dur = time.perf_counter() - inicio
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    print(f"{nombre:<28} {dur:8.2f}s   {bytes_totales / dur / 1024 / 1024:8.1f} MB/s   {len(items) / dur:6.1f} meses/s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meses", type=int, default=24)
+    parser.add_argument("--mb", type=float, default=8, help="Tamaño comprimido aproximado por mes")
+    parser.add_argument("--handshake-ms", type=float, default=150)
+    parser.add_argument("--latencia-ms", type=float, default=80)
+    parser.add_argument("--mbps-conexion", type=float, default=20, help="Ancho de banda por conexión del servidor")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    # JSON sintético poco comprimible (hex aleatorio, ~2:1) para que el tamaño transferido sea el pedido
+    crudo = b'{"records":[{"x":"' + os.urandom(int(args.mb * 1024 * 1024)).hex().encode() + b'"}]}'
+    payload = gzip.compress(crudo, compresslevel=1)
+    sha = descargador.hashlib.sha256(crudo).hexdigest()
+
+    servidor = crear_servidor(payload, sha, args.handshake_ms / 1000, args.latencia_ms / 1000, args.mbps_conexion * 1024 * 1024)
+    base = f"http://127.0.0.1:{servidor.server_address[1]}"
+    items = [{
+        "nombre_base": f"{2000 + i // 12}-{i % 12 + 1:02d}_seace_v3",
+        "json_url": f"{base}/json/{i}",
+        "sha_url": f"{base}/sha/{i}",
+    } for i in range(args.meses)]
+    bytes_totales = len(payload) * len(items)
+    print(f"📦 {args.meses} meses x {len(payload) / 1024 / 1024:.1f} MB comprimidos ({len(crudo) / 1024 / 1024:.1f} MB JSON)\n")
+
+    def original(carpeta):
+        with ThreadPoolExecutor(max_workers=3) as exe:
+            list(exe.map(lambda it: tarea_original(it, carpeta), items))
+
+    def hilos(carpeta):
+        with ThreadPoolExecutor(max_workers=3) as exe:
+            list(exe.map(descargador.tarea_descarga, items))
+
+    def motor_async(carpeta):
+        asyncio.run(descargador.descargar_todos_async(items, concurrencia=args.concurrency, por_host=args.concurrency, peticiones_seg=None))
+
+    medir("V3.4 original (3 hilos)", items, bytes_totales, original)
+    medir("Hilos + sesión (3 hilos)", items, bytes_totales, hilos)
+    if descargador.aiohttp is None:
+        print("⚠️ aiohttp no instalado: se omite el motor async")
+    else:
+        medir(f"Async (concurrencia {args.concurrency})", items, bytes_totales, motor_async)
+
+    servidor.shutdown()
+
+if __name__ == "__main__":
+    descargador.logging.getLogger().setLevel(descargador.logging.WARNING)
+    if sys.platform.startswith("win"):
+        try: sys.stdout.reconfigure(encoding="utf-8")
+        except: pass
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark del parseo de un mes OCDS sintético.
+
+Compara el parseo original del cargador (ijson.items + filtro sobre el dict), el motor de trozos
+con prefiltro en bytes (motor_parseo) y la lectura de partes NDJSON con el mismo prefiltro.
+La conversión a NDJSON se mide aparte: se paga una sola vez por mes y la aprovechan todas las recargas.
+
+Uso:
+    python bench_parseo.py --mb 2048 --fraccion 0.08
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import ijson
+
+import motor_parseo
+import almacen_ndjson
+
+TIPO_BUSCADO = "Licitación Pública"
+OTROS_TIPOS = ["Adjudicación Simplificada", "Subasta Inversa Electrónica", "Comparación de Precios", "Contratación Directa"]
+
+def registro_sintetico(rnd: random.Random, i: int, tipo: str) -> dict:
+    ocid = f"ocds-dgv273-seacev3-{i}"
+    tender = {
+        "id": str(i),
+        "title": "ADQUISICION DE MATERIALES {LOTE} [x] \"ref\" " + "X" * rnd.randint(20, 200),
+        "description": "d" * rnd.randint(50, 400),
+        "procurementMethodDetails": tipo,
+        "status": "active",
+        "mainProcurementCategory": rnd.choice(["goods", "services", "works"]),
+        "value": {"amount": round(rnd.random() * 1e6, 2), "currency": "PEN"},
+        "items": [{"id": str(k), "description": "item " * 10, "statusDetails": "Convocado", "quantity": k}
+                  for k in range(rnd.randint(1, 6))],
+        "tenderPeriod": {"startDate": "2024-01-05T10:00:00-05:00"},
+    }
+    release = {
+        "ocid": ocid, "id": f"{ocid}-1", "date": "2024-01-05T10:00:00-05:00", "tag": ["tender"],
+        "tender": tender,
+        "buyer": {"id": "PE-RUC-20100000001", "name": "MUNICIPALIDAD DISTRITAL DE ÑAHUIMPUQUIO"},
+        "parties": [{"id": "PE-RUC-20100000001", "name": "MUNICIPALIDAD", "roles": ["buyer"],
+                     "address": {"department": "LIMA", "region": "LIMA", "locality": "LIMA"}}],
+        "awards": [{"id": f"{i}-a{k}", "date": "2024-02-01", "status": "active",
+                    "value": {"amount": 1.5, "currency": "PEN"},
+                    "suppliers": [{"id": "PE-RUC-20600000002", "name": "PROVEEDOR SAC"}]}
+                   for k in range(rnd.randint(0, 3))],
+    }
+    return {"ocid": ocid, "releases": [{"url": "https://contratacionesabiertas.oece.gob.pe", "date": release["date"], "tag": ["tender"]}],
+            "compiledRelease": release}
+
+def generar_mes(ruta: str, mb: float, fraccion: float, semilla: int = 1) -> int:
+    """Escribe un record package de ~mb MB. Mitad de los registros con \\uXXXX, mitad en UTF-8 directo."""
+    rnd = random.Random(semilla)
+    objetivo = int(mb * 1024 * 1024)
+    escritos = total = 0
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write('{"uri":"https://contratacionesabiertas.oece.gob.pe","version":"1.1","records":[')
+        while escritos < objetivo:
+            tipo = TIPO_BUSCADO if rnd.random() < fraccion else rnd.choice(OTROS_TIPOS)
+            texto = json.dumps(registro_sintetico(rnd, total, tipo), ensure_ascii=(total % 2 == 0))
+            if total: texto = "," + texto
+            f.write(texto)
+            escritos += len(texto)
+            total += 1
+        f.write('],"publishedDate":"2024-02-01T00:00:00Z"}')
+    return total
+
+def original(ruta: str):
+    """Lo que hacía el cargador: un dict por registro y recién ahí el filtro."""
+    leidos = filtrados = 0
+    with open(ruta, "rb") as f:
+        for r in ijson.items(f, "records.item", use_float=True):
+            leidos += 1
+            if r.get("compiledRelease", {}).get("tender", {}).get("procurementMethodDetails") == TIPO_BUSCADO:
+                filtrados += 1
+    return leidos, filtrados
+
+def contar_filtrados(registros) -> tuple:
+    filtrados = 0
+    for r in registros:
+        if r.get("compiledRelease", {}).get("tender", {}).get("procurementMethodDetails") == TIPO_BUSCADO:
+            filtrados += 1
+    return None, filtrados
+
+def medir(nombre, bytes_totales, funcion):
+    inicio = time.perf_counter()
+    leidos, filtrados = funcion()
+    dur = time.perf_counter() - inicio
+    extra = f"   {leidos / dur:9.0f} reg/s" if leidos else ""
+    print(f"{nombre:<34} {dur:8.2f}s   {bytes_totales / dur / 1024 / 1024:8.1f} MB/s{extra}   ({filtrados} filtrados)")
+    return filtrados
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=2048, help="Tamaño aproximado del JSON del mes")
+    parser.add_argument("--fraccion", type=float, default=0.08, help="Fracción de registros del tipo buscado")
+    parser.add_argument("--carpeta", default=None, help="Dónde generar el mes (por defecto un temporal)")
+    parser.add_argument("--sin-original", action="store_true", help="Omite el parseo original (lento en meses grandes)")
+    args = parser.parse_args()
+
+    carpeta = args.carpeta or tempfile.mkdtemp(prefix="bench_parseo_")
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, "2024-01_seace_v3.json")
+    try:
+        inicio = time.perf_counter()
+        total = generar_mes(ruta, args.mb, args.fraccion)
+        bytes_totales = os.path.getsize(ruta)
+        print(f"📦 {total} registros, {bytes_totales / 1024 / 1024:.1f} MB JSON (generado en {time.perf_counter() - inicio:.1f}s)")
+        print(f"⚙️ {motor_parseo.describir_backend()} | ijson original: {ijson.backend}\n")
+
+        patron = motor_parseo.patron_tipos([TIPO_BUSCADO])
+        resultados = []
+        if not args.sin_original:
+            resultados.append(medir("Original (ijson + filtro dict)", bytes_totales, lambda: original(ruta)))
+        resultados.append(medir("Trozos sin prefiltro", bytes_totales,
+                                lambda: (total, contar_filtrados(motor_parseo.iterar_json(ruta))[1])))
+        resultados.append(medir("Trozos + prefiltro en bytes", bytes_totales,
+                                lambda: contar_filtrados(motor_parseo.iterar_json(ruta, patron))))
+
+        inicio = time.perf_counter()
+        indice = almacen_ndjson.convertir(ruta)
+        dur = time.perf_counter() - inicio
+        print(f"{'Conversión a NDJSON (una vez)':<34} {dur:8.2f}s   {bytes_totales / dur / 1024 / 1024:8.1f} MB/s"
+              f"   ({indice['bytes_comprimidos'] / 1024 / 1024:.1f} MB {indice['compresion']})")
+        resultados.append(medir("Partes NDJSON + prefiltro", bytes_totales,
+                                lambda: contar_filtrados(almacen_ndjson.iterar_registros_archivo(ruta, patron=patron))))
+
+        if len(set(resultados)) != 1:
+            print(f"\n❌ Los motores no coinciden: {resultados}")
+            sys.exit(1)
+        print(f"\n✅ Todos los motores devuelven los mismos {resultados[0]} registros")
+    finally:
+        if args.carpeta is None: shutil.rmtree(carpeta, ignore_errors=True)
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        try: sys.stdout.reconfigure(encoding="utf-8")
+        except: pass
+    main()
@@ -0,0 +1,228 @@
+"""
+Benchmark de spider_garantias.py contra una API de contratos falsa local.
+
+Compara el spider V2.0 (requests.get sin sesión, 5 hilos, lotes de 50 que esperan al más lento)
+con el motor de hilos actual (requests.Session compartida) y el motor async (un ClientSession
+keep-alive, lectura y escritura por lotes), este último con concurrencia fija y con control AIMD.
+El servidor simula el costo de abrir conexión (handshake TLS), la latencia de la API y una
+capacidad máxima: por encima de `--capacidad` peticiones simultáneas responde 429, como prod4.
+La DB se reemplaza por una lista en memoria con el mismo contrato que reclamar_pendientes / guardar_resultados
+(lo reclamado no se vuelve a entregar); una fila reparte la cola entre dos spiders a la vez y
+cuenta los contratos reclamados más de una vez. Las últimas usan cache_contratos.py en una carpeta
+temporal: primera pasada (fría), relectura (caliente) y con TTL 0 (revalida cada contrato con ETag -> 304).
+
+Uso:
+    python bench_spider.py --contratos 2000 --handshake-ms 120 --latencia-ms 150 --concurrencia 32 --capacidad 12
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+import requests
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import spider_garantias
+from control_ritmo import ControlRitmo
+from cache_contratos import CacheContratos
+
+BANCOS = ["BANCO DE CREDITO DEL PERU", "BBVA", "SCOTIABANK", "INTERBANK", "SECREX"]
+
+def respuesta_contrato(id_contrato: str) -> bytes:
+    rnd = random.Random(id_contrato)
+    data = {"listaGarantiaContrato": [{"entidadEmisora": rnd.choice(BANCOS)} for _ in range(rnd.randint(0, 3))]}
+    if rnd.random() < 0.3:
+        data["contratista"] = {"listaMiembrosConsorcio": [
+            {"nroDocumento": f"20{rnd.randint(100000000, 999999999)}", "nombreRazonSocial": f"EMPRESA {i}", "porcentajeParticipacion": 50}
+            for i in range(2)]}
+    return json.dumps(data).encode()
+
+class ServidorFalso(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+def crear_servidor(handshake_s: float, latencia_s: float, capacidad: int = 0):
+    estado = {"en_curso": 0, "rechazos": 0, "peticiones": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive real
+
+        def setup(self):
+            time.sleep(handshake_s)  # costo de conexión nueva
+            super().setup()
+
+        def do_GET(self):
+            with lock:
+                estado["peticiones"] += 1
+                saturado = capacidad and estado["en_curso"] >= capacidad
+                if saturado: estado["rechazos"] += 1
+                else: estado["en_curso"] += 1
+            if saturado:
+                self.send_response(429)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            try:
+                time.sleep(latencia_s)
+            finally:
+                with lock: estado["en_curso"] -= 1
+            id_contrato = self.path.rsplit("/", 1)[-1]
+            cuerpo = respuesta_contrato(id_contrato) if not id_contrato.startswith("x") else b""
+            etag = f'"{hashlib.md5(cuerpo).hexdigest()}"'
+            if cuerpo and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200 if cuerpo else 404)
+            if cuerpo: self.send_header("ETag", etag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ServidorFalso(("127.0.0.1", 0), Handler)
+    servidor.estado = estado
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+class DBFalsa:
+    """Pendientes ordenados por id_adjudicacion; leer_lote los reclama (lease sin vencimiento) y guardar los marca como procesados."""
+    def __init__(self, n: int):
+        # 2% de contratos inexistentes (404), como los CONTRATO_NO_ENCONTRADO_API reales
+        self.filas = [(f"adj-{i:07d}", f"x{i}" if i % 50 == 0 else str(1000000 + i), "CONSORCIO A" if i % 3 == 0 else "EMPRESA B")
+                      for i in range(n)]
+        self.resultados = {}
+        self.reclamos = Counter()
+        self.escrituras = 0
+        self._lock = threading.Lock()
+
+    def leer_lote(self, n: int):
+        with self._lock:
+            lote = [f for f in self.filas if f[0] not in self.resultados and f[0] not in self.reclamos][:n]
+            for f in lote: self.reclamos[f[0]] += 1
+            return lote
+
+    def guardar(self, resultados):
+        with self._lock:
+            self.escrituras += 1
+            for r in resultados: self.resultados[r["id_adj"]] = r["banco"]
+
+def original(db: DBFalsa, maximo: int):
+    """Réplica del bucle V2.0: lotes de 50, 5 hilos, requests.get suelto por contrato."""
+    def procesar(item):
+        id_adj, id_contrato, _ = item
+        try:
+            r = requests.get(spider_garantias.URL_API_CONTRATO.format(id_contrato), headers=spider_garantias.HEADERS, verify=False, timeout=15)
+            if r.status_code == 200:
+                garantias = r.json().get('listaGarantiaContrato') or []
+                emisores = {g['entidadEmisora'].strip().upper().replace("BANCO", "").strip() for g in garantias if g.get('entidadEmisora')}
+                return (" | ".join(sorted(emisores)) if emisores else "SIN_GARANTIA"), id_adj
+            return ("CONTRATO_NO_ENCONTRADO_API" if r.status_code == 404 else f"ERROR_API_{r.status_code}"), id_adj
+        except Exception:
+            return "ERROR_CONEXION", id_adj
+
+    total = 0
+    while total < maximo:
+        pendientes = [f for f in db.filas if f[0] not in db.resultados][:50]
+        if not pendientes: break
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            lote = [f.result() for f in as_completed([executor.submit(procesar, item) for item in pendientes])]
+        db.guardar([{"id_adj": id_adj, "banco": banco} for banco, id_adj in lote])
+        total += len(pendientes)
+
+def medir(nombre, n, servidor, funcion):
+    db = DBFalsa(n)
+    servidor.estado["rechazos"] = servidor.estado["peticiones"] = 0
+    inicio = time.perf_counter()
+    control = funcion(db)
+    dur = time.perf_counter() - inicio
+    errores = sum(1 for b in db.resultados.values() if b.startswith("ERROR"))
+    repetidos = sum(v - 1 for v in db.reclamos.values())
+    print(f"{nombre:<30} {dur:8.2f}s {len(db.resultados) / dur:8.1f} contratos/s {servidor.estado['peticiones']:6d} GET "
+          f"{servidor.estado['rechazos']:6d} 429 "
+          f"{errores:5d} errores" + (f"   límite final {control.limite:.1f}, {control.aperturas} pausas" if control else "")
+          + (f"   ❌ {repetidos} reclamados dos veces" if repetidos else ""))
+    if len(db.resultados) != n: print(f"   ❌ {n - len(db.resultados)} contratos sin procesar")
+    return db.resultados, errores + repetidos + (n - len(db.resultados))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contratos", type=int, default=1000)
+    parser.add_argument("--handshake-ms", type=float, default=120, help="Costo simulado de abrir conexión (TLS)")
+    parser.add_argument("--latencia-ms", type=float, default=150, help="Tiempo de respuesta simulado de la API")
+    parser.add_argument("--concurrencia", type=int, default=32, help="Concurrencia fija / máximo del control AIMD")
+    parser.add_argument("--capacidad", type=int, default=12, help="Peticiones simultáneas que acepta la API falsa (0 = sin límite)")
+    parser.add_argument("--sin-original", action="store_true", help="Omite el spider V2.0 (es el más lento)")
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.handshake_ms / 1000, args.latencia_ms / 1000, args.capacidad)
+    base = f"http://127.0.0.1:{servidor.server_address[1]}"
+    spider_garantias.URL_API_CONTRATO = base + "/api/bus/contrato/idContrato/{}"
+    spider_garantias.URL_DESCARGA_DOC = base + "/api/con/documentos/descargar/{}"
+    n = args.contratos
+    print(f"📦 {n} contratos | handshake {args.handshake_ms:.0f} ms | latencia {args.latencia_ms:.0f} ms | "
+          f"capacidad {args.capacidad or 'ilimitada'}\n")
+    spider_garantias.BACKOFF_BASE = 0.2
+
+    def con_control(motor, cache=None, **kw):
+        def correr(db):
+            control = ControlRitmo("bench", **kw)
+            if motor == "async":
+                asyncio.run(spider_garantias.enriquecer_async(db.leer_lote, db.guardar, control, cache=cache))
+            else:
+                spider_garantias.enriquecer_hilos(db.leer_lote, db.guardar, control, cache=cache)
+            return control
+        return correr
+
+    def dos_spiders(db):
+        # Dos procesos sobre la misma cola, cada uno con su control y la mitad del máximo
+        hilos = [threading.Thread(target=con_control("async", inicial=4, maximo=max(1, args.concurrencia // 2), pausa=2), args=(db,))
+                 for _ in range(2)]
+        for h in hilos: h.start()
+        for h in hilos: h.join()
+    fija = dict(inicial=args.concurrencia, minimo=args.concurrencia, maximo=args.concurrencia, umbral_fallas=10**9, tasa_error_breaker=2)
+    aimd = dict(inicial=4, maximo=args.concurrencia, pausa=2)
+
+    resultados = []
+    if not args.sin_original:
+        resultados.append(medir("V2.0 (5 hilos, sin sesión)", n, servidor, lambda db: original(db, n)))
+    resultados.append(medir(f"Hilos + Session AIMD (≤{args.concurrencia})", n, servidor, con_control("hilos", **aimd)))
+    if spider_garantias.aiohttp is not None:
+        resultados.append(medir(f"Async fijo ({args.concurrencia})", n, servidor, con_control("async", **fija)))
+        resultados.append(medir(f"Async AIMD (≤{args.concurrencia})", n, servidor, con_control("async", **aimd)))
+        resultados.append(medir(f"2 spiders AIMD (≤{max(1, args.concurrencia // 2)} c/u)", n, servidor, dos_spiders))
+        with tempfile.TemporaryDirectory() as carpeta:
+            cache = CacheContratos(os.path.join(carpeta, "cache"))
+            resultados.append(medir("Async AIMD + caché fría", n, servidor, con_control("async", cache, **aimd)))
+            resultados.append(medir("Async AIMD + caché caliente", n, servidor, con_control("async", cache, **aimd)))
+            cache.ttl = cache.ttl_no_encontrado = 0
+            resultados.append(medir("Async AIMD + caché vencida (304)", n, servidor, con_control("async", cache, **aimd)))
+            print(f"   {cache}")
+    else:
+        print("⚠️ aiohttp no está instalado: se omiten los motores async")
+    servidor.shutdown()
+
+    sin_errores = [r for r, errores in resultados if not errores]
+    if any(r != sin_errores[0] for r in sin_errores[1:]):
+        print("❌ Los motores no producen las mismas entidades financieras")
+        sys.exit(1)
+    print(f"\n✅ Mismo resultado en los {len(sin_errores)} motores sin errores")
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        try: sys.stdout.reconfigure(encoding="utf-8")
+        except: pass
+    main()
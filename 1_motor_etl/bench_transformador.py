@@ -0,0 +1,139 @@
+"""
+Micro-benchmark de la capa de transformación (registros OCDS ya parseados -> filas para la DB).
+
+Mide filas/s del bucle por registro que tenía cargador.procesar_archivo y de cada etapa de
+transformador.py (extraer, limpiar, seleccionar, derivar, armar), y comprueba que ambos producen
+exactamente las mismas cabeceras, adjudicaciones y huellas.
+
+Uso:
+    python bench_transformador.py --registros 200000 --lote 2000
+"""
+import sys
+import time
+import random
+import argparse
+from datetime import datetime
+
+import transformador
+import reglas_mapeo
+from transformador import safe_str, safe_float, huella_registro
+from bench_parseo import registro_sintetico, TIPO_BUSCADO
+
+def generar_registros(n: int, semilla: int = 1) -> list:
+    """Registros como los entrega motor_parseo, con contratos y algunos valores sucios (fechas inválidas, montos texto)."""
+    rnd = random.Random(semilla)
+    registros = []
+    for i in range(n):
+        r = registro_sintetico(rnd, i, TIPO_BUSCADO)
+        compiled = r["compiledRelease"]
+        compiled["date"] = f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T10:00:00-05:00"
+        compiled["contracts"] = [{"id": f"c-{aw['id']}", "awardID": aw["id"]} for aw in compiled["awards"] if rnd.random() < 0.7]
+        for aw in compiled["awards"]:
+            aw["date"] = rnd.choice([compiled["date"], "2024-02-30", None, ""])
+            if rnd.random() < 0.1: aw["value"]["amount"] = rnd.choice(["1500.50", "N/A", None, 7])
+        registros.append(r)
+    return registros
+
+def original(registros, nombre_archivo, reemplazados=frozenset()):
+    """El bucle por registro que usaba cargador antes de transformador.py."""
+    cabeceras, adjudicaciones, huellas = [], [], {}
+    for r in registros:
+        compiled = r.get('compiledRelease', {})
+        tender = compiled.get('tender', {})
+        tipo_proc = tender.get('procurementMethodDetails')
+        id_conv = safe_str(tender.get('id'), 100)
+        if not id_conv: continue
+        ocid = safe_str(r.get('ocid'), 100)
+        if ocid in reemplazados: continue
+        mapa_contratos = {}
+        for c in compiled.get('contracts', []):
+            aw_id = c.get('awardID')
+            c_id = c.get('id')
+            if aw_id and c_id:
+                mapa_contratos[str(aw_id)] = safe_str(c_id, 100)
+        titulo = safe_str(tender.get('title'), 4000)
+        desc = safe_str(tender.get('description'), 4000)
+        buyer = compiled.get('buyer', {})
+        comprador = safe_str(buyer.get('name'), 500)
+        monto = safe_float(tender.get('value', {}).get('amount'))
+        moneda = safe_str(tender.get('value', {}).get('currency', 'PEN'), 10)
+        fecha = _limpiar_fecha_sin_cache(compiled.get('date'))
+        d = reglas_mapeo.derivar(compiled)
+        cabecera = (
+            id_conv, ocid, titulo, desc, comprador, d['categoria'], tipo_proc,
+            monto, moneda, fecha, d['estado_proceso'], d['ubicacion_completa'],
+            d['departamento'], d['provincia'], d['distrito'], nombre_archivo
+        )
+        cabeceras.append(cabecera)
+        primera_adj = len(adjudicaciones)
+        for aw in compiled.get('awards', []):
+            id_adj_raw = aw.get('id')
+            id_adj = safe_str(id_adj_raw, 100)
+            if not id_adj: continue
+            id_contrato = mapa_contratos.get(str(id_adj_raw), None)
+            sups = aw.get('suppliers', [])
+            ganador = safe_str(sups[0].get('name') if sups else "DESCONOCIDO", 500)
+            ruc = safe_str(sups[0].get('id') if sups else None, 50)
+            m_adj = safe_float(aw.get('value', {}).get('amount'))
+            f_adj = _limpiar_fecha_sin_cache(aw.get('date'))
+            adjudicaciones.append((id_adj, id_contrato, id_conv, ganador, ruc, m_adj, f_adj, 'ADJUDICADO'))
+        if ocid: huellas[id_conv] = huella_registro(cabecera, adjudicaciones[primera_adj:])
+    return cabeceras, adjudicaciones, huellas
+
+def _limpiar_fecha_sin_cache(f):
+    """limpiar_fecha tal como era: strptime en cada llamada."""
+    if not f: return None
+    try:
+        f_clean = str(f)[:10]
+        datetime.strptime(f_clean, '%Y-%m-%d')
+        return f_clean
+    except ValueError: return None
+
+def medir(nombre, filas, funcion, repeticiones):
+    mejor, resultado = None, None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        dur = time.perf_counter() - inicio
+        mejor = dur if mejor is None else min(mejor, dur)
+    print(f"{nombre:<28} {mejor:8.3f}s   {filas / mejor:12.0f} reg/s")
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--registros", type=int, default=200000)
+    parser.add_argument("--lote", type=int, default=2000, help="Registros por lote (como LOTE_INICIAL del cargador)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se informa el mejor tiempo")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    registros = generar_registros(args.registros)
+    lotes = [registros[i:i + args.lote] for i in range(0, len(registros), args.lote)]
+    n = len(registros)
+    print(f"📦 {n} registros sintéticos en {len(lotes)} lotes de {args.lote} (generados en {time.perf_counter() - inicio:.1f}s)\n")
+
+    antes = medir("Original (por registro)", n, lambda: [original(l, "m.json") for l in lotes], args.repeticiones)
+
+    transformador._dia_valido.cache_clear()
+    medir("1. extraer", n, lambda: [transformador.extraer(l) for l in lotes], args.repeticiones)
+    # limpiar modifica las columnas en el lugar: cada repetición parte de una extracción nueva
+    limpias = medir("2. extraer + limpiar", n, lambda: [transformador.limpiar(transformador.extraer(l)) for l in lotes], args.repeticiones)
+    seleccion = medir("3. seleccionar", n, lambda: [transformador.seleccionar(c) for c in limpias], args.repeticiones)
+    derivados = medir("4. derivar (reglas_mapeo)", n,
+                      lambda: [transformador.derivar(c, e) for c, (e, _) in zip(limpias, seleccion)], args.repeticiones)
+    medir("5. armar + huellas", n,
+          lambda: [transformador.armar(c, e, d, "m.json") for c, (e, _), d in zip(limpias, seleccion, derivados)], args.repeticiones)
+    despues = medir("Total transformar_lote", n, lambda: [transformador.transformar_lote(l, "m.json")[:3] for l in lotes], args.repeticiones)
+
+    info = transformador._dia_valido.cache_info()
+    print(f"\n📅 Fechas: {info.hits} validaciones evitadas por la caché, {info.misses} días distintos")
+    if antes != despues:
+        print("❌ transformar_lote no produce las mismas filas que el bucle original")
+        sys.exit(1)
+    print(f"✅ Mismas filas: {sum(len(c) for c, _, _ in despues)} cabeceras, {sum(len(a) for _, a, _ in despues)} adjudicaciones")
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        try: sys.stdout.reconfigure(encoding="utf-8")
+        except: pass
+    main()
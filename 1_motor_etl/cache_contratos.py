@@ -0,0 +1,281 @@
+"""
+Caché en disco de las respuestas de la API de contratos de SEACE (prod4 .../contrato/idContrato/{id}).
+
+La leen y escriben spider_garantias.py y etl_consorcios_ai.py (los dos piden el mismo JSON por
+contrato), y cualquier script de investigación puede leerla sin tocar la API.
+
+- Cuerpos comprimidos (zstd, o gzip sin zstandard) y direccionados por contenido: el archivo es el
+  sha256 del JSON, así respuestas idénticas (p. ej. todos los 404) ocupan un solo archivo.
+- Índice SQLite (1_database/cache_contratos.db): id_contrato -> sha, status, hora de descarga y
+  validadores HTTP (ETag / Last-Modified) para revalidar con una petición condicional (304).
+- TTL: las respuestas 200 valen CACHE_CONTRATOS_TTL_DIAS (30 por defecto); los 404 un día, porque
+  el contrato puede publicarse después. 429/5xx nunca se guardan.
+- Quien guarda un 200 lo parsea antes (solo entran objetos JSON), y buscar_json descarta la
+  entrada si aun así no se puede leer, para que se vuelva a pedir.
+
+Re-derivar bancos/consorcios sin conexión: `for id_contrato, status, data in iterar(): ...` con
+spider_garantias.interpretar_contrato(data, nombre_ganador).
+
+Uso:
+    python cache_contratos.py resumen
+    python cache_contratos.py ver 1234567
+    python cache_contratos.py purgar            # entradas vencidas y archivos huérfanos
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(script_dir)
+CARPETA_CACHE = os.getenv("CACHE_CONTRATOS_DIR", os.path.join(parent_dir, "1_database", "cache_contratos"))
+
+TTL_DEFECTO = float(os.getenv("CACHE_CONTRATOS_TTL_DIAS", "30")) * 86400
+TTL_NO_ENCONTRADO = 86400
+CACHEABLES = (200, 404)
+GRACIA_PURGA = 3600  # segundos: purgar no toca objetos tocados hace menos (guardar de otro proceso en curso)
+EXTENSION = ".json.zst" if zstandard is not None else ".json.gz"
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS respuestas (
+    id_contrato    TEXT PRIMARY KEY,
+    status         INTEGER NOT NULL,
+    sha            TEXT NOT NULL,
+    archivo        TEXT NOT NULL,
+    bytes          INTEGER,
+    obtenido       REAL NOT NULL,
+    etag           TEXT,
+    last_modified  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_respuestas_sha ON respuestas (sha);
+"""
+
+# --- 1. CUERPOS COMPRIMIDOS ---
+def comprimir(cuerpo: bytes, extension: str) -> bytes:
+    if extension.endswith(".zst"): return zstandard.ZstdCompressor(level=9).compress(cuerpo)
+    return gzip.compress(cuerpo, compresslevel=6)
+
+def descomprimir(datos: bytes, archivo: str) -> bytes:
+    if archivo.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("El paquete 'zstandard' no está instalado (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(datos)
+    return gzip.decompress(datos)
+
+# --- 2. CACHÉ ---
+class CacheContratos:
+    """Segura entre hilos (una conexión SQLite por hilo) y entre procesos (WAL + escrituras atómicas)."""
+
+    def __init__(self, carpeta: Optional[str] = None, ttl: float = TTL_DEFECTO, ttl_no_encontrado: float = TTL_NO_ENCONTRADO):
+        self.carpeta = carpeta or CARPETA_CACHE
+        self.ttl, self.ttl_no_encontrado = ttl, ttl_no_encontrado
+        os.makedirs(os.path.join(self.carpeta, "objetos"), exist_ok=True)
+        self.ruta_indice = os.path.join(os.path.dirname(self.carpeta.rstrip(os.sep)) or ".",
+                                        os.path.basename(self.carpeta.rstrip(os.sep)) + ".db")
+        self._local = threading.local()
+        self.aciertos = self.fallos = self.revalidados = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta_indice, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ESQUEMA)
+            self._local.conn = conn
+        return conn
+
+    def _ruta(self, archivo: str) -> str:
+        return os.path.join(self.carpeta, "objetos", archivo[:2], archivo)
+
+    def buscar(self, id_contrato) -> Optional[Dict]:
+        """
+        Entrada guardada (status, cuerpo, validadores) o None. 'fresca' indica si sigue dentro del TTL;
+        una entrada vencida sirve para revalidar (encabezados_condicionales) o como respaldo sin red.
+        """
+        fila = self._conn().execute("SELECT * FROM respuestas WHERE id_contrato = ?", (str(id_contrato),)).fetchone()
+        if fila is None:
+            self.fallos += 1
+            return None
+        try:
+            with open(self._ruta(fila["archivo"]), "rb") as f:
+                cuerpo = descomprimir(f.read(), fila["archivo"])
+        except (OSError, RuntimeError, ValueError, EOFError):
+            self.fallos += 1
+            return None  # archivo borrado o corrupto: se vuelve a pedir
+        ttl = self.ttl if fila["status"] == 200 else self.ttl_no_encontrado
+        entrada = dict(fila)
+        entrada["cuerpo"] = cuerpo
+        entrada["fresca"] = time.time() - fila["obtenido"] < ttl
+        if entrada["fresca"]: self.aciertos += 1
+        else: self.fallos += 1
+        return entrada
+
+    def buscar_json(self, id_contrato) -> Optional[Dict]:
+        """Como buscar, con el JSON de un 200 ya parseado en 'data'; si no es un objeto JSON se descarta (None)."""
+        entrada = self.buscar(id_contrato)
+        if entrada is None: return None
+        entrada["data"] = None
+        if entrada["status"] == 200:
+            try:
+                entrada["data"] = json.loads(entrada["cuerpo"])
+            except ValueError:
+                entrada["data"] = None
+            if not isinstance(entrada["data"], dict):
+                self.descartar(id_contrato)
+                return None
+        return entrada
+
+    def guardar(self, id_contrato, status: int, cuerpo: bytes, headers=None):
+        """
+        Guarda una respuesta 200/404 (las demás se ignoran). Seguro de llamar desde varios hilos.
+        Un 200 solo debe guardarse después de parsearlo: aquí no se valida el cuerpo.
+        """
+        if status not in CACHEABLES: return
+        sha = hashlib.sha256(cuerpo).hexdigest()
+        archivo = sha + EXTENSION
+        ruta = self._ruta(archivo)
+        try:
+            os.utime(ruta)  # ya existe: se marca como recién usado para que purgar no lo borre ahora
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "wb") as f:
+                f.write(comprimir(cuerpo, archivo))
+            os.replace(temporal, ruta)
+        headers = headers or {}
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                INSERT INTO respuestas (id_contrato, status, sha, archivo, bytes, obtenido, etag, last_modified)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id_contrato) DO UPDATE SET status=excluded.status, sha=excluded.sha, archivo=excluded.archivo,
+                    bytes=excluded.bytes, obtenido=excluded.obtenido, etag=excluded.etag, last_modified=excluded.last_modified
+            """, (str(id_contrato), status, sha, archivo, len(cuerpo), time.time(),
+                  headers.get("ETag"), headers.get("Last-Modified")))
+
+    def renovar(self, id_contrato):
+        """Tras un 304: la entrada guardada vuelve a contar como fresca."""
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE respuestas SET obtenido = ? WHERE id_contrato = ?", (time.time(), str(id_contrato)))
+        self.revalidados += 1
+
+    def descartar(self, id_contrato):
+        """Quita la entrada del índice (el archivo lo borra purgar si ya no lo usa nadie)."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM respuestas WHERE id_contrato = ?", (str(id_contrato),))
+
+    def cerrar(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def __str__(self):
+        consultas = self.aciertos + self.fallos
+        return (f"caché de contratos: {self.aciertos}/{consultas} aciertos"
+                f"{f' ({self.aciertos / consultas:.0%})' if consultas else ''}, {self.revalidados} revalidados (304)")
+
+def encabezados_condicionales(entrada: Optional[Dict]) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since para revalidar una entrada vencida."""
+    if not entrada or entrada.get("fresca"): return {}
+    encabezados = {}
+    if entrada.get("etag"): encabezados["If-None-Match"] = entrada["etag"]
+    if entrada.get("last_modified"): encabezados["If-Modified-Since"] = entrada["last_modified"]
+    return encabezados
+
+def iterar(cache: Optional[CacheContratos] = None) -> Iterator[Tuple[str, int, Optional[Dict]]]:
+    """(id_contrato, status, JSON o None) de todo lo guardado, vencido o no. Sin red."""
+    cache = cache or CacheContratos(ttl=float("inf"), ttl_no_encontrado=float("inf"))
+    ids = [f["id_contrato"] for f in cache._conn().execute("SELECT id_contrato FROM respuestas ORDER BY id_contrato")]
+    for id_contrato in ids:
+        entrada = cache.buscar_json(id_contrato)
+        if entrada is None: continue
+        yield id_contrato, entrada["status"], entrada["data"]
+
+# --- 3. MANTENIMIENTO ---
+def resumen(cache: CacheContratos) -> Dict:
+    conn = cache._conn()
+    ahora = time.time()
+    fila = conn.execute("""
+        SELECT COUNT(*) AS entradas, COUNT(DISTINCT sha) AS objetos, COALESCE(SUM(bytes), 0) AS bytes_json,
+               SUM(status = 404) AS no_encontrados,
+               SUM(CASE WHEN status = 200 THEN obtenido < ? ELSE obtenido < ? END) AS vencidas
+        FROM respuestas
+    """, (ahora - cache.ttl, ahora - cache.ttl_no_encontrado)).fetchone()
+    en_disco = 0
+    for raiz, _, archivos in os.walk(os.path.join(cache.carpeta, "objetos")):
+        en_disco += sum(os.path.getsize(os.path.join(raiz, a)) for a in archivos)
+    return {**dict(fila), "bytes_disco": en_disco}
+
+def purgar(cache: CacheContratos) -> Tuple[int, int]:
+    """
+    Borra entradas vencidas y los archivos que ya no usa ninguna entrada. Se saltan los objetos y .tmp
+    tocados en las últimas GRACIA_PURGA: pueden ser de un guardar que otro proceso no terminó (un .tmp
+    más viejo es de un proceso que murió escribiendo).
+    """
+    conn = cache._conn()
+    ahora = time.time()
+    with conn:
+        borradas = conn.execute("DELETE FROM respuestas WHERE obtenido < CASE WHEN status = 200 THEN ? ELSE ? END",
+                                (ahora - cache.ttl, ahora - cache.ttl_no_encontrado)).rowcount
+    usados = {f["archivo"] for f in conn.execute("SELECT DISTINCT archivo FROM respuestas")}
+    huerfanos = 0
+    for raiz, _, archivos in os.walk(os.path.join(cache.carpeta, "objetos")):
+        for a in archivos:
+            ruta = os.path.join(raiz, a)
+            if a in usados: continue
+            try:
+                if ahora - os.path.getmtime(ruta) < GRACIA_PURGA: continue
+                os.remove(ruta)
+            except FileNotFoundError:
+                continue
+            huerfanos += 1
+    return borradas, huerfanos
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Caché de respuestas de la API de contratos de SEACE")
+    sub = parser.add_subparsers(dest="accion", required=True)
+    sub.add_parser("resumen")
+    ver = sub.add_parser("ver")
+    ver.add_argument("id_contrato")
+    sub.add_parser("purgar")
+    args = parser.parse_args()
+
+    cache = CacheContratos()
+    if args.accion == "resumen":
+        r = resumen(cache)
+        print(f"📦 {r['entradas']} contratos ({r['no_encontrados'] or 0} 404, {r['vencidas'] or 0} vencidos) en {r['objetos']} objetos")
+        print(f"💾 {r['bytes_json'] / 1024 / 1024:.1f} MB de JSON -> {r['bytes_disco'] / 1024 / 1024:.1f} MB en disco")
+    elif args.accion == "ver":
+        entrada = cache.buscar(args.id_contrato)
+        if entrada is None:
+            print(f"❌ {args.id_contrato} no está en la caché")
+            sys.exit(1)
+        edad = (time.time() - entrada["obtenido"]) / 3600
+        print(f"# status {entrada['status']}, hace {edad:.1f} h ({'fresca' if entrada['fresca'] else 'vencida'}), sha {entrada['sha'][:12]}")
+        if entrada["cuerpo"]: print(json.dumps(json.loads(entrada["cuerpo"]), ensure_ascii=False, indent=2))
+    else:
+        borradas, huerfanos = purgar(cache)
+        print(f"🧹 {borradas} entradas vencidas y {huerfanos} archivos huérfanos borrados")
+    cache.cerrar()
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        try: sys.stdout.reconfigure(encoding="utf-8")
+        except: pass
+    main()
@@ -0,0 +1,378 @@
+"""
+Caché columnar de los meses OCDS para los scripts de análisis (1_database/parquet/<tabla>/<mes>.parquet).
+
+Cada mes se aplana en cuatro tablas Parquet: licitaciones, adjudicaciones, contratos y partes.
+Un análisis lee solo las columnas que usa (segundos y pocos MB) en vez de hacer json.load
+del mes completo (minutos y varios GB de RAM).
+
+Se escribe de dos formas:
+- cargador.py --parquet: de paso, con los registros que ya parsea (solo los tipos que carga).
+- python cache_parquet.py [--meses ...] [--tipos ...]: todos los tipos, para los meses pendientes.
+Cada archivo guarda en sus metadatos el tamaño/fecha del mes de origen y los tipos incluidos;
+si OECE republica el mes, la caché deja de estar vigente y se regenera.
+
+Consulta desde los scripts:
+    import cache_parquet
+    df = cache_parquet.leer("adjudicaciones", columnas=["ocid", "monto", "proveedor_id"], meses=["2024-01_seace_v3"])
+    df = cache_parquet.consultar("SELECT categoria, COUNT(*) n FROM licitaciones GROUP BY 1")   # DuckDB
+
+Requiere pyarrow (escritura y leer) y duckdb (consultar); son opcionales para el resto del ETL.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import Dict, Iterable, List, Optional
+
+import motor_parseo
+import almacen_ndjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# --- CONFIGURACIÓN ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(script_dir)
+CARPETA_DATABASE = os.path.join(parent_dir, "1_database")
+CARPETA_PARQUET = os.path.join(CARPETA_DATABASE, "parquet")
+
+FILAS_POR_GRUPO = 50000  # filas por row group: acota la RAM del escritor y permite saltar grupos al filtrar
+COMPRESION = "zstd"
+TODOS_LOS_TIPOS = "*"
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+
+# Columnas de cada tabla (el orden es el de las tuplas que devuelve aplanar)
+COLUMNAS = {
+    "licitaciones": [
+        ("archivo", "str"), ("ocid", "str"), ("id_convocatoria", "str"), ("fecha", "str"),
+        ("tipo_procedimiento", "str"), ("categoria", "str"), ("estado_tender", "str"), ("estado_item", "str"),
+        ("titulo", "str"), ("descripcion", "str"), ("monto", "float"), ("moneda", "str"),
+        ("comprador_id", "str"), ("comprador_nombre", "str"), ("departamento", "str"), ("provincia", "str"),
+        ("distrito", "str"), ("n_items", "int"), ("n_adjudicaciones", "int"), ("n_contratos", "int"),
+    ],
+    "adjudicaciones": [
+        ("archivo", "str"), ("ocid", "str"), ("id_convocatoria", "str"), ("id_adjudicacion", "str"),
+        ("id_contrato", "str"), ("fecha", "str"), ("estado", "str"), ("monto", "float"), ("moneda", "str"),
+        ("proveedor_id", "str"), ("proveedor_nombre", "str"), ("n_proveedores", "int"),
+    ],
+    "contratos": [
+        ("archivo", "str"), ("ocid", "str"), ("id_convocatoria", "str"), ("id_contrato", "str"),
+        ("id_adjudicacion", "str"), ("titulo", "str"), ("fecha_firma", "str"), ("fecha_inicio", "str"),
+        ("fecha_fin", "str"), ("estado", "str"), ("monto", "float"), ("moneda", "str"),
+    ],
+    "partes": [
+        ("archivo", "str"), ("ocid", "str"), ("id_convocatoria", "str"), ("id_parte", "str"), ("nombre", "str"),
+        ("roles", "str"), ("departamento", "str"), ("provincia", "str"), ("distrito", "str"),
+    ],
+}
+TABLAS = tuple(COLUMNAS)
+
+def _esquema(tabla: str) -> "pa.Schema":
+    tipos = {"str": pa.string(), "float": pa.float64(), "int": pa.int32()}
+    return pa.schema([(nombre, tipos[tipo]) for nombre, tipo in COLUMNAS[tabla]])
+
+def disponible() -> bool:
+    return pa is not None
+
+def _requiere_pyarrow():
+    if pa is None:
+        raise RuntimeError("El paquete 'pyarrow' no está instalado (pip install pyarrow)")
+
+# --- 1. APLANADO ---
+def _texto(val) -> Optional[str]:
+    if val is None: return None
+    s = str(val).strip()
+    return s or None
+
+def _id(val) -> Optional[str]:
+    """Ids tal cual (sin strip): comprador y partes se emparejan por igualdad exacta, como en cargador."""
+    return None if val is None else str(val)
+
+def _numero(val) -> Optional[float]:
+    if val is None: return None
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+def aplanar(r: Dict, archivo: str) -> Dict[str, List[tuple]]:
+    """Filas de las cuatro tablas para un registro OCDS (valores crudos, sin traducir)."""
+    compiled = r.get("compiledRelease") or {}
+    tender = compiled.get("tender") or {}
+    ocid = _texto(r.get("ocid"))
+    id_conv = _texto(tender.get("id"))
+    clave = (archivo, ocid, id_conv)
+
+    buyer = compiled.get("buyer") or {}
+    parties = compiled.get("parties") or []
+    awards = compiled.get("awards") or []
+    contracts = compiled.get("contracts") or []
+    items = tender.get("items") or []
+
+    partes, ubic_comprador = [], None
+    for p in parties:
+        addr = p.get("address") or {}
+        ubic = (_texto(addr.get("department")), _texto(addr.get("region")), _texto(addr.get("locality")))
+        if ubic_comprador is None and p.get("id") == buyer.get("id"):  # la primera, como en cargador
+            ubic_comprador = ubic
+        partes.append(clave + (_id(p.get("id")), _texto(p.get("name")), ",".join(p.get("roles") or []) or None) + ubic)
+
+    contrato_de = {}
+    filas_contratos = []
+    for c in contracts:
+        if c.get("awardID") is not None and c.get("id") is not None:
+            contrato_de.setdefault(str(c["awardID"]), _texto(c["id"]))
+        valor = c.get("value") or {}
+        periodo = c.get("period") or {}
+        filas_contratos.append(clave + (
+            _texto(c.get("id")), _texto(c.get("awardID")), _texto(c.get("title")), _texto(c.get("dateSigned")),
+            _texto(periodo.get("startDate")), _texto(periodo.get("endDate")), _texto(c.get("status")),
+            _numero(valor.get("amount")), _texto(valor.get("currency")),
+        ))
+
+    filas_adj = []
+    for aw in awards:
+        valor = aw.get("value") or {}
+        sups = aw.get("suppliers") or []
+        filas_adj.append(clave + (
+            _texto(aw.get("id")), contrato_de.get(str(aw.get("id"))), _texto(aw.get("date")), _texto(aw.get("status")),
+            _numero(valor.get("amount")), _texto(valor.get("currency")),
+            _texto(sups[0].get("id")) if sups else None, _texto(sups[0].get("name")) if sups else None, len(sups),
+        ))
+
+    valor = tender.get("value") or {}
+    licitacion = clave + (
+        _texto(compiled.get("date")), _texto(tender.get("procurementMethodDetails")),
+        _texto(tender.get("mainProcurementCategory")), _texto(tender.get("status")),
+        _texto(items[0].get("statusDetails")) if items else None,
+        _texto(tender.get("title")), _texto(tender.get("description")),
+        _numero(valor.get("amount")), _texto(valor.get("currency")),
+        _id(buyer.get("id")), _texto(buyer.get("name")), *(ubic_comprador or (None, None, None)),
+        len(items), len(awards), len(contracts),
+    )
+    return {"licitaciones": [licitacion], "adjudicaciones": filas_adj, "contratos": filas_contratos, "partes": partes}
+
+# --- 2. VIGENCIA ---
+def ruta_tabla(tabla: str, nombre_base: str, carpeta: Optional[str] = None) -> str:
+    return os.path.join(carpeta or CARPETA_PARQUET, tabla, f"{nombre_base}.parquet")
+
+def firma_origen(ruta_json: str) -> Optional[Dict]:
+    """Tamaño y mtime del mes: del JSON si está en disco, si no el origen registrado en las partes NDJSON."""
+    if os.path.exists(ruta_json):
+        st = os.stat(ruta_json)
+        return {"bytes": st.st_size, "mtime": int(st.st_mtime)}
+    indice = almacen_ndjson.leer_indice(os.path.basename(ruta_json)[:-5], almacen_ndjson.raiz_de(ruta_json, None))
+    if indice:
+        return {"bytes": indice["origen"]["bytes"], "mtime": int(indice["origen"]["mtime"])}
+    return None
+
+def metadatos(tabla: str, nombre_base: str, carpeta: Optional[str] = None) -> Optional[Dict]:
+    """Metadatos de la caché de un mes (origen, tipos, filas) o None si no existe."""
+    _requiere_pyarrow()
+    ruta = ruta_tabla(tabla, nombre_base, carpeta)
+    if not os.path.exists(ruta): return None
+    try:
+        meta = pq.read_schema(ruta).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    crudo = meta.get(b"seace_cache")
+    return json.loads(crudo) if crudo else None
+
+def vigente(ruta_json: str, tipos: Optional[Iterable[str]] = None, carpeta: Optional[str] = None) -> bool:
+    """Las cuatro tablas existen, son de la versión actual del mes y cubren 'tipos' (None = todos)."""
+    origen = firma_origen(ruta_json)
+    if origen is None: return False
+    nombre_base = os.path.basename(ruta_json)[:-5]
+    for tabla in TABLAS:
+        meta = metadatos(tabla, nombre_base, carpeta)
+        if not meta or (meta["origen"]["bytes"], meta["origen"]["mtime"]) != (origen["bytes"], origen["mtime"]):
+            return False
+        if meta["tipos"] != TODOS_LOS_TIPOS and (tipos is None or not set(tipos) <= set(meta["tipos"])):
+            return False
+    return True
+
+# --- 3. ESCRITURA ---
+class EscritorParquet:
+    """
+    Acumula las filas aplanadas de un mes por columnas y las vuelca en row groups de FILAS_POR_GRUPO.
+    Escribe a <mes>.parquet.tmp y solo al cerrar() reemplaza la caché anterior.
+    """
+    def __init__(self, ruta_json: str, tipos: Optional[Iterable[str]] = None, carpeta: Optional[str] = None,
+                 filas_por_grupo: int = FILAS_POR_GRUPO):
+        _requiere_pyarrow()
+        self.nombre_base = os.path.basename(ruta_json)[:-5]
+        self.archivo = os.path.basename(ruta_json)
+        self.carpeta = carpeta
+        self.filas_por_grupo = filas_por_grupo
+        meta = {"origen": firma_origen(ruta_json) or {"bytes": None, "mtime": None},
+                "tipos": sorted(tipos) if tipos is not None else TODOS_LOS_TIPOS,
+                "creado": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        self._esquemas = {t: _esquema(t).with_metadata({b"seace_cache": json.dumps(meta).encode()}) for t in TABLAS}
+        self._pendientes = {t: [] for t in TABLAS}
+        self._escritores = {}
+        self.filas = {t: 0 for t in TABLAS}
+        self.registros = 0
+
+    def agregar(self, r: Dict):
+        for tabla, filas in aplanar(r, self.archivo).items():
+            if not filas: continue
+            pendientes = self._pendientes[tabla]
+            pendientes.extend(filas)
+            if len(pendientes) >= self.filas_por_grupo:
+                self._volcar(tabla)
+        self.registros += 1
+
+    def _volcar(self, tabla: str):
+        filas = self._pendientes[tabla]
+        esquema = self._esquemas[tabla]
+        columnas = list(zip(*filas)) if filas else [[] for _ in esquema.names]
+        lote = pa.Table.from_arrays([pa.array(col, type=campo.type) for col, campo in zip(columnas, esquema)], schema=esquema)
+        if tabla not in self._escritores:
+            ruta = ruta_tabla(tabla, self.nombre_base, self.carpeta)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            self._escritores[tabla] = pq.ParquetWriter(ruta + ".tmp", esquema, compression=COMPRESION)
+        self._escritores[tabla].write_table(lote)
+        self.filas[tabla] += len(filas)
+        self._pendientes[tabla] = []
+
+    def cerrar(self) -> Dict[str, int]:
+        """Vuelca lo pendiente y publica las cuatro tablas (también las vacías). Devuelve filas por tabla."""
+        for tabla in TABLAS:
+            if self._pendientes[tabla] or tabla not in self._escritores:
+                self._volcar(tabla)
+        for tabla, escritor in self._escritores.items():
+            escritor.close()
+            ruta = ruta_tabla(tabla, self.nombre_base, self.carpeta)
+            os.replace(ruta + ".tmp", ruta)
+        self._escritores = {}
+        return dict(self.filas)
+
+    def abortar(self):
+        """Descarta lo escrito; la caché anterior del mes (si había) queda intacta."""
+        for tabla, escritor in self._escritores.items():
+            try: escritor.close()
+            except Exception: pass
+            try: os.remove(ruta_tabla(tabla, self.nombre_base, self.carpeta) + ".tmp")
+            except OSError: pass
+        self._escritores = {}
+
+def construir(ruta_json: str, tipos: Optional[Iterable[str]] = None, carpeta: Optional[str] = None) -> Dict[str, int]:
+    """Regenera la caché de un mes leyendo partes NDJSON o el JSON (todos los tipos si tipos es None)."""
+    tipos = tuple(tipos) if tipos else None
+    patron = motor_parseo.patron_tipos(tipos) if tipos else None
+    escritor = EscritorParquet(ruta_json, tipos, carpeta)
+    try:
+        for r in almacen_ndjson.iterar_registros_archivo(ruta_json, patron=patron):
+            if not r: continue
+            if tipos and (r.get("compiledRelease") or {}).get("tender", {}).get("procurementMethodDetails") not in tipos:
+                continue
+            escritor.agregar(r)
+        return escritor.cerrar()
+    except BaseException:
+        escritor.abortar()
+        raise
+
+# --- 4. CONSULTA ---
+def meses_disponibles(tabla: str = "licitaciones", carpeta: Optional[str] = None) -> List[str]:
+    carpeta_tabla = os.path.join(carpeta or CARPETA_PARQUET, tabla)
+    if not os.path.isdir(carpeta_tabla): return []
+    return sorted(f[:-8] for f in os.listdir(carpeta_tabla) if f.endswith(".parquet"))
+
+def rutas(tabla: str, meses: Optional[Iterable[str]] = None, carpeta: Optional[str] = None) -> List[str]:
+    if tabla not in COLUMNAS: raise ValueError(f"Tabla desconocida: {tabla} (use {', '.join(TABLAS)})")
+    meses = meses_disponibles(tabla, carpeta) if meses is None else [m[:-5] if m.endswith(".json") else m for m in meses]
+    return [ruta_tabla(tabla, m, carpeta) for m in meses if os.path.exists(ruta_tabla(tabla, m, carpeta))]
+
+def filas_mes(tabla: str, nombre_base: str, columnas: Optional[List[str]] = None, carpeta: Optional[str] = None) -> List[Dict]:
+    """Filas de un mes como dicts, sin pandas (para procesos del ETL)."""
+    _requiere_pyarrow()
+    return pq.read_table(ruta_tabla(tabla, nombre_base, carpeta), columns=columnas).to_pylist()
+
+def leer(tabla: str, columnas: Optional[List[str]] = None, meses: Optional[Iterable[str]] = None,
+         filtros: Optional[List[tuple]] = None, carpeta: Optional[str] = None):
+    """
+    DataFrame de pandas con solo 'columnas' de los 'meses' pedidos.
+    filtros usa la sintaxis de pyarrow, p. ej. [("monto", ">", 1e6)]: se aplican al leer y se saltan row groups.
+    """
+    _requiere_pyarrow()
+    archivos = rutas(tabla, meses, carpeta)
+    if not archivos:
+        return _esquema(tabla).empty_table().select(columnas or _esquema(tabla).names).to_pandas()
+    return pq.read_table(archivos, columns=columnas, filters=filtros).to_pandas()
+
+def conectar_duckdb(meses: Optional[Iterable[str]] = None, carpeta: Optional[str] = None):
+    """Conexión DuckDB en memoria con una vista por tabla sobre los Parquet (sin copiar datos)."""
+    if duckdb is None:
+        raise RuntimeError("El paquete 'duckdb' no está instalado (pip install duckdb)")
+    meses = list(meses) if meses is not None else None
+    con = duckdb.connect()
+    for tabla in TABLAS:
+        archivos = rutas(tabla, meses, carpeta)
+        if not archivos: continue
+        lista = ", ".join("'" + a.replace("'", "''") + "'" for a in archivos)
+        con.execute(f"CREATE VIEW {tabla} AS SELECT * FROM read_parquet([{lista}])")
+    return con
+
+def consultar(sql: str, meses: Optional[Iterable[str]] = None, carpeta: Optional[str] = None):
+    """Ejecuta SQL sobre las vistas licitaciones/adjudicaciones/contratos/partes y devuelve un DataFrame."""
+    con = conectar_duckdb(meses, carpeta)
+    try:
+        return con.execute(sql).df()
+    finally:
+        con.close()
+
+# --- 5. CLI ---
+def main():
+    parser = argparse.ArgumentParser(description="Caché Parquet de los meses OCDS para análisis")
+    parser.add_argument("--meses", nargs="+", default=None, help="nombre_base a procesar (por defecto todos)")
+    parser.add_argument("--tipos", nargs="+", default=None, help="Solo estos procedimientos (por defecto todos)")
+    parser.add_argument("--forzar", action="store_true", help="Regenera aunque la caché esté vigente")
+    parser.add_argument("--sql", default=None, help="En vez de construir, ejecuta esta consulta DuckDB e imprime el resultado")
+    args = parser.parse_args()
+
+    if args.sql:
+        print(consultar(args.sql, args.meses).to_string())
+        return
+
+    _requiere_pyarrow()
+    if args.meses:
+        nombres = args.meses
+    else:
+        nombres = {f[:-5] for f in os.listdir(CARPETA_DATABASE) if f.endswith(".json") and not f.startswith("temp_")}
+        if os.path.isdir(almacen_ndjson.CARPETA_NDJSON):
+            nombres |= {d for d in os.listdir(almacen_ndjson.CARPETA_NDJSON) if almacen_ndjson.leer_indice(d)}
+        nombres = sorted(nombres)
+
+    logging.info(f"🚀 CACHÉ PARQUET ({len(nombres)} meses, tipos: {', '.join(args.tipos) if args.tipos else 'todos'})")
+    construidos = 0
+    for nombre_base in nombres:
+        ruta_json = os.path.join(CARPETA_DATABASE, f"{nombre_base}.json")
+        if not args.forzar and vigente(ruta_json, args.tipos):
+            logging.info(f"⏭️ {nombre_base} vigente.")
+            continue
+        inicio = time.time()
+        try:
+            filas = construir(ruta_json, args.tipos)
+        except Exception as e:
+            logging.error(f"❌ Parquet {nombre_base}: {e}")
+            continue
+        construidos += 1
+        logging.info(f"🧊 {nombre_base}: " + " | ".join(f"{n} {t}" for t, n in filas.items()) + f" en {time.time() - inicio:.1f}s")
+    logging.info(f"🏁 {construidos} meses en caché.")
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        try: sys.stdout.reconfigure(encoding="utf-8")
+        except: pass
+    main()
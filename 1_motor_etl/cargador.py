@@ -3,12 +3,28 @@ from mysql.connector import Error
 import sys
 import os
 import time
+import json
+import hashlib
 import logging
-import ijson 
-from datetime import datetime
-from itertools import chain
+import argparse
+import queue
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from dotenv import load_dotenv
 from decimal import Decimal
+import sqlite3
+
+import manifiesto
+import almacen_ndjson
+import motor_parseo
+import indice_ocid
+import cache_parquet
+import reglas_mapeo
+import transformador
+import validador
 
 # --- CONFIGURACIÓN ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -27,207 +43,377 @@ DB_CONFIG = {
 }
 
 CARPETA_ENTRADA = os.path.join(parent_dir, "1_database")
+RUTA_MANIFIESTO = os.path.join(CARPETA_ENTRADA, "manifiesto.db")
 
-TRADUCTOR_CATEGORIA = {
-    'goods': 'BIENES', 'works': 'OBRAS', 'services': 'SERVICIOS', 'consultingServices': 'CONSULTORIA'
-}
+# Procedimientos que se cargan (CARGADOR_TIPOS o --tipos, separados por coma; "*" = todos).
+# El resto se descarta en bytes, sin parsear el registro
+TODOS_LOS_TIPOS = "*"
+TIPO_DEFECTO = 'Licitación Pública'
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
-if sys.platform.startswith('win'):
-    try: sys.stdout.reconfigure(encoding='utf-8')
-    except: pass
+def leer_tipos(valores):
+    """Tupla de tipos desde texto con comas o lista; None = todos los procedimientos."""
+    if isinstance(valores, str): valores = [valores]
+    tipos = tuple(sorted({t.strip() for v in valores for t in v.split(",") if t.strip()}))
+    if not tipos or TODOS_LOS_TIPOS in tipos: return None
+    return tipos
 
-# --- UTILIDADES BLINDADAS ---
-def safe_str(val, max_len=None):
-    if val is None: return ""
-    s = str(val).strip()
-    if max_len and len(s) > max_len: return s[:max_len]
-    return s
+def clave_tipos(tipos):
+    """Texto con que control_cargas recuerda qué tipos se cargaron de un mes."""
+    return TODOS_LOS_TIPOS if tipos is None else "|".join(sorted(tipos))
 
-def safe_float(val):
-    if val is None: return 0.0
-    try:
-        return float(val)
-    except:
-        return 0.0
+def cubre_tipos(clave, tipos):
+    """¿Una carga con 'clave' incluye todos los 'tipos' pedidos? Las filas previas sin clave son de Licitación Pública."""
+    cargados = set((clave or TIPO_DEFECTO).split("|"))
+    if TODOS_LOS_TIPOS in cargados: return True
+    return tipos is not None and set(tipos) <= cargados
 
-def limpiar_fecha(f):
-    """
-    Recorta la fecha a YYYY-MM-DD.
-    """
-    if not f: return None
-    try:
-        # Cortamos estrictamente a los primeros 10 caracteres (YYYY-MM-DD)
-        f_clean = str(f)[:10]
-        # Validamos formato
-        datetime.strptime(f_clean, '%Y-%m-%d')
-        return f_clean
-    except ValueError: return None
-
-def determinar_estado(tender_status, item_status):
-    st_item = safe_str(item_status)
-    if st_item: return st_item.upper()
-    
-    st = safe_str(tender_status).lower()
-    if not st: return "DESCONOCIDO"
+@lru_cache(maxsize=16)
+def patron_de(tipos):
+    return motor_parseo.patron_tipos(tipos) if tipos is not None else None
+
+TIPOS_PROCEDIMIENTO = leer_tipos(os.getenv("CARGADOR_TIPOS", TIPO_DEFECTO))
+PATRON_TIPOS = patron_de(TIPOS_PROCEDIMIENTO)
+
+# Procesos de carga en paralelo (un archivo por proceso, cada uno con su conexión)
+WORKERS_DEFECTO = int(os.getenv("CARGADOR_WORKERS", "1"))
+
+# Deadlock / lock wait timeout: con varios workers dos meses pueden tocar la misma convocatoria
+ERRORES_REINTENTABLES = (1205, 1213)
+REINTENTOS_LOTE = 3
+
+# Pipeline parser -> escritor dentro de cada archivo
+LOTE_INICIAL = 2000
+LOTE_MIN, LOTE_MAX = 500, 20000
+SEGUNDOS_OBJETIVO_LOTE = 1.0   # el tamaño de lote se ajusta para que cada escritura tome ~1s
+LOTES_EN_COLA = 4              # backpressure: el parser se bloquea si el escritor va 4 lotes atrás
+
+# Modo masivo: lotes -> TSV -> LOAD DATA LOCAL INFILE a tablas staging de la sesión,
+# y un solo upsert por conjuntos por archivo al final
+BULK_DEFECTO = os.getenv("CARGADOR_BULK", "0") == "1"
+
+# Caché Parquet para análisis (cache_parquet.py), escrita de paso con los registros ya parseados
+PARQUET_DEFECTO = os.getenv("CARGADOR_PARQUET", "0") == "1"
 
-    mapping = {'active': 'CONVOCADO', 'complete': 'CONTRATADO', 'cancelled': 'CANCELADO', 'unsuccessful': 'DESIERTO', 'withdrawn': 'NULO', 'planned': 'PROGRAMADO', 'awarded': 'ADJUDICADO'}
-    return mapping.get(st, st.upper())
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+if sys.platform.startswith('win'):
+    try: sys.stdout.reconfigure(encoding='utf-8')
+    except: pass
 
-def traducir_categoria(cat_ingles):
-    cat_safe = safe_str(cat_ingles)
-    return TRADUCTOR_CATEGORIA.get(cat_safe, cat_safe.upper() if cat_safe else "OTROS")
+# --- UTILIDADES BLINDADAS (transformador.py) ---
+from transformador import safe_str
 
 # --- DB ---
-def obtener_conexion():
+def obtener_conexion(bulk=False):
+    config = {**DB_CONFIG, 'allow_local_infile': True} if bulk else DB_CONFIG
     intentos = 3
     while intentos > 0:
-        try: return mysql.connector.connect(**DB_CONFIG)
+        try: return mysql.connector.connect(**config)
         except Error: time.sleep(2); intentos -= 1
     raise Exception("❌ Sin conexión a DB")
 
-def insertar_lote_seguro(cursor, sql, datos, tipo="Registro"):
-    if not datos: return 0
+def _insertar_biseccion(cursor, sql, datos, rechazos):
+    # Un INSERT multi-fila fallido no deja nada a medias (rollback de la sentencia),
+    # así que se puede partir en mitades: k filas malas cuestan ~2k·log2(n) viajes en vez de n
     try:
         cursor.executemany(sql, datos)
         return len(datos)
     except Error as e:
-        logging.warning(f"⚠️ Fallo en lote {tipo} ({e}). Modo Fila-por-Fila.")
-        c = 0
-        for fila in datos:
-            try: cursor.execute(sql, fila); c += 1
-            except Error: pass 
-        return c
+        if e.errno in ERRORES_REINTENTABLES: raise  # la transacción ya se revirtió: reintenta _guardar
+        if len(datos) == 1:
+            rechazos.append((datos[0], e))
+            return 0
+        mitad = len(datos) // 2
+        return _insertar_biseccion(cursor, sql, datos[:mitad], rechazos) + _insertar_biseccion(cursor, sql, datos[mitad:], rechazos)
+
+def insertar_lote_seguro(cursor, sql, datos, tipo="Registro", rechazos=None):
+    """Inserta el lote; si falla, aísla las filas malas por bisección y las agrega a 'rechazos' como (fila, error)."""
+    if not datos: return 0
+    malas = []
+    c = _insertar_biseccion(cursor, sql, datos, malas)
+    if malas:
+        logging.warning(f"⚠️ Lote {tipo}: {len(malas)} de {len(datos)} filas rechazadas ({malas[0][1]}).")
+        if rechazos is not None: rechazos.extend(malas)
+    return c
+
+# --- PIPELINE: ESCRITOR EN SEGUNDO PLANO ---
+class EscritorLotes(threading.Thread):
+    """
+    Consume lotes (cabeceras, adjudicaciones, huellas, cuarentena) de una cola acotada y los guarda con _guardar,
+    mientras el hilo principal sigue parseando. Es el único hilo que usa la conexión.
+    """
+    def __init__(self, conn, cursor, nombre_archivo, guardar=None, forzar=False):
+        super().__init__(name=f"escritor-{nombre_archivo}", daemon=True)
+        self.conn, self.cursor, self.nombre_archivo = conn, cursor, nombre_archivo
+        self.guardar = guardar or _guardar
+        self.forzar = forzar           # ignora las huellas guardadas y reescribe todo
+        self.cola = queue.Queue(maxsize=LOTES_EN_COLA)
+        self.error = None
+        self.guardados = 0
+        self.conteo = {"nuevos": 0, "actualizados": 0, "sin_cambios": 0}
+        self.cuarentena = 0            # registros inválidos que no se cargaron
+        self.avisos = 0                # registros cargados con advertencias
+        self.lotes = 0
+        self.seg_por_fila = None       # media móvil del costo de escritura por cabecera
+        self.t_escritura = 0.0         # escritor ocupado en MySQL
+        self.t_ocioso = 0.0            # escritor esperando al parser
+        self.t_bloqueo_parser = 0.0    # parser esperando por cola llena (backpressure)
+
+    def run(self):
+        while True:
+            t = time.perf_counter()
+            lote = self.cola.get()
+            self.t_ocioso += time.perf_counter() - t
+            if lote is None: return
+            if self.error: continue  # tras un error solo se vacía la cola
+
+            cabeceras, adjudicaciones, huellas, cuarentena = lote
+            t = time.perf_counter()
+            try:
+                if cuarentena:
+                    guardar_cuarentena(self.cursor, self.nombre_archivo, cuarentena)
+                    self.conn.commit()
+                    self.cuarentena += sum(1 for f in cuarentena if f[0] == "ERROR")
+                    self.avisos += sum(1 for f in cuarentena if f[0] == "AVISO")
+                if not cabeceras: continue
+                cab, adj, filas_huella, conteo = filtrar_sin_cambios(
+                    self.cursor, cabeceras, adjudicaciones, huellas, self.nombre_archivo, self.forzar)
+                if cab or adj:
+                    self.guardar(self.cursor, self.conn, cab, adj, self.nombre_archivo, filas_huella)
+            except Exception as e:
+                self.error = e
+                continue
+            dur = time.perf_counter() - t
+            self.t_escritura += dur
+            self.guardados += len(cabeceras)
+            for k, v in conteo.items(): self.conteo[k] += v
+            self.lotes += 1
+            muestra = dur / len(cabeceras)
+            self.seg_por_fila = muestra if self.seg_por_fila is None else 0.7 * self.seg_por_fila + 0.3 * muestra
+
+    def enviar(self, cabeceras, adjudicaciones, huellas, cuarentena=()):
+        if self.error: raise self.error
+        t = time.perf_counter()
+        self.cola.put((cabeceras, adjudicaciones, huellas, cuarentena))
+        self.t_bloqueo_parser += time.perf_counter() - t
+
+    def tamano_lote(self, actual):
+        if not self.seg_por_fila: return actual
+        return int(min(LOTE_MAX, max(LOTE_MIN, SEGUNDOS_OBJETIVO_LOTE / self.seg_por_fila)))
+
+    def cerrar(self):
+        if self.is_alive():
+            self.cola.put(None)
+            self.join()
 
 # --- MOTOR ETL ---
-def procesar_archivo(ruta_archivo, conn, nombre_archivo):
+def procesar_archivo(ruta_archivo, conn, nombre_archivo, bulk=False, forzar=False, reemplazados=frozenset(), parquet=False,
+                     tipos=TIPOS_PROCEDIMIENTO):
+    """
+    Carga un mes. Devuelve {registros, nuevos, actualizados, sin_cambios} de los procedimientos 'tipos' (None = todos),
+    más 'error' si la carga no terminó (el mes no debe registrarse como EXITO: ver registrar_fallo).
+    'reemplazados' son los ocid cuya versión más nueva está en otro mes (indice_ocid): no se escriben.
+    Con 'parquet' también escribe la caché columnar del mes si no está vigente (incluye los reemplazados).
+    """
     cursor = conn.cursor()
-    cursor.execute("SET FOREIGN_KEY_CHECKS=0") 
+    if not bulk: cursor.execute("SET FOREIGN_KEY_CHECKS=0")  # en modo masivo los checks se apagan solo durante la fusión
+    # Al recargar el archivo sus filas malas vuelven a detectarse: se descartan los rechazos anteriores
+    cursor.execute("DELETE FROM cargas_rechazadas WHERE nombre_archivo = %s AND reprocesado = 0", (nombre_archivo,))
+    cursor.execute("DELETE FROM registros_cuarentena WHERE nombre_archivo = %s", (nombre_archivo,))
+    conn.commit()
     
-    contador = 0
-    cabeceras = []
-    adjudicaciones = []
+    crudos = []
+    cuarentena = []
+    lote = LOTE_INICIAL
+    t_fusion = 0.0
+    fusionado = False
+    n_reemplazados = 0
+    error = None
     
     logging.info(f"📂 Procesando: {nombre_archivo}")
     
+    escritor = EscritorLotes(conn, cursor, nombre_archivo, guardar=_cargar_staging if bulk else _guardar, forzar=forzar)
+    escritor.start()
+    cache = None
+    if parquet and not cache_parquet.vigente(ruta_archivo, tipos):
+        cache = cache_parquet.EscritorParquet(ruta_archivo, tipos)
+    inicio = time.perf_counter()
     try:
-        with open(ruta_archivo, 'rb') as f:
-            try:
-                parser = ijson.items(f, 'records.item', use_float=True)
-                primer = next(parser, None)
-                if primer is None: 
-                    f.seek(0)
-                    parser = ijson.items(f, 'item', use_float=True)
-                else: 
-                    parser = chain([primer], parser)
-            except: return 0
-
-            for r in parser:
-                if not r: continue
-                
-                compiled = r.get('compiledRelease', {})
-                tender = compiled.get('tender', {})
-                
-                # 1. FILTRO: SOLO LICITACIÓN PÚBLICA
-                tipo_proc = tender.get('procurementMethodDetails')
-                if tipo_proc != 'Licitación Pública': continue 
-                
-                id_conv = safe_str(tender.get('id'), 100)
-                if not id_conv: continue
-                
-                # 2. MAPEO DE CONTRATOS
-                mapa_contratos = {}
-                for c in compiled.get('contracts', []):
-                    aw_id = c.get('awardID')
-                    c_id = c.get('id')
-                    if aw_id and c_id:
-                        mapa_contratos[str(aw_id)] = safe_str(c_id, 100)
-
-                # 3. CABECERA
-                ocid = safe_str(r.get('ocid'), 100)
-                titulo = safe_str(tender.get('title'), 4000)
-                desc = safe_str(tender.get('description'), 4000)
-                buyer = compiled.get('buyer', {})
-                comprador = safe_str(buyer.get('name'), 500)
-                cat = traducir_categoria(tender.get('mainProcurementCategory'))
-                monto = safe_float(tender.get('value', {}).get('amount'))
-                moneda = safe_str(tender.get('value', {}).get('currency', 'PEN'), 10)
-                
-                # --- CORRECCIÓN CRÍTICA: FECHA ---
-                # Usamos compiled.get('date') porque r.get('date') viene vacío
-                fecha_raw = compiled.get('date') 
-                fecha = limpiar_fecha(fecha_raw)
-                
-                items = tender.get('items', [])
-                estado = determinar_estado(tender.get('status'), items[0].get('statusDetails') if items else None)
-                
-                # Ubicación
-                parties = compiled.get('parties', [])
-                ubic_full, dep, prov, dist = "PERU", None, None, None
-                for p in parties:
-                    if p.get('id') == buyer.get('id'):
-                        addr = p.get('address', {})
-                        dep = safe_str(addr.get('department'), 100)
-                        prov = safe_str(addr.get('region'), 100)
-                        dist = safe_str(addr.get('locality'), 100)
-                        partes = [x for x in [dep, prov, dist] if x]
-                        if partes: ubic_full = " / ".join(partes)
-                        break
-
-                cabeceras.append((
-                    id_conv, ocid, titulo, desc, comprador, cat, tipo_proc, 
-                    monto, moneda, fecha, estado, ubic_full, dep, prov, dist, nombre_archivo
-                ))
-                
-                # 4. ADJUDICACIONES
-                for aw in compiled.get('awards', []):
-                    id_adj_raw = aw.get('id')
-                    id_adj = safe_str(id_adj_raw, 100)
-                    if not id_adj: continue
-                    
-                    id_contrato = mapa_contratos.get(str(id_adj_raw), None)
-                    sups = aw.get('suppliers', [])
-                    ganador = safe_str(sups[0].get('name') if sups else "DESCONOCIDO", 500)
-                    ruc = safe_str(sups[0].get('id') if sups else None, 50)
-                    m_adj = safe_float(aw.get('value', {}).get('amount'))
-                    f_adj = limpiar_fecha(aw.get('date'))
-                    
-                    adjudicaciones.append((
-                        id_adj, id_contrato, id_conv, ganador, ruc, m_adj, f_adj, 'ADJUDICADO'
-                    ))
-
-                if len(cabeceras) >= 2000:
-                    _guardar(cursor, conn, cabeceras, adjudicaciones)
-                    contador += len(cabeceras)
-                    cabeceras, adjudicaciones = [], []
-
-            if cabeceras:
-                _guardar(cursor, conn, cabeceras, adjudicaciones)
-                contador += len(cabeceras)
+        if bulk: preparar_staging(cursor)
+        # Partes NDJSON comprimidas si están vigentes; si no, el JSON original (motor_parseo)
+        parser = almacen_ndjson.iterar_registros_archivo(ruta_archivo, patron=patron_de(tipos))
+        for r in parser:
+            if not r: continue
+            
+            # 1. FILTRO: SOLO LOS PROCEDIMIENTOS PEDIDOS (Licitación Pública por defecto)
+            if tipos is not None and validador.tipo_procedimiento(r) not in tipos: continue 
+
+            # 2. VALIDACIÓN: un registro malformado va a cuarentena y el resto del mes sigue
+            errores, avisos = validador.validar(r)
+            if errores or avisos:
+                cuarentena.append(fila_cuarentena(r, errores, avisos))
+            if errores: continue
+            if cache: cache.agregar(r)
+            crudos.append(r)
+
+            # 3. TRANSFORMACIÓN POR LOTES: limpieza por columnas, reglas y huellas (transformador.py)
+            if len(crudos) >= lote:
+                cabeceras, adjudicaciones, huellas, omitidos = transformador.transformar_lote(crudos, nombre_archivo, reemplazados)
+                n_reemplazados += omitidos
+                if cabeceras or cuarentena: escritor.enviar(cabeceras, adjudicaciones, huellas, cuarentena)
+                crudos, cuarentena = [], []
+                lote = escritor.tamano_lote(lote)
+
+        if crudos or cuarentena:
+            cabeceras, adjudicaciones, huellas, omitidos = transformador.transformar_lote(crudos, nombre_archivo, reemplazados)
+            n_reemplazados += omitidos
+            if cabeceras or cuarentena: escritor.enviar(cabeceras, adjudicaciones, huellas, cuarentena)
+        if cache:
+            filas_cache = cache.cerrar()
+            logging.info(f"   🧊 {nombre_archivo}: caché Parquet " + " | ".join(f"{n} {t}" for t, n in filas_cache.items()))
+        t_parseo = time.perf_counter() - inicio - escritor.t_bloqueo_parser
+        escritor.cerrar()
+        if escritor.error: raise escritor.error
+        if bulk:
+            t = time.perf_counter()
+            fusionar_staging(cursor, conn, nombre_archivo)
+            t_fusion = time.perf_counter() - t
+            fusionado = True
+
+        logging.info(f"   ⏱️ {nombre_archivo}: parseo {t_parseo:.1f}s | escritura {escritor.t_escritura:.1f}s | "
+                     f"escritor ocioso {escritor.t_ocioso:.1f}s | parser bloqueado {escritor.t_bloqueo_parser:.1f}s | "
+                     f"{escritor.lotes} lotes, último de {lote}" + (f" | fusión {t_fusion:.1f}s" if bulk else ""))
+        logging.info(f"   🧮 {nombre_archivo}: {escritor.conteo['nuevos']} nuevos | {escritor.conteo['actualizados']} actualizados | "
+                     f"{escritor.conteo['sin_cambios']} sin cambios | {n_reemplazados} con versión más nueva en otro mes")
+        if escritor.cuarentena or escritor.avisos:
+            logging.warning(f"   🚧 {nombre_archivo}: {escritor.cuarentena} registros en cuarentena (no cargados) | "
+                            f"{escritor.avisos} cargados con avisos (ver registros_cuarentena)")
 
     except Exception as e:
+        error = e
+        escritor.cerrar()
+        if cache: cache.abortar()
         logging.error(f"❌ Error en {nombre_archivo}: {e}")
         conn.rollback()
     finally:
-        try: cursor.execute("SET FOREIGN_KEY_CHECKS=1"); cursor.close()
+        escritor.cerrar()
+        try:
+            if not bulk: cursor.execute("SET FOREIGN_KEY_CHECKS=1")
+            cursor.close()
         except: pass
     
-    return contador
+    # En modo masivo nada llega a las tablas finales si la fusión no terminó. Si falló MySQL (staging,
+    # LOAD DATA o fusión) se recarga el mes con la escritura por lotes, que aísla las filas malas por
+    # bisección y las deja en cargas_rechazadas; un error de lectura del mes fallaría igual otra vez
+    if bulk and not fusionado and isinstance(error, Error):
+        logging.warning(f"↩️ {nombre_archivo}: la carga masiva no terminó. Se reintenta con la escritura por lotes.")
+        return procesar_archivo(ruta_archivo, conn, nombre_archivo, False, forzar, reemplazados, parquet, tipos)
+    resumen = {"registros": escritor.guardados, **escritor.conteo}
+    if error is not None: resumen["error"] = str(error) or type(error).__name__
+    return resumen
+
+# --- DETECCIÓN DE CAMBIOS POR REGISTRO ---
+DDL_HUELLAS = """
+    CREATE TABLE IF NOT EXISTS huellas_registros (
+        ocid VARCHAR(100) PRIMARY KEY,
+        huella CHAR(32) NOT NULL,
+        archivo_origen VARCHAR(100),
+        actualizado DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+DDL_VERSIONES_REGLAS = """
+    CREATE TABLE IF NOT EXISTS versiones_reglas (
+        nombre_archivo VARCHAR(255) NOT NULL,
+        regla VARCHAR(50) NOT NULL,
+        version INT NOT NULL,
+        aplicado DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (nombre_archivo, regla)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+def filtrar_sin_cambios(cursor, cabeceras, adjudicaciones, huellas, nombre_archivo, forzar=False):
+    """
+    Quita del lote los registros que no hace falta escribir:
+    - misma huella ya cargada desde este mismo archivo, o
+    - el ocid ya pertenece a un mes más nuevo (el upsert no cambiaría nada salvo last_update).
+    Solo cuentan las huellas cuya fila sigue en Licitaciones_Cabecera: si las tablas se vaciaron sin
+    vaciar huellas_registros, el registro vuelve a escribirse como nuevo.
+    Devuelve (cabeceras, adjudicaciones, filas para huellas_registros, conteo).
+    """
+    guardadas = {}
+    ocids = sorted({c[1] for c in cabeceras if c[0] in huellas})
+    if ocids:
+        marcas = ", ".join(["%s"] * len(ocids))
+        cursor.execute(f"""
+            SELECT h.ocid, h.huella, h.archivo_origen FROM huellas_registros h
+            JOIN Licitaciones_Cabecera c ON c.ocid = h.ocid
+            WHERE h.ocid IN ({marcas})
+        """, ocids)
+        guardadas = {ocid: (huella, archivo) for ocid, huella, archivo in cursor.fetchall()}
+
+    conteo = {"nuevos": 0, "actualizados": 0, "sin_cambios": 0}
+    cab, omitidas, filas_huella = [], set(), []
+    for c in cabeceras:
+        huella = huellas.get(c[0])
+        previa = guardadas.get(c[1])
+        if previa is None:
+            conteo["nuevos"] += 1
+        elif not forzar and previa[1] and (previa[1] > nombre_archivo or (previa[1] == nombre_archivo and previa[0] == huella)):
+            conteo["sin_cambios"] += 1
+            omitidas.add(c[0])
+            continue
+        else:
+            conteo["actualizados"] += 1
+        cab.append(c)
+        if huella: filas_huella.append((c[1], huella, nombre_archivo))
+    adj = [a for a in adjudicaciones if a[2] not in omitidas] if omitidas else adjudicaciones
+    return cab, adj, filas_huella, conteo
+
+SQL_HUELLAS = """
+    INSERT INTO huellas_registros (ocid, huella, archivo_origen) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        huella=IF(archivo_origen IS NULL OR VALUES(archivo_origen) >= archivo_origen, VALUES(huella), huella),
+        archivo_origen=IF(archivo_origen IS NULL OR VALUES(archivo_origen) >= archivo_origen, VALUES(archivo_origen), archivo_origen)
+"""
 
-def _guardar(cursor, conn, cabeceras, adjudicaciones):
-    sql_cab = """
+def _huellas_aceptadas(filas_huella, rechazos_cab, rechazos_adj, ocid_de):
+    """Un registro con alguna fila en la dead-letter no guarda huella: así se reintenta en la próxima carga."""
+    if not rechazos_cab and not rechazos_adj: return filas_huella
+    malos = {f[1] for f, _ in rechazos_cab} | {ocid_de.get(f[2]) for f, _ in rechazos_adj}
+    return [h for h in filas_huella if h[0] not in malos]
+
+# Una convocatoria que aparece en varios meses queda con los datos del mes más reciente,
+# sin importar el orden en que terminen los workers (los nombres YYYY-MM_* ordenan por fecha).
+# archivo_origen se actualiza al final: MySQL evalúa las asignaciones de izquierda a derecha.
+MES_MAS_RECIENTE = "(archivo_origen IS NULL OR VALUES(archivo_origen) >= archivo_origen)"
+
+def _convocatorias_de_meses_posteriores(cursor, ids_convocatoria, nombre_archivo):
+    """Convocatorias que ya pertenecen a un mes más nuevo: sus adjudicaciones no se pisan."""
+    if not ids_convocatoria: return set()
+    marcas = ", ".join(["%s"] * len(ids_convocatoria))
+    cursor.execute(
+        f"SELECT id_convocatoria FROM Licitaciones_Cabecera WHERE archivo_origen > %s AND id_convocatoria IN ({marcas})",
+        (nombre_archivo, *ids_convocatoria)
+    )
+    return {fila[0] for fila in cursor.fetchall()}
+
+SQL_CABECERA = f"""
     INSERT INTO Licitaciones_Cabecera 
     (id_convocatoria, ocid, nomenclatura, descripcion, comprador, categoria, tipo_procedimiento, 
      monto_estimado, moneda, fecha_publicacion, estado_proceso, 
      ubicacion_completa, departamento, provincia, distrito, archivo_origen)
     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     ON DUPLICATE KEY UPDATE 
-        categoria=VALUES(categoria), tipo_procedimiento=VALUES(tipo_procedimiento),
-        departamento=VALUES(departamento), provincia=VALUES(provincia), distrito=VALUES(distrito),
-        fecha_publicacion=VALUES(fecha_publicacion),
-        last_update=NOW();
+        categoria=IF({MES_MAS_RECIENTE}, VALUES(categoria), categoria),
+        tipo_procedimiento=IF({MES_MAS_RECIENTE}, VALUES(tipo_procedimiento), tipo_procedimiento),
+        departamento=IF({MES_MAS_RECIENTE}, VALUES(departamento), departamento),
+        provincia=IF({MES_MAS_RECIENTE}, VALUES(provincia), provincia),
+        distrito=IF({MES_MAS_RECIENTE}, VALUES(distrito), distrito),
+        fecha_publicacion=IF({MES_MAS_RECIENTE}, VALUES(fecha_publicacion), fecha_publicacion),
+        last_update=NOW(),
+        archivo_origen=IF({MES_MAS_RECIENTE}, VALUES(archivo_origen), archivo_origen);
     """
-    sql_adj = """
+SQL_ADJUDICACION = """
     INSERT INTO Licitaciones_Adjudicaciones
     (id_adjudicacion, id_contrato, id_convocatoria, ganador_nombre, ganador_ruc, monto_adjudicado, fecha_adjudicacion, estado_item)
     VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
@@ -236,53 +422,552 @@ def _guardar(cursor, conn, cabeceras, adjudicaciones):
         fecha_adjudicacion=VALUES(fecha_adjudicacion),
         ganador_nombre=VALUES(ganador_nombre);
     """
-    insertar_lote_seguro(cursor, sql_cab, cabeceras, "Cabeceras")
-    if adjudicaciones:
-        insertar_lote_seguro(cursor, sql_adj, adjudicaciones, "Adjudicaciones")
+SQL_LOTE = {"Licitaciones_Cabecera": SQL_CABECERA, "Licitaciones_Adjudicaciones": SQL_ADJUDICACION}
+
+def _guardar(cursor, conn, cabeceras, adjudicaciones, nombre_archivo, filas_huella=()):
+    # Orden fijo de claves: dos workers bloquean filas en el mismo orden y se reducen los deadlocks
+    cabeceras.sort(key=lambda c: c[0])
+    adjudicaciones.sort(key=lambda a: a[0])
+    ocid_de = {c[0]: c[1] for c in cabeceras}
+    for intento in range(1, REINTENTOS_LOTE + 1):
+        try:
+            rechazos = []
+            insertar_lote_seguro(cursor, SQL_CABECERA, cabeceras, "Cabeceras", rechazos)
+            rechazos_cab, rechazos = rechazos, []
+            if adjudicaciones:
+                posteriores = _convocatorias_de_meses_posteriores(cursor, sorted({a[2] for a in adjudicaciones}), nombre_archivo)
+                lote_adj = [a for a in adjudicaciones if a[2] not in posteriores]
+                insertar_lote_seguro(cursor, SQL_ADJUDICACION, lote_adj, "Adjudicaciones", rechazos)
+            # En la misma transacción: si hay que reintentar por deadlock, se recalculan
+            guardar_rechazos(cursor, nombre_archivo, "Licitaciones_Cabecera", rechazos_cab, ocid_de)
+            guardar_rechazos(cursor, nombre_archivo, "Licitaciones_Adjudicaciones", rechazos, ocid_de)
+            filas = _huellas_aceptadas(filas_huella, rechazos_cab, rechazos, ocid_de)
+            if filas: cursor.executemany(SQL_HUELLAS, filas)
+            conn.commit()
+            return
+        except Error as e:
+            if e.errno not in ERRORES_REINTENTABLES or intento == REINTENTOS_LOTE: raise
+            conn.rollback()
+            logging.warning(f"🔁 {nombre_archivo}: bloqueo en lote ({e.msg}). Reintento {intento}/{REINTENTOS_LOTE - 1}")
+            time.sleep(0.5 * intento)
+
+# --- MODO MASIVO: LOAD DATA + STAGING ---
+COLUMNAS_CABECERA = (
+    "id_convocatoria", "ocid", "nomenclatura", "descripcion", "comprador", "categoria", "tipo_procedimiento",
+    "monto_estimado", "moneda", "fecha_publicacion", "estado_proceso",
+    "ubicacion_completa", "departamento", "provincia", "distrito", "archivo_origen",
+)
+COLUMNAS_ADJUDICACION = (
+    "id_adjudicacion", "id_contrato", "id_convocatoria", "ganador_nombre", "ganador_ruc",
+    "monto_adjudicado", "fecha_adjudicacion", "estado_item",
+)
+
+# Tablas TEMPORARY: son de la sesión, no chocan entre workers y desaparecen al cerrar la conexión.
+# 'fila' conserva el orden de llegada para que, a igual clave, gane la última como en el modo por lotes.
+DDL_STAGING = (
+    """
+    CREATE TEMPORARY TABLE IF NOT EXISTS stg_cabecera (
+        fila INT AUTO_INCREMENT PRIMARY KEY,
+        id_convocatoria VARCHAR(100), ocid VARCHAR(100), nomenclatura VARCHAR(4000), descripcion TEXT,
+        comprador VARCHAR(500), categoria VARCHAR(50), tipo_procedimiento VARCHAR(100),
+        monto_estimado DECIMAL(15,2), moneda VARCHAR(10), fecha_publicacion DATE, estado_proceso VARCHAR(50),
+        ubicacion_completa VARCHAR(500), departamento VARCHAR(100), provincia VARCHAR(100), distrito VARCHAR(100),
+        archivo_origen VARCHAR(100)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+    """
+    CREATE TEMPORARY TABLE IF NOT EXISTS stg_adjudicacion (
+        fila INT AUTO_INCREMENT PRIMARY KEY,
+        id_adjudicacion VARCHAR(100), id_contrato VARCHAR(100), id_convocatoria VARCHAR(100),
+        ganador_nombre VARCHAR(500), ganador_ruc VARCHAR(50), monto_adjudicado DECIMAL(15,2),
+        fecha_adjudicacion DATE, estado_item VARCHAR(50)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+    """
+    CREATE TEMPORARY TABLE IF NOT EXISTS stg_huella (
+        fila INT AUTO_INCREMENT PRIMARY KEY,
+        ocid VARCHAR(100), huella CHAR(32), archivo_origen VARCHAR(100)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+)
+
+_ESCAPES_TSV = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+def _campo_tsv(v):
+    if v is None: return "\\N"
+    if isinstance(v, float): return repr(v)
+    return str(v).translate(_ESCAPES_TSV)
+
+def escribir_tsv(filas, ruta):
+    """Formato por defecto de LOAD DATA: tabs, saltos de línea, escapes con \\ y NULL como \\N."""
+    with open(ruta, "w", encoding="utf-8", newline="\n") as f:
+        for fila in filas:
+            f.write("\t".join(_campo_tsv(v) for v in fila))
+            f.write("\n")
+
+def local_infile_habilitado(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT @@GLOBAL.local_infile")
+        return bool(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+
+def preparar_staging(cursor):
+    for ddl in DDL_STAGING: cursor.execute(ddl)
+    cursor.execute("TRUNCATE TABLE stg_cabecera")
+    cursor.execute("TRUNCATE TABLE stg_adjudicacion")
+    cursor.execute("TRUNCATE TABLE stg_huella")
+
+def _load_data(cursor, tabla, columnas, filas):
+    if not filas: return
+    fd, ruta = tempfile.mkstemp(prefix=f"{tabla}_", suffix=".tsv")
+    os.close(fd)
+    try:
+        escribir_tsv(filas, ruta)
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {tabla} CHARACTER SET utf8mb4 ({', '.join(columnas)})",
+            (ruta.replace("\\", "/"),)
+        )
+    finally:
+        os.remove(ruta)
+
+def _cargar_staging(cursor, conn, cabeceras, adjudicaciones, nombre_archivo, filas_huella=()):
+    """Mismo contrato que _guardar, pero el lote solo llega a las tablas staging de la sesión."""
+    _load_data(cursor, "stg_cabecera", COLUMNAS_CABECERA, cabeceras)
+    _load_data(cursor, "stg_adjudicacion", COLUMNAS_ADJUDICACION, adjudicaciones)
+    _load_data(cursor, "stg_huella", ("ocid", "huella", "archivo_origen"), filas_huella)
+    conn.commit()
+
+def _sql_fusion_cabecera():
+    # En INSERT ... SELECT las columnas sin calificar serían ambiguas con las de stg_cabecera
+    t = "Licitaciones_Cabecera"
+    cond = f"({t}.archivo_origen IS NULL OR VALUES(archivo_origen) >= {t}.archivo_origen)"  # MES_MAS_RECIENTE
+    actualizables = ("categoria", "tipo_procedimiento", "departamento", "provincia", "distrito", "fecha_publicacion")
+    sets = ",\n        ".join(f"{c}=IF({cond}, VALUES({c}), {t}.{c})" for c in actualizables)
+    return f"""
+    INSERT INTO {t} ({', '.join(COLUMNAS_CABECERA)})
+    SELECT {', '.join(COLUMNAS_CABECERA)} FROM stg_cabecera ORDER BY id_convocatoria, fila
+    ON DUPLICATE KEY UPDATE
+        {sets},
+        last_update=NOW(),
+        archivo_origen=IF({cond}, VALUES(archivo_origen), {t}.archivo_origen)
+    """
+
+SQL_FUSION_ADJUDICACION = f"""
+    INSERT INTO Licitaciones_Adjudicaciones ({', '.join(COLUMNAS_ADJUDICACION)})
+    SELECT {', '.join('s.' + c for c in COLUMNAS_ADJUDICACION)}
+    FROM stg_adjudicacion s
+    LEFT JOIN Licitaciones_Cabecera c ON c.id_convocatoria = s.id_convocatoria AND c.archivo_origen > %s
+    WHERE c.id_convocatoria IS NULL
+    ORDER BY s.id_adjudicacion, s.fila
+    ON DUPLICATE KEY UPDATE
+        id_contrato=VALUES(id_contrato),
+        fecha_adjudicacion=VALUES(fecha_adjudicacion),
+        ganador_nombre=VALUES(ganador_nombre)
+"""
+
+SQL_FUSION_HUELLAS = """
+    INSERT INTO huellas_registros (ocid, huella, archivo_origen)
+    SELECT ocid, huella, archivo_origen FROM stg_huella ORDER BY ocid, fila
+    ON DUPLICATE KEY UPDATE
+        huella=IF(huellas_registros.archivo_origen IS NULL OR VALUES(archivo_origen) >= huellas_registros.archivo_origen,
+                  VALUES(huella), huellas_registros.huella),
+        archivo_origen=IF(huellas_registros.archivo_origen IS NULL OR VALUES(archivo_origen) >= huellas_registros.archivo_origen,
+                          VALUES(archivo_origen), huellas_registros.archivo_origen)
+"""
+
+def fusionar_staging(cursor, conn, nombre_archivo):
+    """
+    Un upsert por conjuntos por tabla y por archivo, con la misma regla de 'mes más reciente' que _guardar.
+    foreign_key_checks se apaga solo durante la fusión y se restaura aunque falle; unique_checks queda
+    encendido porque el staging puede traer ocids repetidos que el índice UNIQUE debe rechazar.
+    """
+    sql_cab = _sql_fusion_cabecera()
+    for intento in range(1, REINTENTOS_LOTE + 1):
+        try:
+            cursor.execute("SET SESSION foreign_key_checks=0")
+            try:
+                cursor.execute(sql_cab)
+                cursor.execute(SQL_FUSION_ADJUDICACION, (nombre_archivo,))
+                cursor.execute(SQL_FUSION_HUELLAS)
+                conn.commit()
+            finally:
+                cursor.execute("SET SESSION foreign_key_checks=1")
+            return
+        except Error as e:
+            if e.errno not in ERRORES_REINTENTABLES or intento == REINTENTOS_LOTE: raise
+            conn.rollback()
+            logging.warning(f"🔁 {nombre_archivo}: bloqueo en fusión ({e.msg}). Reintento {intento}/{REINTENTOS_LOTE - 1}")
+            time.sleep(0.5 * intento)
+
+# --- DEAD-LETTER: FILAS RECHAZADAS ---
+DDL_RECHAZOS = """
+    CREATE TABLE IF NOT EXISTS cargas_rechazadas (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        nombre_archivo VARCHAR(255) NOT NULL,
+        tabla VARCHAR(64) NOT NULL,
+        id_registro VARCHAR(100),
+        ocid VARCHAR(100),
+        errno INT,
+        error TEXT,
+        fila LONGTEXT,
+        fecha DATETIME DEFAULT CURRENT_TIMESTAMP,
+        reprocesado TINYINT(1) DEFAULT 0,
+        INDEX idx_rechazo_archivo (nombre_archivo, reprocesado)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+# Registros que no pasan validador.py: ERROR no se cargan (con el JSON original), AVISO se cargan anotados
+DDL_CUARENTENA = """
+    CREATE TABLE IF NOT EXISTS registros_cuarentena (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        nombre_archivo VARCHAR(255) NOT NULL,
+        nivel VARCHAR(10) NOT NULL,
+        ocid VARCHAR(100),
+        id_convocatoria VARCHAR(100),
+        motivos TEXT,
+        registro LONGTEXT,
+        fecha DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_cuarentena_archivo (nombre_archivo, nivel),
+        INDEX idx_cuarentena_ocid (ocid)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+def fila_cuarentena(registro, errores, avisos):
+    """(nivel, ocid, id_convocatoria, motivos, registro). El JSON solo se guarda si el registro no se carga."""
+    ocid, id_conv = validador.identificadores(registro)
+    if errores:
+        return ("ERROR", ocid, id_conv, json.dumps(errores + avisos, ensure_ascii=False), validador.serializar(registro))
+    return ("AVISO", ocid, id_conv, json.dumps(avisos, ensure_ascii=False), None)
+
+def guardar_cuarentena(cursor, nombre_archivo, filas):
+    cursor.executemany("""
+        INSERT INTO registros_cuarentena (nombre_archivo, nivel, ocid, id_convocatoria, motivos, registro)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, [(nombre_archivo, *f) for f in filas])
+
+def guardar_rechazos(cursor, nombre_archivo, tabla, rechazos, ocid_de):
+    """La fila va como JSON (lista en el orden de columnas del INSERT) para poder reprocesarla tal cual."""
+    if not rechazos: return
+    ocid_col = 1 if tabla == "Licitaciones_Cabecera" else None
+    datos = []
+    for fila, e in rechazos:
+        ocid = fila[ocid_col] if ocid_col is not None else ocid_de.get(fila[2])
+        datos.append((nombre_archivo, tabla, safe_str(fila[0], 100), safe_str(ocid, 100) or None,
+                      getattr(e, "errno", None), safe_str(e, 2000), json.dumps(list(fila), default=str, ensure_ascii=False)))
+    cursor.executemany("""
+        INSERT INTO cargas_rechazadas (nombre_archivo, tabla, id_registro, ocid, errno, error, fila)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, datos)
+
+def reprocesar_rechazos(conn, nombre_archivo=None):
+    """
+    Reintenta las filas pendientes de la dead-letter (tras corregir el esquema o los datos).
+    Las que entran se marcan reprocesado=1; las que siguen fallando se quedan con el error nuevo.
+    """
+    cursor = conn.cursor()
+    filtro, params = ("AND nombre_archivo = %s", (nombre_archivo,)) if nombre_archivo else ("", ())
+    cursor.execute(f"SELECT id, nombre_archivo, tabla, fila FROM cargas_rechazadas WHERE reprocesado = 0 {filtro} ORDER BY id", params)
+    pendientes = cursor.fetchall()
+    ok = 0
+    for id_rechazo, archivo, tabla, fila in pendientes:
+        fila = json.loads(fila)
+        try:
+            # Igual que en _guardar: no se pisa una adjudicación cuya convocatoria ya es de un mes más nuevo
+            if tabla != "Licitaciones_Adjudicaciones" or not _convocatorias_de_meses_posteriores(cursor, [fila[2]], archivo):
+                cursor.execute(SQL_LOTE[tabla], fila)
+            cursor.execute("UPDATE cargas_rechazadas SET reprocesado = 1 WHERE id = %s", (id_rechazo,))
+            ok += 1
+        except Error as e:
+            conn.rollback()
+            cursor.execute("UPDATE cargas_rechazadas SET errno = %s, error = %s, fecha = NOW() WHERE id = %s",
+                           (e.errno, safe_str(e, 2000), id_rechazo))
+        conn.commit()
+    for archivo in sorted({p[1] for p in pendientes}):
+        cursor.execute("""
+            UPDATE control_cargas SET registros_rechazados =
+                (SELECT COUNT(*) FROM cargas_rechazadas WHERE nombre_archivo = %s AND reprocesado = 0)
+            WHERE nombre_archivo = %s
+        """, (archivo, archivo))
+    conn.commit()
+    cursor.close()
+    logging.info(f"♻️ Rechazos reprocesados: {ok} de {len(pendientes)}")
+    return ok
+
+def listar_archivos_entrada():
+    """
+    Meses de la carpeta (JSON o partes NDJSON, sin temp_*.json). El manifiesto del descargador solo
+    quita meses: los que marca con SHA rechazado. Los que no conoce (otros años, archivos copiados a
+    mano o bajados antes del manifiesto) se cargan igual.
+    """
+    archivos = {f for f in os.listdir(CARPETA_ENTRADA) if f.endswith('.json') and not f.startswith('temp_')}
+    # Meses cuyo JSON se borró tras convertirlo a partes NDJSON
+    if os.path.isdir(almacen_ndjson.CARPETA_NDJSON):
+        archivos |= {f"{d}.json" for d in os.listdir(almacen_ndjson.CARPETA_NDJSON) if almacen_ndjson.leer_indice(d)}
+    try:
+        archivos -= {f"{n}.json" for n in manifiesto.rechazados(RUTA_MANIFIESTO)}
+    except sqlite3.Error as e:
+        logging.warning(f"⚠️ Manifiesto no disponible ({e}). Se carga todo lo que hay en la carpeta.")
+    return sorted(archivos)
+
+# Con todos los procedimientos cargados, los dashboards filtran por tipo (Licitación Pública por defecto):
+# índices que empiezan por tipo_procedimiento y cubren el monto que suman
+INDICES_TIPO = [
+    ("idx_tipo_fecha", "tipo_procedimiento, fecha_publicacion, monto_estimado"),
+    ("idx_tipo_estado", "tipo_procedimiento, estado_proceso"),
+    ("idx_tipo_categoria", "tipo_procedimiento, categoria, monto_estimado"),
+    ("idx_tipo_departamento", "tipo_procedimiento, departamento, monto_estimado"),
+]
+
+def preparar_tablas_control(conn):
+    with conn.cursor() as c:
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS control_cargas (
+                nombre_archivo VARCHAR(255) PRIMARY KEY,
+                estado VARCHAR(50), fecha_fin DATETIME, registros_procesados INT DEFAULT 0,
+                registros_rechazados INT DEFAULT 0, registros_cuarentena INT DEFAULT 0,
+                registros_nuevos INT DEFAULT 0, registros_actualizados INT DEFAULT 0, registros_sin_cambios INT DEFAULT 0,
+                bytes_archivo BIGINT NULL, checksum_archivo VARCHAR(160) NULL, tipos_cargados VARCHAR(1000) NULL
+            )
+        """)
+        nuevas = [(col, "INT DEFAULT 0") for col in ("registros_rechazados", "registros_cuarentena", "registros_nuevos", "registros_actualizados", "registros_sin_cambios")]
+        nuevas += [("bytes_archivo", "BIGINT NULL"), ("checksum_archivo", "VARCHAR(160) NULL"), ("tipos_cargados", "VARCHAR(1000) NULL")]
+        for columna, tipo in nuevas:
+            try: c.execute(f"ALTER TABLE control_cargas ADD COLUMN {columna} {tipo}")
+            except Error: pass  # ya existe
+        c.execute(DDL_RECHAZOS)
+        c.execute(DDL_CUARENTENA)
+        c.execute(DDL_HUELLAS)
+        c.execute(DDL_VERSIONES_REGLAS)
+        # rederivar.py actualiza por mes de origen
+        try: c.execute("ALTER TABLE Licitaciones_Cabecera ADD INDEX idx_archivo_origen (archivo_origen)")
+        except Error: pass  # ya existe
+        for indice, columnas in INDICES_TIPO:
+            try: c.execute(f"ALTER TABLE Licitaciones_Cabecera ADD INDEX {indice} ({columnas})")
+            except Error: pass  # ya existe
     conn.commit()
 
+def registrar_carga(conn, archivo, resumen, firma=(None, None), tipos=TIPOS_PROCEDIMIENTO):
+    """'firma' es (bytes, checksum) del archivo tal como estaba al empezar la carga (ver firma_archivo)."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO control_cargas (nombre_archivo, estado, fecha_fin, registros_procesados, registros_rechazados,
+                                    registros_cuarentena, registros_nuevos, registros_actualizados, registros_sin_cambios,
+                                    bytes_archivo, checksum_archivo, tipos_cargados) 
+        VALUES (%s, 'EXITO', NOW(), %s,
+                (SELECT COUNT(*) FROM cargas_rechazadas WHERE nombre_archivo = %s AND reprocesado = 0),
+                (SELECT COUNT(*) FROM registros_cuarentena WHERE nombre_archivo = %s AND nivel = 'ERROR'),
+                %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE estado='EXITO', fecha_fin=NOW(), registros_procesados=VALUES(registros_procesados),
+                                registros_rechazados=VALUES(registros_rechazados),
+                                registros_cuarentena=VALUES(registros_cuarentena),
+                                registros_nuevos=VALUES(registros_nuevos),
+                                registros_actualizados=VALUES(registros_actualizados),
+                                registros_sin_cambios=VALUES(registros_sin_cambios),
+                                bytes_archivo=VALUES(bytes_archivo),
+                                checksum_archivo=VALUES(checksum_archivo),
+                                tipos_cargados=VALUES(tipos_cargados)
+    """, (archivo, resumen["registros"], archivo, archivo, resumen["nuevos"], resumen["actualizados"], resumen["sin_cambios"], *firma,
+          clave_tipos(tipos)))
+    registrar_versiones_reglas(cursor, archivo)
+    conn.commit()
+    cursor.close()
+
+def registrar_fallo(conn, archivo, error):
+    """
+    Mes que no terminó de cargarse: queda en ERROR y sin firma ni tipos, así archivos_pendientes lo
+    vuelve a tomar en la próxima ejecución (lo que sí se escribió sale sin cambios por huella).
+    """
+    if not conn.is_connected(): conn.reconnect(attempts=3, delay=5)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO control_cargas (nombre_archivo, estado, fecha_fin, bytes_archivo, checksum_archivo, tipos_cargados)
+        VALUES (%s, 'ERROR', NOW(), NULL, NULL, NULL)
+        ON DUPLICATE KEY UPDATE estado='ERROR', fecha_fin=NOW(), bytes_archivo=NULL, checksum_archivo=NULL, tipos_cargados=NULL
+    """, (archivo,))
+    conn.commit()
+    cursor.close()
+    logging.error(f"❌ {archivo}: carga incompleta ({error}). Queda en ERROR y se reintenta en la próxima ejecución.")
+
+def registrar_versiones_reglas(cursor, archivo, reglas=None):
+    """Versión de cada regla de reglas_mapeo con la que quedaron derivadas las filas del mes."""
+    versiones = reglas_mapeo.versiones()
+    cursor.executemany("""
+        INSERT INTO versiones_reglas (nombre_archivo, regla, version) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE version=VALUES(version), aplicado=NOW()
+    """, [(archivo, r, versiones[r]) for r in (reglas if reglas is not None else versiones)])
+
+def _sha256_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def firma_archivo(archivo):
+    """
+    (bytes, checksum) del mes. Normalmente sale gratis del manifiesto: el descargador calcula el digest
+    del JSON al vuelo. Solo si el manifiesto no corresponde al archivo en disco se hace un sha256 local.
+    """
+    nombre_base = archivo[:-5]
+    try:
+        meta = manifiesto.leer(nombre_base, RUTA_MANIFIESTO) if os.path.exists(RUTA_MANIFIESTO) else {}
+    except sqlite3.Error:
+        meta = {}
+    ruta = os.path.join(CARPETA_ENTRADA, archivo)
+    if os.path.exists(ruta):
+        tam = os.path.getsize(ruta)
+    else:
+        indice = almacen_ndjson.leer_indice(nombre_base)
+        if not indice: return None, None
+        tam = indice["origen"]["bytes"]
+    if meta.get("digest_json") and meta.get("bytes_json") == tam:
+        return tam, f"{meta.get('algoritmo') or 'sha256'}:{meta['digest_json']}"
+    if os.path.exists(ruta):
+        return tam, f"sha256:{_sha256_archivo(ruta)}"
+    # Solo quedan las partes NDJSON y el manifiesto no sirve: el origen registrado en el índice
+    return tam, f"origen:{indice['origen'].get('bytes')}:{indice['origen'].get('mtime')}"
+
+def archivos_pendientes(conn, archivos, tipos=TIPOS_PROCEDIMIENTO):
+    """
+    Archivos nunca cargados con éxito, más los que OECE republicó: distinto tamaño o checksum
+    que en la última carga. Las filas antiguas sin firma se adoptan con la firma actual.
+    También los cargados con menos procedimientos que 'tipos' (las filas que ya estaban salen sin cambios por huella).
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT nombre_archivo, bytes_archivo, checksum_archivo, tipos_cargados FROM control_cargas WHERE estado = 'EXITO'")
+    exitosos = {fila[0]: (fila[1], fila[2], fila[3]) for fila in cursor.fetchall()}
+    pendientes, adoptados = [], []
+    for archivo in archivos:
+        if archivo not in exitosos:
+            pendientes.append(archivo)
+            continue
+        bytes_previos, checksum_previo, tipos_previos = exitosos[archivo]
+        if not cubre_tipos(tipos_previos, tipos):
+            logging.info(f"➕ {archivo}: cargado solo con {tipos_previos or TIPO_DEFECTO}. Se recarga con {clave_tipos(tipos)}.")
+            pendientes.append(archivo)
+            continue
+        if checksum_previo is None:
+            adoptados.append((*firma_archivo(archivo), archivo))
+            logging.info(f"⏭️ {archivo} OMITIDO.")
+            continue
+        bytes_actuales, checksum_actual = firma_archivo(archivo)
+        if checksum_actual is None or (bytes_actuales, checksum_actual) == (bytes_previos, checksum_previo):
+            logging.info(f"⏭️ {archivo} OMITIDO.")
+        else:
+            logging.info(f"🔄 {archivo} MODIFICADO ({bytes_previos} -> {bytes_actuales} bytes). Se recarga.")
+            pendientes.append(archivo)
+    if adoptados:
+        cursor.executemany("UPDATE control_cargas SET bytes_archivo = %s, checksum_archivo = %s WHERE nombre_archivo = %s", adoptados)
+        conn.commit()
+    cursor.close()
+    return pendientes
+
+def _tamano_entrada(archivo):
+    ruta = os.path.join(CARPETA_ENTRADA, archivo)
+    if os.path.exists(ruta): return os.path.getsize(ruta)
+    indice = almacen_ndjson.leer_indice(archivo[:-5])
+    return indice["origen"]["bytes"] if indice else 0
+
+# --- WORKERS (un proceso por archivo, conexión propia por proceso) ---
+_conn_worker = None
+
+def cargar_archivo_worker(archivo, bulk=False, forzar=False, usar_indice=True, parquet=False, tipos=TIPOS_PROCEDIMIENTO):
+    global _conn_worker
+    if _conn_worker is None or not _conn_worker.is_connected():
+        _conn_worker = obtener_conexion(bulk)
+    start = time.time()
+    firma = firma_archivo(archivo)
+    reemplazados = indice_ocid.reemplazados(archivo) if usar_indice else frozenset()
+    resumen = procesar_archivo(os.path.join(CARPETA_ENTRADA, archivo), _conn_worker, archivo, bulk, forzar, reemplazados, parquet, tipos)
+    if "error" in resumen:
+        registrar_fallo(_conn_worker, archivo, resumen["error"])
+        raise RuntimeError(resumen["error"])
+    registrar_carga(_conn_worker, archivo, resumen, firma, tipos)
+    return archivo, resumen["registros"], time.time() - start
+
+def cargar_en_paralelo(pendientes, workers, bulk=False, forzar=False, usar_indice=True, parquet=False, tipos=TIPOS_PROCEDIMIENTO):
+    # Los archivos más grandes primero para que ningún worker quede solo al final
+    pendientes = sorted(pendientes, key=_tamano_entrada, reverse=True)
+    # spawn: ningún hijo hereda el socket MySQL del proceso principal (y es lo que usa Windows)
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as exe:
+        futures = {exe.submit(cargar_archivo_worker, archivo, bulk, forzar, usar_indice, parquet, tipos): archivo for archivo in pendientes}
+        try:
+            for f in as_completed(futures):
+                try:
+                    archivo, regs, dur = f.result()
+                    logging.info(f"✅ {archivo}: {regs} procesos encontrados en {dur:.2f}s")
+                except Exception as e:
+                    logging.error(f"❌ Worker {futures[f]}: {e}")
+        except KeyboardInterrupt:
+            exe.shutdown(wait=False, cancel_futures=True)
+            raise
+
 # --- MAIN ---
 def main():
-    logging.info("🚀 CARGADOR V15.4 (Fixed Date)")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=WORKERS_DEFECTO, help="Procesos de carga en paralelo (1 = secuencial)")
+    parser.add_argument("--bulk", action="store_true", default=BULK_DEFECTO,
+                        help="LOAD DATA LOCAL INFILE a tablas staging y un upsert por archivo (requiere local_infile=ON)")
+    parser.add_argument("--forzar", action="store_true",
+                        help="Reescribe todos los registros aunque su huella no haya cambiado")
+    parser.add_argument("--sin-indice", action="store_true",
+                        help="No usa el índice de ocid entre meses: escribe todas las versiones en orden de archivo")
+    parser.add_argument("--reprocesar-rechazos", action="store_true",
+                        help="Solo reintenta las filas de cargas_rechazadas pendientes y termina")
+    parser.add_argument("--parquet", action="store_true", default=PARQUET_DEFECTO,
+                        help="Escribe además la caché Parquet de cada mes cargado (requiere pyarrow)")
+    parser.add_argument("--tipos", nargs="+", default=None,
+                        help="Procedimientos a cargar ('*' = todos). Por defecto CARGADOR_TIPOS o Licitación Pública")
+    args = parser.parse_args()
+    tipos = leer_tipos(args.tipos) if args.tipos else TIPOS_PROCEDIMIENTO
+
+    modo = "LOAD DATA" if args.bulk else "lotes"
+    logging.info(f"🚀 CARGADOR V15.9 (Workers: {args.workers}, Escritura: {modo}, Parser: {motor_parseo.describir_backend()}, "
+                 f"Validación: {validador.describir_backend()}, Tipos: {clave_tipos(tipos)})")
     if not os.path.exists(CARPETA_ENTRADA): return
 
-    archivos = sorted([f for f in os.listdir(CARPETA_ENTRADA) if f.endswith('.json')])
-    conn = obtener_conexion()
+    archivos = listar_archivos_entrada()
+    conn = obtener_conexion(args.bulk)
     
     try:
-        with conn.cursor() as c:
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS control_cargas (
-                    nombre_archivo VARCHAR(255) PRIMARY KEY,
-                    estado VARCHAR(50), fecha_fin DATETIME, registros_procesados INT DEFAULT 0
-                )
-            """)
-            conn.commit()
+        if args.bulk and not local_infile_habilitado(conn):
+            logging.warning("⚠️ El servidor tiene local_infile=OFF. Se usa la escritura por lotes.")
+            args.bulk = False
+        if args.parquet and not cache_parquet.disponible():
+            logging.warning("⚠️ pyarrow no está instalado. Se carga sin caché Parquet.")
+            args.parquet = False
 
-        for archivo in archivos:
-            cursor = conn.cursor()
-            cursor.execute("SELECT estado FROM control_cargas WHERE nombre_archivo = %s", (archivo,))
-            res = cursor.fetchone()
-            cursor.close()
-            
-            if res and res[0] == 'EXITO':
-                logging.info(f"⏭️ {archivo} OMITIDO.")
-                continue
+        preparar_tablas_control(conn)
+        if args.reprocesar_rechazos:
+            reprocesar_rechazos(conn)
+            return
 
-            start = time.time()
-            regs = procesar_archivo(os.path.join(CARPETA_ENTRADA, archivo), conn, archivo)
-            dur = time.time() - start
-            
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO control_cargas (nombre_archivo, estado, fecha_fin, registros_procesados) 
-                VALUES (%s, 'EXITO', NOW(), %s)
-                ON DUPLICATE KEY UPDATE estado='EXITO', fecha_fin=NOW(), registros_procesados=%s
-            """, (archivo, regs, regs))
-            conn.commit()
-            cursor.close()
-            
-            logging.info(f"✅ {archivo}: {regs} Licitaciones encontradas en {dur:.2f}s")
+        pendientes = archivos_pendientes(conn, archivos, tipos)
+
+        # Pre-pasada: índice ocid -> (mes, fecha, posición) de todos los meses, no solo los pendientes,
+        # para saber qué versión de cada ocid es la más nueva
+        usar_indice = not args.sin_indice
+        if usar_indice and pendientes:
+            indice_ocid.olvidar(archivos)
+            indice_ocid.actualizar([os.path.join(CARPETA_ENTRADA, a) for a in archivos], tipos, procesos=args.workers)
+
+        if args.workers > 1 and len(pendientes) > 1:
+            cargar_en_paralelo(pendientes, args.workers, args.bulk, args.forzar, usar_indice, args.parquet, tipos)
+        else:
+            for archivo in pendientes:
+                start = time.time()
+                firma = firma_archivo(archivo)
+                reemplazados = indice_ocid.reemplazados(archivo) if usar_indice else frozenset()
+                resumen = procesar_archivo(os.path.join(CARPETA_ENTRADA, archivo), conn, archivo, args.bulk, args.forzar, reemplazados, args.parquet, tipos)
+                dur = time.time() - start
+                if "error" in resumen:
+                    registrar_fallo(conn, archivo, resumen["error"])
+                    continue
+                registrar_carga(conn, archivo, resumen, firma, tipos)
+                logging.info(f"✅ {archivo}: {resumen['registros']} procesos encontrados en {dur:.2f}s")
 
     except KeyboardInterrupt: logging.warning("🛑 Interrumpido.")
     except Exception as e: logging.critical(f"☠️ Error Fatal: {e}")
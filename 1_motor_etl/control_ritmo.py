@@ -0,0 +1,155 @@
+"""
+Control de ritmo adaptativo (AIMD) con circuit breaker para APIs externas (prod4 de SEACE, Gemini).
+
+En vez de fijar cuántos workers golpean la API, cada petición pide permiso y luego informa cómo le fue:
+- AIMD: mientras la latencia y la tasa de error están sanas el límite de peticiones en vuelo sube
+  +1 por "ventana" (como TCP: +paso/limite por respuesta); ante 429, 5xx, timeouts o errores de
+  conexión baja a la mitad (como mucho una vez por latencia, para no desplomarse con una ráfaga).
+- Circuit breaker por host: con `umbral_fallas` sobrecargas seguidas o una tasa de error alta el
+  host queda en pausa (`pausa` s, que se duplica en cada reapertura hasta `pausa_max`; Retry-After
+  manda si es mayor). Pasada la pausa entra una sola petición de prueba: si sale bien se cierra.
+
+Uso (hilos o código secuencial):
+    control.entrar()
+    inicio = time.monotonic()
+    r = sesion.get(url)
+    control.registrar(clasificar_estado(r.status_code), time.monotonic() - inicio, retry_after(r.headers))
+
+Con asyncio: `await control.entrar_async()` en lugar de `control.entrar()`.
+"""
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+
+OK, ERROR, SOBRECARGA = "ok", "error", "sobrecarga"
+CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+def clasificar_estado(status: int) -> str:
+    """429 y 5xx son sobrecarga del host; el resto de 4xx es un error de esa petición (no del host)."""
+    if status == 429 or status >= 500: return SOBRECARGA
+    if status >= 400 and status != 404: return ERROR
+    return OK
+
+def retry_after(headers) -> Optional[float]:
+    valor = (headers or {}).get("Retry-After", "")
+    return float(valor) if str(valor).isdigit() else None
+
+class ControlRitmo:
+    def __init__(self, nombre: str = "api", inicial: int = 4, minimo: int = 1, maximo: int = 64,
+                 paso: float = 1.0, factor: float = 0.5, tolerancia_latencia: float = 2.0,
+                 tasa_error_sana: float = 0.05, umbral_fallas: int = 5, tasa_error_breaker: float = 0.5,
+                 pausa: float = 15.0, pausa_max: float = 600.0):
+        self.nombre = nombre
+        self.minimo, self.maximo = minimo, maximo
+        self.limite = float(min(max(inicial, minimo), maximo))
+        self.paso, self.factor = paso, factor
+        self.tolerancia_latencia = tolerancia_latencia
+        self.tasa_error_sana = tasa_error_sana
+        self.umbral_fallas = umbral_fallas
+        self.tasa_error_breaker = tasa_error_breaker
+        self.pausa_inicial, self.pausa_max = pausa, pausa_max
+
+        self.en_vuelo = 0
+        self.latencia = None          # EWMA de la latencia de respuestas sanas
+        self.latencia_base = None     # la mejor latencia vista (sube despacio para olvidar)
+        self.tasa_error = 0.0         # EWMA de sobrecargas
+        self.muestras = 0
+        self.fallas_seguidas = 0
+        self.ultimo_recorte = 0.0
+        self.estado = CERRADO
+        self.abierto_hasta = 0.0
+        self.pausa = pausa
+        self.sonda_en_vuelo = False
+        self.aperturas = 0
+
+        self._lock = threading.Lock()
+        self._liberado = threading.Condition(self._lock)
+        self._evento_async = None
+
+    # --- 1. ADMISIÓN ---
+    def intentar_entrar(self) -> Optional[float]:
+        """None si la petición puede salir (ocupa un lugar); si no, cuántos segundos conviene esperar."""
+        with self._lock:
+            ahora = time.monotonic()
+            if self.estado == ABIERTO:
+                if ahora < self.abierto_hasta: return self.abierto_hasta - ahora
+                self.estado = SEMIABIERTO
+                self.sonda_en_vuelo = False
+            if self.estado == SEMIABIERTO:
+                if self.sonda_en_vuelo: return 0.5
+                self.sonda_en_vuelo = True
+            elif self.en_vuelo >= int(self.limite):
+                return 0.5
+            self.en_vuelo += 1
+            return None
+
+    def entrar(self):
+        while (espera := self.intentar_entrar()) is not None:
+            with self._liberado:
+                self._liberado.wait(timeout=espera)
+
+    async def entrar_async(self):
+        if self._evento_async is None: self._evento_async = asyncio.Event()
+        while (espera := self.intentar_entrar()) is not None:
+            self._evento_async.clear()
+            try:
+                await asyncio.wait_for(self._evento_async.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- 2. RESULTADO ---
+    def registrar(self, resultado: str, latencia: Optional[float] = None, espera: Optional[float] = None):
+        """
+        Una llamada por cada entrar(). 'resultado' es OK, ERROR (falla de la petición, no del host)
+        o SOBRECARGA (429, 5xx, timeout, conexión). 'espera' es el Retry-After si vino.
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            self.en_vuelo = max(0, self.en_vuelo - 1)
+            self.muestras += 1
+            self.tasa_error = 0.9 * self.tasa_error + (0.1 if resultado == SOBRECARGA else 0.0)
+            sonda = self.estado == SEMIABIERTO
+            if sonda: self.sonda_en_vuelo = False
+
+            if resultado == SOBRECARGA:
+                self.fallas_seguidas += 1
+                degradado = self.muestras >= 20 and self.tasa_error >= self.tasa_error_breaker
+                if sonda or self.fallas_seguidas >= self.umbral_fallas or degradado or (espera or 0) > self.pausa:
+                    self._abrir(ahora, espera)
+                elif ahora - self.ultimo_recorte >= (self.latencia or 1.0):
+                    self.limite = max(self.minimo, self.limite * self.factor)
+                    self.ultimo_recorte = ahora
+            else:
+                self.fallas_seguidas = 0
+                if sonda:
+                    self.estado = CERRADO
+                    self.pausa = self.pausa_inicial
+                if resultado == OK and latencia is not None:
+                    self.latencia = latencia if self.latencia is None else 0.8 * self.latencia + 0.2 * latencia
+                    self.latencia_base = self.latencia if self.latencia_base is None else min(self.latencia_base * 1.001, self.latencia)
+                    sana = self.latencia <= self.latencia_base * self.tolerancia_latencia and self.tasa_error <= self.tasa_error_sana
+                    if sana and self.estado == CERRADO:
+                        self.limite = min(self.maximo, self.limite + self.paso / max(self.limite, 1.0))
+            self._liberado.notify_all()
+        if self._evento_async is not None: self._evento_async.set()
+
+    def _abrir(self, ahora: float, espera: Optional[float]):
+        pausa = max(self.pausa, espera or 0)
+        self.estado = ABIERTO
+        self.abierto_hasta = ahora + pausa
+        self.pausa = min(self.pausa_max, pausa * 2)
+        self.limite = float(self.minimo)
+        self.fallas_seguidas = 0
+        self.aperturas += 1
+
+    def resumen(self) -> Dict:
+        with self._lock:
+            return {"limite": round(self.limite, 1), "en_vuelo": self.en_vuelo, "estado": self.estado,
+                    "latencia_ms": round(self.latencia * 1000) if self.latencia else None,
+                    "tasa_error": round(self.tasa_error, 3), "aperturas": self.aperturas}
+
+    def __str__(self):
+        r = self.resumen()
+        return (f"{self.nombre}: límite {r['limite']} ({r['en_vuelo']} en vuelo), breaker {r['estado']}, "
+                f"latencia {r['latencia_ms']} ms, sobrecarga {r['tasa_error']:.1%}, {r['aperturas']} pausas")
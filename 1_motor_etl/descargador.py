@@ -5,26 +5,40 @@ import logging
 import re
 import argparse
 import zipfile
-import gzip
+import json
+import zlib
+import struct
+import hashlib
+import time
+import random
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urljoin
+from urllib3.util.retry import Retry
 from typing import List, Dict, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import manifiesto
+import almacen_ndjson
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # Sin aiohttp se usa el motor de hilos
+
 # --- SILENCIADOR NUCLEAR (WDM) ---
 os.environ['WDM_LOG'] = '0'
 
-# --- SELENIUM ---
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException
-from webdriver_manager.chrome import ChromeDriverManager
+# Selenium ya no se importa aquí: solo se carga si el descubrimiento HTTP falla (ver iniciar_driver)
 
 # --- 1. CONFIGURACIÓN ---
-URL_BASE_DESCARGAS = "https://contratacionesabiertas.oece.gob.pe/descargas?page=1&paginateBy=100&source=seace_v3&year="
+URL_BASE_DESCARGAS = os.getenv("OECE_URL_DESCARGAS", "https://contratacionesabiertas.oece.gob.pe/descargas?page=1&paginateBy=100&source=seace_v3&year=")
+# Endpoint JSON que alimenta la página de descargas (la SPA lo consulta para pintar los links)
+URL_API_DESCARGAS = os.getenv("OECE_URL_API_DESCARGAS", "https://contratacionesabiertas.oece.gob.pe/api/v1/files?page=1&paginateBy=100&source=seace_v3&year=")
+
+# Caché del manifiesto mes -> URL (no usar extensión .json: cargador.py lee todo *.json de 1_database)
+TTL_CACHE_LINKS_HORAS = 6
 
 HEADERS_HUMANOS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -35,6 +49,8 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(script_dir)
 db_folder_path = os.path.join(parent_dir, "1_database")
 os.makedirs(db_folder_path, exist_ok=True)
+ruta_cache_links = os.path.join(db_folder_path, "links_descarga.cache")
+carpeta_cuarentena = os.path.join(db_folder_path, "cuarentena")
 
 # --- LOGGING ---
 logging.basicConfig(
@@ -49,8 +65,130 @@ if sys.platform.startswith("win"):
     try: sys.stdout.reconfigure(encoding="utf-8")
     except: pass
 
-# --- 2. DRIVER FACTORY ---
-def iniciar_driver() -> Optional[webdriver.Chrome]:
+# --- 2. SESIÓN HTTP (POOL KEEP-ALIVE) ---
+def crear_sesion(pool: int = 10) -> requests.Session:
+    s = requests.Session()
+    s.headers.update(HEADERS_HUMANOS)
+    reintentos = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET", "HEAD"))
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=reintentos)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+SESION = crear_sesion()
+
+# --- 3. DESCUBRIMIENTO DE LINKS ---
+PATRON_URL = re.compile(r"/(json|sha)/(\d{4})/(\d{2})")
+PATRON_LINK_ARCHIVO = re.compile(r"""[^\s"'<>()\\]*api/v1/file[^\s"'<>()\\]*""")
+
+def extraer_links(texto: str, anio_buscado: int, url_origen: str) -> List[Dict[str, str]]:
+    """
+    Extrae los pares json/sha por mes desde HTML o JSON crudo (la API escapa las barras como \\/).
+    """
+    texto = texto.replace("\\/", "/")
+    links_encontrados = {}
+
+    for m in PATRON_LINK_ARCHIVO.finditer(texto):
+        url = urljoin(url_origen, m.group(0))
+        match = PATRON_URL.search(url)
+        if not match: continue
+
+        tipo, anio_det, mes_det = match.groups()
+        if anio_det != str(anio_buscado): continue
+
+        if mes_det not in links_encontrados: links_encontrados[mes_det] = {}
+        links_encontrados[mes_det].setdefault(f"{tipo}_url", url)
+
+    lista = []
+    for mes, urls in sorted(links_encontrados.items()):
+        if "json_url" in urls:
+            lista.append({
+                "nombre_base": f"{anio_buscado}-{mes}_seace_v3",
+                "json_url": urls["json_url"],
+                "sha_url": urls.get("sha_url", "")
+            })
+    return lista
+
+def descubrir_links_http(anio_buscado: int) -> List[Dict[str, str]]:
+    """
+    Camino ligero: consulta la API JSON y, si no trae nada, el HTML de la página.
+    """
+    candidatos = [
+        (f"{URL_API_DESCARGAS}{anio_buscado}", "application/json, text/plain, */*"),
+        (f"{URL_BASE_DESCARGAS}{anio_buscado}", HEADERS_HUMANOS["Accept"]),
+    ]
+    for url, accept in candidatos:
+        try:
+            r = SESION.get(url, headers={"Accept": accept}, timeout=30)
+            if r.status_code != 200: continue
+            links = extraer_links(r.text, anio_buscado, url)
+            if links: return links
+        except requests.RequestException as e:
+            logging.warning(f"⚠️ Descubrimiento HTTP falló en {url}: {e}")
+    return []
+
+def _leer_cache_links() -> Dict[str, Dict]:
+    if not os.path.exists(ruta_cache_links): return {}
+    try:
+        with open(ruta_cache_links, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _guardar_cache_links(cache: Dict[str, Dict]):
+    ruta_tmp = f"{ruta_cache_links}.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(ruta_tmp, ruta_cache_links)
+
+def encontrar_links_de_descarga(anios: List[int], ttl_horas: float = TTL_CACHE_LINKS_HORAS, forzar: bool = False) -> List[Dict[str, str]]:
+    cache = _leer_cache_links()
+    lista_final = []
+    sin_links = []
+    ahora = time.time()
+
+    for anio_buscado in anios:
+        entrada = cache.get(str(anio_buscado))
+        if entrada and not forzar and ahora - entrada.get("ts", 0) < ttl_horas * 3600:
+            logging.info(f"🗂️ {anio_buscado}: {len(entrada['links'])} links desde caché")
+            lista_final.extend(entrada["links"])
+            continue
+
+        inicio = time.time()
+        links = descubrir_links_http(anio_buscado)
+        if links:
+            logging.info(f"🔍 {anio_buscado}: {len(links)} meses vía HTTP en {(time.time() - inicio) * 1000:.0f} ms")
+            cache[str(anio_buscado)] = {"ts": ahora, "links": links}
+            lista_final.extend(links)
+        else:
+            sin_links.append(anio_buscado)
+
+    # Plan B: Chrome headless solo para los años que el camino HTTP no resolvió
+    if sin_links:
+        logging.warning(f"⚠️ Sin links vía HTTP para {sin_links}. Usando Selenium...")
+        por_anio = {}
+        for item in encontrar_links_selenium(sin_links):
+            por_anio.setdefault(item["nombre_base"][:4], []).append(item)
+            lista_final.append(item)
+        for anio, links in por_anio.items():
+            cache[anio] = {"ts": ahora, "links": links}
+
+    try: _guardar_cache_links(cache)
+    except OSError as e: logging.warning(f"⚠️ No se pudo guardar caché de links: {e}")
+
+    return lista_final
+
+# --- 3B. PLAN B: SELENIUM ---
+def iniciar_driver():
+    try:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+        from webdriver_manager.chrome import ChromeDriverManager
+    except ImportError as e:
+        logging.critical(f"🔥 Selenium no disponible: {e}")
+        return None
+
     opts = Options()
     opts.add_argument("--headless=new")
     opts.add_argument("--disable-gpu")
@@ -73,16 +211,18 @@ def iniciar_driver() -> Optional[webdriver.Chrome]:
         logging.critical(f"🔥 Error fatal iniciando Chrome: {e}")
         return None
 
-# --- 3. SCRAPING ---
-def encontrar_links_de_descarga(anios: List[int]) -> List[Dict[str, str]]:
+def encontrar_links_selenium(anios: List[int]) -> List[Dict[str, str]]:
     lista_final = []
     
     driver = iniciar_driver()
     if not driver: return []
+
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
     
     try:
-        patron_url = re.compile(r"/(json|sha)/(\d{4})/(\d{2})")
-
         for anio_buscado in anios:
             url_pagina = f"{URL_BASE_DESCARGAS}{anio_buscado}"
             logging.info(f"🔍 Auditando: {url_pagina}")
@@ -97,32 +237,15 @@ def encontrar_links_de_descarga(anios: List[int]) -> List[Dict[str, str]]:
                     logging.warning(f"⚠️ Sin datos para el año {anio_buscado}.")
                     continue
 
-                elementos = driver.find_elements(By.TAG_NAME, "a")
-                links_encontrados = {} 
-
-                for elem in elementos:
+                hrefs = []
+                for elem in driver.find_elements(By.TAG_NAME, "a"):
                     try:
                         url = elem.get_attribute("href")
-                        if not url: continue
-                        
-                        match = patron_url.search(url)
-                        if match:
-                            tipo, anio_det, mes_det = match.groups()
-                            if anio_det != str(anio_buscado): continue
-                            
-                            if mes_det not in links_encontrados: links_encontrados[mes_det] = {}
-                            if tipo == "json": links_encontrados[mes_det]["json_url"] = url
-                            elif tipo == "sha": links_encontrados[mes_det]["sha_url"] = url
+                        if url: hrefs.append(url)
                     except Exception: 
                         continue 
 
-                for mes, urls in links_encontrados.items():
-                    if "json_url" in urls:
-                        lista_final.append({
-                            "nombre_base": f"{anio_buscado}-{mes}_seace_v3",
-                            "json_url": urls["json_url"],
-                            "sha_url": urls.get("sha_url", "")
-                        })
+                lista_final.extend(extraer_links("\n".join(hrefs), anio_buscado, url_pagina))
 
             except Exception as e:
                 logging.error(f"❌ Error procesando año {anio_buscado}: {e}")
@@ -132,123 +255,695 @@ def encontrar_links_de_descarga(anios: List[int]) -> List[Dict[str, str]]:
         
     return lista_final
 
-# --- 4. WORKER DE DESCARGA (BLINDADO + SHA) ---
+# --- 4. VALIDADORES HTTP + MANIFIESTO ---
+def ruta_manifiesto() -> str:
+    return os.path.join(db_folder_path, "manifiesto.db")
+
+def leer_meta(nombre_base: str) -> Dict:
+    meta = manifiesto.leer(nombre_base, ruta_manifiesto())
+    if meta: return meta
+
+    # Meses bajados con la versión de sidecars <mes>.meta: se migran al manifiesto en el próximo guardado
+    ruta_legacy = os.path.join(db_folder_path, f"{nombre_base}.meta")
+    if not os.path.exists(ruta_legacy): return {}
+    try:
+        with open(ruta_legacy, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def guardar_meta(nombre_base: str, meta: Dict):
+    manifiesto.guardar(nombre_base, meta, ruta_manifiesto())
+
+def _validadores(headers, status: int) -> Dict:
+    # Sirve para respuestas de requests (status_code) y de aiohttp (status)
+    total = None
+    rango = headers.get("Content-Range", "")
+    if "/" in rango and not rango.endswith("/*"):
+        total = int(rango.rsplit("/", 1)[1])
+    elif headers.get("Content-Length") and status == 200:
+        total = int(headers["Content-Length"])
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_length": total,
+    }
+
+def sembrar_validadores(archivo_info: Dict[str, str], meta: Dict):
+    """
+    Archivos bajados antes de existir el .meta: un HEAD basta para que la próxima corrida sea condicional.
+    """
+    try:
+        h = SESION.head(archivo_info["json_url"], timeout=30, allow_redirects=True)
+        if h.ok:
+            meta.update(_validadores(h.headers, h.status_code))
+            meta["url"] = archivo_info["json_url"]
+            guardar_meta(archivo_info["nombre_base"], meta)
+    except requests.RequestException as e:
+        logging.warning(f"⚠️ HEAD falló para {archivo_info['nombre_base']}: {e}")
+
+# --- 5. PIPELINE DE UNA PASADA (FORMATO + DESCOMPRESIÓN + DIGEST) ---
+ALGORITMO_POR_LARGO = {32: "md5", 40: "sha1", 64: "sha256", 128: "sha512"}
+PATRON_DIGEST = re.compile(r"\b([0-9a-fA-F]{128}|[0-9a-fA-F]{64}|[0-9a-fA-F]{40}|[0-9a-fA-F]{32})\b")
+
+class ArchivoCorrupto(Exception):
+    """El cuerpo recibido no se puede descomprimir: el temporal no sirve para reanudar."""
+
+def leer_digest(texto_sha: Optional[str]) -> Optional[str]:
+    m = PATRON_DIGEST.search(texto_sha or "")
+    return m.group(1).lower() if m else None
+
+def digest_archivo(ruta: str, algoritmo: str) -> str:
+    h = hashlib.new(algoritmo)
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024*1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+class FlujoDescarga:
+    """
+    Procesa los bytes tal como llegan de la red, en una sola pasada:
+    - guarda el cuerpo crudo en temp_*.json (es lo que permite reanudar con Range),
+    - detecta gzip/zip por los primeros bytes y descomprime al vuelo hacia <final>.part,
+    - calcula el digest del cuerpo crudo y del JSON resultante.
+    Si el cuerpo viene plano, el propio temporal es el JSON final y no se escribe dos veces.
+    Un ZIP que no se puede leer en streaming (no deflate, o el primer miembro no es .json)
+    queda como 'zip_diferido' y se resuelve con zipfile al terminar.
+    """
+    def __init__(self, ruta_temp: str, ruta_part: str, algoritmo: str = "sha256"):
+        self.ruta_temp = ruta_temp
+        self.ruta_part = ruta_part
+        self.hash_crudo = hashlib.new(algoritmo)
+        self.hash_json = hashlib.new(algoritmo)
+        self.formato = None
+        self.bytes_crudos = 0
+        self.bytes_red = 0
+        self._cabecera = b""
+        self._descompresor = None
+        self._fin = False
+        self._crudo = None
+        self._salida = None
+
+    def abrir(self, reanudar: bool):
+        if reanudar:
+            # zlib no guarda estado entre corridas: se re-alimenta el parcial local (solo al reanudar)
+            with open(self.ruta_temp, "rb") as f:
+                for bloque in iter(lambda: f.read(1024*1024), b""):
+                    self._procesar(bloque)
+            self._crudo = open(self.ruta_temp, "ab")
+        else:
+            self._crudo = open(self.ruta_temp, "wb")
+
+    def alimentar(self, chunk: bytes):
+        self.bytes_red += len(chunk)
+        self._crudo.write(chunk)
+        self._procesar(chunk)
+
+    def _procesar(self, chunk: bytes):
+        self.bytes_crudos += len(chunk)
+        self.hash_crudo.update(chunk)
+        if self.formato is None:
+            self._cabecera += chunk
+            self._detectar()
+        else:
+            self._descomprimir(chunk)
+
+    def _detectar(self, final: bool = False):
+        cab = self._cabecera
+        resto = cab
+        if cab[:2] == b"\x1f\x8b":
+            self.formato = "gzip"
+            self._descompresor = zlib.decompressobj(31)
+        elif cab[:4] == b"PK\x03\x04":
+            if len(cab) < 30 and not final: return
+            n, x = struct.unpack("<HH", cab[26:30]) if len(cab) >= 30 else (0, 0)
+            if len(cab) < 30 + n + x and not final: return
+            metodo = struct.unpack("<H", cab[8:10])[0] if len(cab) >= 10 else None
+            nombre = cab[30:30 + n].decode("utf-8", "replace")
+            if metodo == 8 and nombre.endswith(".json"):
+                self.formato = "zip"
+                self._descompresor = zlib.decompressobj(-15)
+                resto = cab[30 + n + x:]
+            else:
+                self.formato = "zip_diferido"
+                resto = b""
+        elif len(cab) < 4 and not final:
+            return
+        else:
+            self.formato = "plano"
+
+        if self._descompresor:
+            self._salida = open(self.ruta_part, "wb")
+        self._cabecera = b""
+        self._descomprimir(resto)
+
+    def _descomprimir(self, datos: bytes):
+        if not datos or self._fin: return
+        if self.formato == "plano":
+            self.hash_json.update(datos)
+            return
+        if self.formato == "zip_diferido":
+            return
+
+        try:
+            while datos and not self._fin:
+                self._escribir(self._descompresor.decompress(datos))
+                if not self._descompresor.eof: break
+                datos = self._descompresor.unused_data
+                # gzip multi-miembro; en ZIP lo que sigue es el directorio central
+                if self.formato == "gzip" and datos[:2] == b"\x1f\x8b":
+                    self._descompresor = zlib.decompressobj(31)
+                else:
+                    self._fin = True
+        except zlib.error as e:
+            raise ArchivoCorrupto(f"Error {self.formato.upper()}: {e}")
+
+    def _escribir(self, datos: bytes):
+        if datos:
+            self._salida.write(datos)
+            self.hash_json.update(datos)
+
+    def terminar(self) -> str:
+        """Cierra el flujo, valida que la descompresión llegó al final y devuelve el formato detectado."""
+        if self.formato is None:
+            self._detectar(final=True)
+        if self.formato in ("gzip", "zip") and not self._fin:
+            try:
+                self._escribir(self._descompresor.flush())
+            except zlib.error as e:
+                raise ArchivoCorrupto(f"Error {self.formato.upper()}: {e}")
+            if not self._descompresor.eof:
+                raise ArchivoCorrupto(f"{self.formato.upper()} truncado")
+        self.cerrar()
+        return self.formato
+
+    def cerrar(self):
+        for f in (self._crudo, self._salida):
+            if f and not f.closed: f.close()
+
+# --- 6. WORKER DE DESCARGA (CONDICIONAL + REANUDABLE + SHA) ---
+def _finalizar_temporal(ruta_temp: str, ruta_json_final: str):
+    """
+    Plan B para ZIPs que no se pudieron leer en streaming.
+    Se escribe a .part y se renombra: un fallo a medias nunca deja un JSON final "válido" por tamaño.
+    """
+    ruta_part = f"{ruta_json_final}.part"
+    try:
+        with zipfile.ZipFile(ruta_temp) as z:
+            interno = next((n for n in z.namelist() if n.endswith(".json")), None)
+            if not interno: raise ArchivoCorrupto("ZIP sin JSON")
+            with z.open(interno) as zf, open(ruta_part, "wb") as fout:
+                shutil.copyfileobj(zf, fout)
+        os.replace(ruta_part, ruta_json_final)
+    except zipfile.BadZipFile as e:
+        raise ArchivoCorrupto(f"Error ZIP: {e}")
+    finally:
+        if os.path.exists(ruta_part):
+            try: os.remove(ruta_part)
+            except: pass
+
+def _preparar_descarga(meta: Dict, ruta_temp: str, condicional: bool):
+    """Cabeceras del GET: validadores para el 304 y Range/If-Range si hay un parcial reanudable."""
+    headers = {}
+    if condicional:
+        if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+
+    parcial = meta.get("parcial") or {}
+    offset = os.path.getsize(ruta_temp) if os.path.exists(ruta_temp) else 0
+    validador_parcial = parcial.get("etag") or parcial.get("last_modified")
+    if offset and validador_parcial:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validador_parcial
+    else:
+        offset = 0
+    return headers, offset
+
+def _cerrar_descarga(flujo: FlujoDescarga, meta: Dict, archivo_info: Dict[str, str], ruta_json_final: str) -> str:
+    """Valida tamaño, deja el JSON final en su sitio y registra validadores + digests en meta."""
+    esperado = meta["parcial"].get("content_length")
+    recibido = flujo.bytes_crudos
+    if esperado and recibido != esperado:
+        raise Exception(f"Descarga incompleta ({recibido}/{esperado} bytes), se reanudará")
+
+    formato = flujo.terminar()
+    digest_json = flujo.hash_json.hexdigest()
+    if formato == "plano":
+        os.replace(flujo.ruta_temp, ruta_json_final)
+    elif formato == "zip_diferido":
+        _finalizar_temporal(flujo.ruta_temp, ruta_json_final)
+        digest_json = digest_archivo(ruta_json_final, flujo.hash_json.name)
+    else:
+        os.replace(flujo.ruta_part, ruta_json_final)
+
+    meta.update(meta.pop("parcial"))
+    meta.update({
+        "url": archivo_info["json_url"],
+        "sha_url": archivo_info.get("sha_url"),
+        "bytes_json": os.path.getsize(ruta_json_final),
+        "formato": formato,
+        "algoritmo": flujo.hash_json.name,
+        "digest_crudo": flujo.hash_crudo.hexdigest(),
+        "digest_json": digest_json,
+        "actualizado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    guardar_meta(archivo_info["nombre_base"], meta)
+    return "DESCARGADO"
+
+def _limpiar_fallo(flujo: FlujoDescarga, meta: Dict, nombre_base: str, corrupto: bool):
+    flujo.cerrar()
+    if corrupto:
+        # Un temporal que no descomprime no sirve para reanudar: se descarta entero
+        if os.path.exists(flujo.ruta_temp): os.remove(flujo.ruta_temp)
+        meta.pop("parcial", None)
+        guardar_meta(nombre_base, meta)
+    # Si no, se conserva temp_*.json para reanudar; el .part se rehace al re-alimentar el parcial
+    if os.path.exists(flujo.ruta_part): os.remove(flujo.ruta_part)
+
+def descargar_json(archivo_info: Dict[str, str], meta: Dict, ruta_temp: str, ruta_json_final: str,
+                   condicional: bool, algoritmo: str = "sha256", metricas: Optional[Dict] = None) -> str:
+    """
+    GET condicional (304 -> OMITIDO) y reanudación por Range del temp_*.json parcial.
+    El cuerpo pasa por FlujoDescarga y el JSON final se escribe una sola vez.
+    Devuelve 'DESCARGADO' u 'OMITIDO' (con digests en meta); cualquier fallo se propaga como excepción.
+    Si se pasa `metricas`, se anotan ahí los bytes recibidos por red.
+    """
+    nombre_base = archivo_info["nombre_base"]
+    headers, offset = _preparar_descarga(meta, ruta_temp, condicional)
+    flujo = FlujoDescarga(ruta_temp, f"{ruta_json_final}.part", algoritmo)
+    try:
+        with SESION.get(archivo_info["json_url"], headers=headers, stream=True, timeout=600) as r:
+            if r.status_code == 304:
+                if meta.pop("parcial", None) is not None: guardar_meta(nombre_base, meta)
+                return "OMITIDO"
+
+            if r.status_code == 416 and offset and offset == meta["parcial"].get("content_length"):
+                logging.info(f"   ↳ {nombre_base}: temporal ya estaba completo")
+                flujo.abrir(reanudar=True)
+            elif r.status_code == 416:
+                raise ArchivoCorrupto("Rango inválido (416)")
+            else:
+                r.raise_for_status()
+                if r.status_code == 206:
+                    logging.info(f"⏯️ Reanudando {nombre_base} desde {offset / 1024 / 1024:.1f} MB...")
+                    flujo.abrir(reanudar=True)
+                else:
+                    logging.info(f"⬇️ Descargando JSON: {nombre_base}.json...")
+                    meta["parcial"] = _validadores(r.headers, r.status_code)
+                    guardar_meta(nombre_base, meta)
+                    flujo.abrir(reanudar=False)
+
+                for chunk in r.iter_content(chunk_size=1024*1024):
+                    flujo.alimentar(chunk)
+
+        return _cerrar_descarga(flujo, meta, archivo_info, ruta_json_final)
+    except ArchivoCorrupto:
+        _limpiar_fallo(flujo, meta, nombre_base, corrupto=True)
+        raise
+    except Exception:
+        _limpiar_fallo(flujo, meta, nombre_base, corrupto=False)
+        raise
+    finally:
+        if metricas is not None: metricas["bytes_red"] = metricas.get("bytes_red", 0) + flujo.bytes_red
+
+def poner_en_cuarentena(ruta_json_final: str, nombre_base: str) -> str:
+    os.makedirs(carpeta_cuarentena, exist_ok=True)
+    destino = os.path.join(carpeta_cuarentena, f"{nombre_base}_{time.strftime('%Y%m%d%H%M%S')}.json")
+    shutil.move(ruta_json_final, destino)
+    return destino
+
+def verificar_integridad(ruta_json_final: str, meta: Dict, digest_esperado: str) -> bool:
+    """
+    El .sha puede referirse al cuerpo descargado o al JSON: se acepta cualquiera de los dos.
+    Si el algoritmo del .sha no es el que se usó al vuelo, se recalcula sobre el JSON (pasada extra, caso raro).
+    """
+    algoritmo = ALGORITMO_POR_LARGO[len(digest_esperado)]
+    if algoritmo == meta.get("algoritmo"):
+        return digest_esperado in (meta.get("digest_json"), meta.get("digest_crudo"))
+    return digest_archivo(ruta_json_final, algoritmo) == digest_esperado
+
+def obtener_sha(sha_url: str) -> Optional[str]:
+    try:
+        # Es un archivo pequeño, no necesitamos stream
+        r_sha = SESION.get(sha_url, timeout=30)
+        if r_sha.status_code == 200: return r_sha.text.strip()
+    except Exception as e:
+        logging.warning(f"⚠️ Alerta menor: No se pudo bajar SHA {sha_url}: {e}")
+    return None
+
+def _contexto_tarea(archivo_info: Dict[str, str]) -> Dict:
+    """Rutas, meta y algoritmo de digest de un mes (compartido por el motor de hilos y el async)."""
+    nombre_base = archivo_info["nombre_base"]
+    nombre_json = f"{nombre_base}.json"
+    ctx = {
+        "info": archivo_info,
+        "nombre_json": nombre_json,
+        "ruta_json_final": os.path.join(db_folder_path, nombre_json),
+        "ruta_temp": os.path.join(db_folder_path, f"temp_{nombre_json}"),
+        "ruta_sha": os.path.join(db_folder_path, f"{nombre_base}.sha"),
+        "meta": leer_meta(nombre_base),
+        "res": {"nombre": nombre_base, "estado": "UNKNOWN", "mensaje": ""},
+        "inicio": time.time(),
+        "metricas": {"bytes_red": 0},
+    }
+
+    # El .sha local (si existe) dice qué algoritmo calcular al vuelo
+    ctx["digest_local"] = None
+    if os.path.exists(ctx["ruta_sha"]):
+        with open(ctx["ruta_sha"], "r", encoding="utf-8") as f_sha:
+            ctx["digest_local"] = leer_digest(f_sha.read())
+    ctx["algoritmo"] = ALGORITMO_POR_LARGO[len(ctx["digest_local"])] if ctx["digest_local"] else "sha256"
+
+    # Idempotencia JSON: si ya existe, solo se vuelve a bajar si el servidor dice que cambió
+    # (un JSON borrado tras convertirlo a partes NDJSON cuenta como presente)
+    ctx["json_ok"] = (os.path.exists(ctx["ruta_json_final"]) and os.path.getsize(ctx["ruta_json_final"]) > 0) \
+        or almacen_ndjson.partes_vigentes(ctx["ruta_json_final"])
+    ctx["sembrar"] = ctx["json_ok"] and not (ctx["meta"].get("etag") or ctx["meta"].get("last_modified"))
+    return ctx
+
+def _necesita_sha(ctx: Dict) -> bool:
+    # Se baja si falta o si el JSON es nuevo (un mes actualizado trae otro SHA)
+    return bool(ctx["info"].get("sha_url")) and (not os.path.exists(ctx["ruta_sha"]) or ctx["res"]["estado"] == "DESCARGADO")
+
+def _finalizar_tarea(ctx: Dict, texto_sha: Optional[str]) -> Dict[str, str]:
+    res, meta = ctx["res"], ctx["meta"]
+    nombre_base, nombre_json = res["nombre"], ctx["nombre_json"]
+
+    # Solo se verifica contra un SHA bajado en esta misma ejecución: el .sha que ya estaba en disco es
+    # el de la versión anterior del mes y haría ir a cuarentena un JSON nuevo y válido
+    digest_nuevo = None
+    if texto_sha:
+        with open(ctx["ruta_sha"], "w", encoding="utf-8") as f_sha:
+            f_sha.write(texto_sha)
+        digest_nuevo = leer_digest(texto_sha)
+        if res["estado"] == "DESCARGADO":
+            logging.info(f"   ↳ SHA descargado: {nombre_base}.sha")
+    elif res["estado"] == "DESCARGADO":
+        meta["sha_verificado"] = None
+        logging.warning(f"⚠️ {nombre_json}: sin SHA nuevo, no se verifica la integridad.")
+
+    # Verificación: un JSON que no coincide con su SHA no llega al cargador
+    if res["estado"] == "DESCARGADO" and digest_nuevo:
+        if verificar_integridad(ctx["ruta_json_final"], meta, digest_nuevo):
+            meta["sha_verificado"] = True
+            logging.info(f"   ↳ 🔒 SHA verificado: {nombre_json}")
+        else:
+            destino = poner_en_cuarentena(ctx["ruta_json_final"], nombre_base)
+            meta["sha_verificado"] = False
+            res["estado"] = "FALLO"
+            res["mensaje"] = f"SHA no coincide, movido a {os.path.relpath(destino, db_folder_path)}"
+            logging.error(f"🚫 {nombre_json}: {res['mensaje']}")
+
+    meta["disponible"] = 1 if os.path.exists(ctx["ruta_json_final"]) or almacen_ndjson.partes_vigentes(ctx["ruta_json_final"]) else 0
+    guardar_meta(nombre_base, meta)
+
+    # Limpieza final del temporal por si acaso
+    if os.path.exists(ctx["ruta_temp"]): 
+        try: os.remove(ctx["ruta_temp"])
+        except: pass
+    return _registrar_intento(ctx)
+
+def _registrar_intento(ctx: Dict) -> Dict[str, str]:
+    """Deja el resultado en el historial del manifiesto (duración y bytes por red de este intento)."""
+    res = ctx["res"]
+    try:
+        manifiesto.registrar_intento(res["nombre"], ctx["inicio"], time.time() - ctx["inicio"],
+                                     ctx["metricas"]["bytes_red"], res["estado"], res["mensaje"], ruta_manifiesto())
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudo registrar en el manifiesto {res['nombre']}: {e}")
+    return res
+
 def tarea_descarga(archivo_info: Dict[str, str]) -> Dict[str, str]:
-    nombre_json = f"{archivo_info['nombre_base']}.json"
-    ruta_json_final = os.path.join(db_folder_path, nombre_json)
-    ruta_temp = os.path.join(db_folder_path, f"temp_{nombre_json}")
-    
-    res = {"nombre": archivo_info["nombre_base"], "estado": "UNKNOWN", "mensaje": ""}
-    
-    # 1. Idempotencia JSON
-    json_ok = os.path.exists(ruta_json_final) and os.path.getsize(ruta_json_final) > 0
-    if json_ok:
+    ctx = _contexto_tarea(archivo_info)
+    res = ctx["res"]
+
+    if ctx["sembrar"]:
+        sembrar_validadores(archivo_info, ctx["meta"])
         res["estado"] = "OMITIDO"
         res["mensaje"] = "Ya existe"
-    
-    # Si no existe, lo descargamos
-    if not json_ok:
+    else:
         try:
-            logging.info(f"⬇️ Descargando JSON: {nombre_json}...")
-            
-            with requests.get(archivo_info["json_url"], headers=HEADERS_HUMANOS, stream=True, timeout=600) as r:
-                r.raise_for_status()
-                with open(ruta_temp, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=1024*1024):
-                        f.write(chunk)
-            
-            es_zip = zipfile.is_zipfile(ruta_temp)
-            es_gzip = False
-            with open(ruta_temp, 'rb') as f_check:
-                es_gzip = f_check.read(2) == b'\x1f\x8b'
-
-            if es_zip:
-                with zipfile.ZipFile(ruta_temp) as z:
-                    interno = next((n for n in z.namelist() if n.endswith(".json")), None)
-                    if interno:
-                        with z.open(interno) as zf, open(ruta_json_final, "wb") as fout:
-                            shutil.copyfileobj(zf, fout)
-                    else:
-                        raise Exception("ZIP sin JSON")
-            elif es_gzip:
-                try:
-                    with gzip.open(ruta_temp, 'rb') as f_in, open(ruta_json_final, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                except Exception as e:
-                    raise Exception(f"Error GZIP: {e}")
-            else:
-                 shutil.move(ruta_temp, ruta_json_final)
-                 
-            res["estado"] = "DESCARGADO"
-            
+            res["estado"] = descargar_json(archivo_info, ctx["meta"], ctx["ruta_temp"], ctx["ruta_json_final"],
+                                           condicional=ctx["json_ok"], algoritmo=ctx["algoritmo"], metricas=ctx["metricas"])
+            if res["estado"] == "OMITIDO": res["mensaje"] = "Sin cambios (304)"
         except Exception as e:
             res["estado"] = "FALLO"
             res["mensaje"] = str(e)
-            logging.error(f"Error en {nombre_json}: {e}")
-            # Si falla el JSON, nos vamos, no tiene sentido bajar el SHA
-            if os.path.exists(ruta_temp): 
-                try: os.remove(ruta_temp)
-                except: pass
-            return res
-
-    # ---------------------------------------------------------
-    # 4. DESCARGA DEL SHA (NUEVO: INTEGRIDAD COMPLETA)
-    # ---------------------------------------------------------
-    sha_url = archivo_info.get("sha_url")
-    if sha_url:
-        nombre_sha = f"{archivo_info['nombre_base']}.sha"
-        ruta_sha = os.path.join(db_folder_path, nombre_sha)
-        
-        # Solo bajamos el SHA si no existe o si acabamos de bajar un JSON nuevo
-        if not os.path.exists(ruta_sha) or res["estado"] == "DESCARGADO":
+            logging.error(f"Error en {ctx['nombre_json']}: {e}")
+            return _registrar_intento(ctx)
+
+    texto_sha = obtener_sha(archivo_info["sha_url"]) if _necesita_sha(ctx) else None
+    return _finalizar_tarea(ctx, texto_sha)
+
+# --- 7. MOTOR ASYNC (POOL POR HOST + TOKEN BUCKET + BACKOFF CON JITTER) ---
+class CuboTokens:
+    """
+    Token bucket para asyncio: `tasa` tokens por segundo con ráfaga de `capacidad`.
+    Admite deuda (consumir más de lo que hay) para que un chunk grande no se quede esperando para siempre.
+    Con tasa 0/None no limita.
+    """
+    def __init__(self, tasa: Optional[float], capacidad: Optional[float] = None):
+        self.tasa = tasa
+        self.capacidad = capacidad or tasa or 0
+        self.tokens = self.capacidad
+        self.ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def consumir(self, n: float = 1):
+        if not self.tasa: return
+        async with self._lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            self.tokens -= n
+            espera = -self.tokens / self.tasa if self.tokens < 0 else 0
+        if espera: await asyncio.sleep(espera)
+
+class ErrorReintentable(Exception):
+    def __init__(self, mensaje: str, espera: Optional[float] = None):
+        super().__init__(mensaje)
+        self.espera = espera
+
+class MotorDescargaAsync:
+    """
+    Un único ClientSession (keep-alive) para todos los meses y años:
+    - `concurrencia` tareas simultáneas y como mucho `por_host` conexiones contra el mismo host,
+    - `peticiones_seg` peticiones/s y `max_bytes_seg` de ancho de banda (token buckets),
+    - reintentos con backoff exponencial y jitter; el parcial se reanuda con Range en cada reintento.
+    """
+    def __init__(self, concurrencia: int = 4, por_host: int = 4, peticiones_seg: Optional[float] = 5,
+                 max_bytes_seg: Optional[float] = None, reintentos: int = 4, backoff_base: float = 1.0):
+        self.concurrencia = concurrencia
+        self.por_host = por_host
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.cubo_peticiones = CuboTokens(peticiones_seg)
+        self.cubo_bytes = CuboTokens(max_bytes_seg)
+        self.sesion = None
+
+    async def __aenter__(self):
+        conector = aiohttp.TCPConnector(limit=self.concurrencia * 2, limit_per_host=self.por_host, ttl_dns_cache=300)
+        self.sesion = aiohttp.ClientSession(
+            connector=conector, headers=HEADERS_HUMANOS,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=120)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.sesion.close()
+
+    async def _con_reintentos(self, etiqueta: str, corrutina_factory):
+        for intento in range(self.reintentos + 1):
             try:
-                # Es un archivo pequeño, no necesitamos stream
-                r_sha = requests.get(sha_url, headers=HEADERS_HUMANOS, timeout=30)
-                if r_sha.status_code == 200:
-                    with open(ruta_sha, "w", encoding="utf-8") as f_sha:
-                        f_sha.write(r_sha.text.strip())
-                    # Solo logueamos si fue una descarga activa
-                    if res["estado"] == "DESCARGADO":
-                        logging.info(f"   ↳ SHA descargado: {nombre_sha}")
-            except Exception as e:
-                # El fallo del SHA no debe marcar el proceso principal como error
-                logging.warning(f"⚠️ Alerta menor: No se pudo bajar SHA para {nombre_json}: {e}")
+                return await corrutina_factory()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ErrorReintentable) as e:
+                if intento == self.reintentos: raise
+                espera = getattr(e, "espera", None) or self.backoff_base * (2 ** intento) * random.uniform(0.5, 1.5)
+                logging.warning(f"🔁 {etiqueta}: {e or type(e).__name__}. Reintento {intento + 1}/{self.reintentos} en {espera:.1f}s")
+                await asyncio.sleep(espera)
 
-    # Limpieza final del temporal por si acaso
-    if os.path.exists(ruta_temp): 
-        try: os.remove(ruta_temp)
-        except: pass
-                
-    return res
+    @staticmethod
+    def _revisar_estado(r):
+        if r.status == 429 or r.status >= 500:
+            retry_after = r.headers.get("Retry-After", "")
+            raise ErrorReintentable(f"HTTP {r.status}", float(retry_after) if retry_after.isdigit() else None)
+        if r.status >= 400:
+            # 4xx no se reintenta: el link no existe o no tenemos permiso
+            raise Exception(f"HTTP {r.status} {r.reason}")
+
+    async def obtener_texto(self, url: str) -> Optional[str]:
+        async def _get():
+            await self.cubo_peticiones.consumir()
+            async with self.sesion.get(url) as r:
+                if r.status != 200:
+                    self._revisar_estado(r)
+                    return None
+                return (await r.text()).strip()
+        try:
+            return await self._con_reintentos(url, _get)
+        except Exception as e:
+            logging.warning(f"⚠️ Alerta menor: No se pudo bajar SHA {url}: {e}")
+            return None
+
+    async def sembrar_validadores(self, archivo_info: Dict[str, str], meta: Dict):
+        try:
+            await self.cubo_peticiones.consumir()
+            async with self.sesion.head(archivo_info["json_url"], allow_redirects=True) as h:
+                if h.status == 200:
+                    meta.update(_validadores(h.headers, h.status))
+                    meta["url"] = archivo_info["json_url"]
+                    guardar_meta(archivo_info["nombre_base"], meta)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"⚠️ HEAD falló para {archivo_info['nombre_base']}: {e}")
+
+    async def descargar_json(self, ctx: Dict) -> str:
+        """Mismo contrato que descargar_json() pero sobre aiohttp; la escritura a disco va a un hilo."""
+        archivo_info, meta = ctx["info"], ctx["meta"]
+        nombre_base = archivo_info["nombre_base"]
+        headers, offset = _preparar_descarga(meta, ctx["ruta_temp"], ctx["json_ok"])
+        flujo = FlujoDescarga(ctx["ruta_temp"], f"{ctx['ruta_json_final']}.part", ctx["algoritmo"])
+        try:
+            await self.cubo_peticiones.consumir()
+            async with self.sesion.get(archivo_info["json_url"], headers=headers) as r:
+                if r.status == 304:
+                    if meta.pop("parcial", None) is not None: guardar_meta(nombre_base, meta)
+                    return "OMITIDO"
+
+                if r.status == 416 and offset and offset == meta["parcial"].get("content_length"):
+                    await asyncio.to_thread(flujo.abrir, True)
+                elif r.status == 416:
+                    raise ArchivoCorrupto("Rango inválido (416)")
+                else:
+                    self._revisar_estado(r)
+                    if r.status == 206:
+                        logging.info(f"⏯️ Reanudando {nombre_base} desde {offset / 1024 / 1024:.1f} MB...")
+                        await asyncio.to_thread(flujo.abrir, True)
+                    else:
+                        logging.info(f"⬇️ Descargando JSON: {nombre_base}.json...")
+                        meta["parcial"] = _validadores(r.headers, r.status)
+                        guardar_meta(nombre_base, meta)
+                        await asyncio.to_thread(flujo.abrir, False)
+
+                    async for chunk in r.content.iter_chunked(1024*1024):
+                        await self.cubo_bytes.consumir(len(chunk))
+                        await asyncio.to_thread(flujo.alimentar, chunk)
+
+            return await asyncio.to_thread(_cerrar_descarga, flujo, meta, archivo_info, ctx["ruta_json_final"])
+        except ArchivoCorrupto:
+            _limpiar_fallo(flujo, meta, nombre_base, corrupto=True)
+            raise
+        except BaseException:
+            _limpiar_fallo(flujo, meta, nombre_base, corrupto=False)
+            raise
+        finally:
+            ctx["metricas"]["bytes_red"] = ctx["metricas"].get("bytes_red", 0) + flujo.bytes_red
+
+    async def tarea(self, archivo_info: Dict[str, str], semaforo: asyncio.Semaphore) -> Dict[str, str]:
+        async with semaforo:
+            ctx = _contexto_tarea(archivo_info)
+            res = ctx["res"]
+
+            if ctx["sembrar"]:
+                await self.sembrar_validadores(archivo_info, ctx["meta"])
+                res["estado"] = "OMITIDO"
+                res["mensaje"] = "Ya existe"
+            else:
+                try:
+                    res["estado"] = await self._con_reintentos(ctx["nombre_json"], lambda: self.descargar_json(ctx))
+                    if res["estado"] == "OMITIDO": res["mensaje"] = "Sin cambios (304)"
+                except Exception as e:
+                    res["estado"] = "FALLO"
+                    res["mensaje"] = str(e) or type(e).__name__
+                    logging.error(f"Error en {ctx['nombre_json']}: {res['mensaje']}")
+                    return await asyncio.to_thread(_registrar_intento, ctx)
+
+            texto_sha = await self.obtener_texto(archivo_info["sha_url"]) if _necesita_sha(ctx) else None
+            return await asyncio.to_thread(_finalizar_tarea, ctx, texto_sha)
+
+async def descargar_todos_async(items: List[Dict[str, str]], concurrencia: int = 4, por_host: int = 4,
+                                peticiones_seg: Optional[float] = 5, max_bytes_seg: Optional[float] = None,
+                                al_terminar=None) -> List[Dict[str, str]]:
+    semaforo = asyncio.Semaphore(concurrencia)
+    resultados = []
+
+    async def tarea_protegida(motor: MotorDescargaAsync, item: Dict[str, str]) -> Dict[str, str]:
+        # Un mes que falla de forma inesperada (DNS, disco lleno...) queda como FALLO sin cortar a los demás
+        inicio = time.time()
+        try:
+            return await motor.tarea(item, semaforo)
+        except Exception as e:
+            ctx = {"res": {"nombre": item["nombre_base"], "estado": "FALLO", "mensaje": str(e) or type(e).__name__},
+                   "inicio": inicio, "metricas": {"bytes_red": 0}}
+            logging.error(f"☠️ Error en {item['nombre_base']}: {ctx['res']['mensaje']}")
+            return await asyncio.to_thread(_registrar_intento, ctx)
+
+    async with MotorDescargaAsync(concurrencia, por_host, peticiones_seg, max_bytes_seg) as motor:
+        tareas = [asyncio.ensure_future(tarea_protegida(motor, item)) for item in items]
+        for futuro in asyncio.as_completed(tareas):
+            r = await futuro
+            resultados.append(r)
+            if al_terminar: al_terminar(r)
+    return resultados
+
+# --- 8. MAIN ---
+def reportar(r: Dict[str, str]):
+    estado = r['estado']
+    if estado == "DESCARGADO":
+        print(f"✅ {r['nombre']}")
+    elif estado == "FALLO":
+        print(f"❌ {r['nombre']}: {r['mensaje']}")
+    else:
+        print(f"⏭️ {r['nombre']} ({r['mensaje'] or 'Omitido'})")
 
-# --- 5. MAIN ---
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--years", nargs="+", type=int, default=[2024, 2025])
-    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--motor", choices=["async", "hilos"], default="async", help="async (aiohttp) o el pool de hilos clásico")
+    parser.add_argument("--workers", type=int, default=3, help="Hilos del motor 'hilos'")
+    parser.add_argument("--concurrency", type=int, default=4, help="Descargas simultáneas del motor async")
+    parser.add_argument("--per-host", type=int, default=4, help="Conexiones máximas por host (motor async)")
+    parser.add_argument("--rps", type=float, default=5, help="Peticiones por segundo (0 = sin límite)")
+    parser.add_argument("--max-bandwidth", type=float, default=0, help="MB/s máximos (0 = sin límite)")
+    parser.add_argument("--links-ttl", type=float, default=TTL_CACHE_LINKS_HORAS, help="Horas de validez de la caché de links")
+    parser.add_argument("--refresh-links", action="store_true", help="Ignora la caché y vuelve a descubrir los links")
+    parser.add_argument("--ndjson", action="store_true", help="Al terminar, reescribe los meses nuevos como partes NDJSON comprimidas")
+    parser.add_argument("--ndjson-registros", type=int, default=almacen_ndjson.REGISTROS_POR_PARTE, help="Registros por parte NDJSON")
+    parser.add_argument("--ndjson-compresion", choices=sorted(almacen_ndjson.EXTENSION), default=almacen_ndjson.COMPRESION_DEFECTO)
+    parser.add_argument("--ndjson-borrar-json", action="store_true", help="Elimina el JSON original tras convertirlo")
     args = parser.parse_args()
     
-    logging.info(f"🚀 DESCARGADOR V3.4 (Integrity Edition + SHA)")
+    logging.info(f"🚀 DESCARGADOR V4.0 (Async + Resume + Streaming SHA)")
     
-    todos = encontrar_links_de_descarga(args.years)
+    todos = encontrar_links_de_descarga(args.years, ttl_horas=args.links_ttl, forzar=args.refresh_links)
     logging.info(f"📋 Archivos totales a gestionar: {len(todos)}")
-    
-    with ThreadPoolExecutor(max_workers=args.workers) as exe:
-        futures = {exe.submit(tarea_descarga, item): item for item in todos}
-        
-        for f in as_completed(futures):
-            item = futures[f]
-            try:
-                r = f.result()
-                estado = r['estado']
-                if estado == "DESCARGADO":
-                    print(f"✅ {r['nombre']}")
-                elif estado == "FALLO":
-                    print(f"❌ {r['nombre']}: {r['mensaje']}")
-                else:
-                    print(f"⏭️ {r['nombre']} (Omitido)")
-            except Exception as e:
-                print(f"☠️ Error hilo {item['nombre_base']}: {e}")
+
+    if args.motor == "async" and aiohttp is None:
+        logging.warning("⚠️ aiohttp no está instalado. Usando el pool de hilos.")
+        args.motor = "hilos"
+
+    if args.motor == "async":
+        asyncio.run(descargar_todos_async(
+            todos, concurrencia=args.concurrency, por_host=args.per_host,
+            peticiones_seg=args.rps or None,
+            max_bytes_seg=args.max_bandwidth * 1024 * 1024 or None,
+            al_terminar=reportar,
+        ))
+    else:
+        with ThreadPoolExecutor(max_workers=args.workers) as exe:
+            futures = {exe.submit(tarea_descarga, item): item for item in todos}
+
+            for f in as_completed(futures):
+                item = futures[f]
+                try:
+                    reportar(f.result())
+                except Exception as e:
+                    print(f"☠️ Error hilo {item['nombre_base']}: {e}")
+
+    # --- 9. ETAPA OPCIONAL: PARTES NDJSON ---
+    if args.ndjson:
+        almacen_ndjson.compactar(db_folder_path, nombres=[item["nombre_base"] for item in todos],
+                                 registros_por_parte=args.ndjson_registros, compresion=args.ndjson_compresion,
+                                 borrar_json=args.ndjson_borrar_json)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -8,6 +8,8 @@ import time
 from dotenv import load_dotenv
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 import pypdf
+from control_ritmo import ControlRitmo, clasificar_estado, retry_after, OK, ERROR, SOBRECARGA
+from cache_contratos import CacheContratos, encabezados_condicionales
 
 # --- CONFIGURACIÓN ---
 if sys.platform.startswith('win'):
@@ -41,6 +43,45 @@ URL_METADATA = "https://prod4.seace.gob.pe:9000/api/bus/contrato/idContrato/{}"
 URL_DESCARGA = "https://prod4.seace.gob.pe:9000/api/con/documentos/descargar/{}"
 HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"}
 
+# Ritmo (ver control_ritmo.py): el script es secuencial, así que el control no sube la
+# concurrencia; lo que aporta es la pausa del circuit breaker cuando prod4 o Gemini se saturan.
+CONTROL_PROD4 = ControlRitmo("prod4", inicial=1, maximo=1)
+CONTROL_GEMINI = ControlRitmo("gemini", inicial=1, maximo=1, umbral_fallas=1, pausa=15, pausa_max=300)
+REINTENTOS_GEMINI = 3
+
+# Misma caché de respuestas de la API de contratos que spider_garantias.py: casi siempre ya la consultó
+CACHE = CacheContratos()
+
+def consultar_prod4(url, encabezados=None, **kwargs):
+    """GET a prod4 respetando el breaker; None si hubo error de conexión."""
+    CONTROL_PROD4.entrar()
+    inicio = time.monotonic()
+    try:
+        r = requests.get(url, headers={**HEADERS, **(encabezados or {})}, verify=False, **kwargs)
+    except Exception:
+        CONTROL_PROD4.registrar(SOBRECARGA)
+        return None
+    CONTROL_PROD4.registrar(clasificar_estado(r.status_code), time.monotonic() - inicio, retry_after(r.headers))
+    return r
+
+def obtener_metadata(id_contrato):
+    """JSON del contrato desde la caché (o la API si no está o venció); None si no hay o no es JSON."""
+    entrada = CACHE.buscar_json(id_contrato)  # una entrada corrupta se descarta y se vuelve a pedir
+    if not (entrada and entrada["fresca"]):
+        r = consultar_prod4(URL_METADATA.format(id_contrato), encabezados_condicionales(entrada), timeout=10)
+        if r is None: return None
+        if r.status_code == 304 and entrada:
+            CACHE.renovar(id_contrato)
+        else:
+            try:
+                data = r.json() if r.status_code == 200 else None
+            except ValueError:
+                return None  # 200 que no es JSON: no se guarda
+            if r.status_code == 200 and not isinstance(data, dict): return None
+            CACHE.guardar(id_contrato, r.status_code, r.content, r.headers)  # solo 200/404
+            return data
+    return entrada["data"]
+
 def obtener_pendientes():
     try:
         conn = mysql.connector.connect(**DB_CONFIG)
@@ -98,9 +139,8 @@ def guardar_en_bd(id_contrato, miembros):
 def descargar_pdf_inteligente(id_contrato):
     try:
         # 1. Metadata
-        r = requests.get(URL_METADATA.format(id_contrato), headers=HEADERS, verify=False, timeout=10)
-        if r.status_code != 200: return None
-        data = r.json()
+        data = obtener_metadata(id_contrato)
+        if not data: return None
         
         # 2. Búsqueda de ID (Prioridad al Anexo/Consorcio)
         id_doc = None
@@ -115,7 +155,9 @@ def descargar_pdf_inteligente(id_contrato):
         ruta_final = os.path.join(CARPETA_EVIDENCIA, nombre_archivo)
         
         # 3. Descarga (Stream)
-        with requests.get(URL_DESCARGA.format(id_doc), headers=HEADERS, stream=True, verify=False, timeout=60) as r_down:
+        r_down = consultar_prod4(URL_DESCARGA.format(id_doc), stream=True, timeout=60)
+        if r_down is None: return None
+        with r_down:
             if r_down.status_code == 200:
                 with open(ruta_final, 'wb') as f:
                     for chunk in r_down.iter_content(chunk_size=8192):
@@ -155,9 +197,12 @@ def analizar_con_ia(ruta_pdf):
         print(f"   ⚖️ Detectado archivo de {peso_mb:.2f} MB. Activando recorte...")
         archivo_a_subir, es_recorte = recortar_pdf(ruta_pdf)
 
-    # 2. Intentos con Backoff
+    # 2. Intentos con Backoff (el breaker de CONTROL_GEMINI decide cuánto esperar tras un 429)
     intentos = 0
-    while intentos < 3:
+    while intentos < REINTENTOS_GEMINI:
+        CONTROL_GEMINI.entrar()
+        inicio = time.monotonic()
+        registrado = False
         try:
             print(f"   🤖 Enviando a Gemini 2.0 Flash (Intento {intentos+1})...")
             archivo = genai.upload_file(archivo_a_subir, mime_type='application/pdf')
@@ -172,6 +217,8 @@ def analizar_con_ia(ruta_pdf):
 
             if archivo.state.name == "FAILED": 
                 print("   ❌ Google marcó FAILED.")
+                CONTROL_GEMINI.registrar(ERROR)
+                registrado = True
                 return None
 
             # Prompt
@@ -189,6 +236,8 @@ def analizar_con_ia(ruta_pdf):
             """
             
             res = model.generate_content([archivo, prompt])
+            CONTROL_GEMINI.registrar(OK, time.monotonic() - inicio)
+            registrado = True
             
             # Limpieza nube
             try: genai.delete_file(archivo.name)
@@ -204,11 +253,16 @@ def analizar_con_ia(ruta_pdf):
 
         except Exception as e:
             msg = str(e)
-            if "429" in msg or "Resource exhausted" in msg:
-                print(f"   🛑 Tráfico alto (429). Esperando 30s...")
-                time.sleep(30)
+            if registrado:
+                pass  # falló después de la respuesta (p. ej. JSON inválido): no es culpa de Gemini
+            elif "429" in msg or "Resource exhausted" in msg:
+                CONTROL_GEMINI.registrar(SOBRECARGA)
+                print(f"   🛑 Tráfico alto (429). Pausa de Gemini: {CONTROL_GEMINI}")
                 intentos += 1
-            elif "400" in msg:
+                continue
+            else:
+                CONTROL_GEMINI.registrar(ERROR)
+            if "400" in msg:
                  print("   ❌ Error 400 (Archivo corrupto/complejo).")
                  return None
             else:
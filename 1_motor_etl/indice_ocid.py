@@ -0,0 +1,195 @@
+"""
+Índice de ocid entre meses (1_database/indice_ocid.db).
+
+Pre-pasada del cargador: por cada mes guarda, para cada registro de los tipos de procedimiento
+que se cargan, (ocid, id_convocatoria, fecha del compiledRelease, posición). Con eso el cargador
+escribe solo la versión más nueva de cada ocid y el resultado no depende del orden de los archivos
+ni de cuántos workers haya.
+
+La posición es el offset en bytes del registro dentro del JSON (fuente 'json') o su número de
+registro en las partes NDJSON (fuente 'ndjson') cuando el JSON ya se borró.
+Solo se reindexan los meses cuyo tamaño, fecha de modificación o conjunto de tipos cambió.
+Cada ocurrencia guarda si pasa validador.py: una versión que el cargador manda a cuarentena no
+cuenta como "la más nueva", así el ocid se carga desde la última versión válida de otro mes.
+"""
+import os
+import time
+import sqlite3
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set
+
+import motor_parseo
+import almacen_ndjson
+import validador
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(script_dir)
+RUTA_INDICE = os.path.join(parent_dir, "1_database", "indice_ocid.db")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS archivos (
+    nombre_archivo  TEXT PRIMARY KEY,
+    fuente          TEXT,
+    bytes           INTEGER,
+    mtime           REAL,
+    registros       INTEGER,
+    indexado        TEXT,
+    tipos           TEXT,
+    validado        INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS ocurrencias (
+    ocid            TEXT NOT NULL,
+    nombre_archivo  TEXT NOT NULL,
+    id_convocatoria TEXT,
+    fecha           TEXT,
+    posicion        INTEGER,
+    largo           INTEGER,
+    valido          INTEGER DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_ocurrencias_ocid ON ocurrencias (ocid);
+CREATE INDEX IF NOT EXISTS idx_ocurrencias_archivo ON ocurrencias (nombre_archivo);
+CREATE INDEX IF NOT EXISTS idx_ocurrencias_convocatoria ON ocurrencias (id_convocatoria);
+"""
+
+def conectar(ruta: Optional[str] = None) -> sqlite3.Connection:
+    ruta = ruta or RUTA_INDICE
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    conn = sqlite3.connect(ruta, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(ESQUEMA)
+    for tabla, columna in (("archivos", "tipos TEXT"), ("archivos", "validado INTEGER DEFAULT 0"),
+                           ("ocurrencias", "valido INTEGER DEFAULT 1")):
+        try: conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna}")
+        except sqlite3.OperationalError: pass  # ya existe
+    return conn
+
+TIPOS_LEGADO = "Licitación Pública"  # meses indexados antes de guardar los tipos
+
+def _clave_tipos(tipos: Optional[Iterable[str]]) -> str:
+    return "*" if tipos is None else "|".join(sorted(tipos))
+
+def _origen(ruta_json: str) -> Optional[Dict]:
+    """Fuente que se indexa: el JSON si existe (offsets para mmap), si no las partes NDJSON."""
+    if os.path.exists(ruta_json):
+        st = os.stat(ruta_json)
+        return {"fuente": "json", "bytes": st.st_size, "mtime": st.st_mtime}
+    indice = almacen_ndjson.leer_indice(os.path.basename(ruta_json)[:-5], almacen_ndjson.raiz_de(ruta_json, None))
+    if indice:
+        return {"fuente": "ndjson", "bytes": indice["origen"]["bytes"], "mtime": indice["origen"]["mtime"]}
+    return None
+
+def escanear(ruta_json: str, tipos: Optional[Iterable[str]], fuente: str = "json") -> List[tuple]:
+    """Filas (ocid, id_convocatoria, fecha, posicion, largo, valido) de un mes (tipos None = todos). Corre en un proceso aparte."""
+    tipos = tuple(tipos) if tipos is not None else None
+    patron = motor_parseo.patron_tipos(tipos) if tipos is not None else None
+    if fuente == "json":
+        registros = motor_parseo.iterar_json_con_posicion(ruta_json, patron)
+    else:
+        raiz = almacen_ndjson.raiz_de(ruta_json, None)
+        nombre_base = os.path.basename(ruta_json)[:-5]
+        registros = ((n, None, r) for n, r in almacen_ndjson.iterar_registros_con_numero(nombre_base, raiz, patron))
+    filas = []
+    for posicion, largo, r in registros:
+        if tipos is not None and validador.tipo_procedimiento(r) not in tipos: continue
+        ocid = r.get("ocid") if isinstance(r, dict) else None
+        if not ocid: continue
+        compiled = r.get("compiledRelease")
+        compiled = compiled if isinstance(compiled, dict) else {}
+        tender = compiled.get("tender")
+        tender = tender if isinstance(tender, dict) else {}
+        errores, _ = validador.validar(r)
+        fecha = compiled.get("date")
+        filas.append((str(ocid)[:100], str(tender.get("id") or "")[:100] or None, fecha if isinstance(fecha, str) else None,
+                      posicion, largo, 0 if errores else 1))
+    return filas
+
+def _escanear_trabajo(args):
+    ruta_json, tipos, fuente = args
+    return ruta_json, escanear(ruta_json, tipos, fuente)
+
+def actualizar(rutas_json: Iterable[str], tipos: Optional[Iterable[str]], procesos: int = 1, ruta: Optional[str] = None) -> int:
+    """Reindexa los meses nuevos o modificados (tipos None = todos). Devuelve cuántos se reindexaron."""
+    tipos = tuple(tipos) if tipos is not None else None
+    clave = _clave_tipos(tipos)
+    conn = conectar(ruta)
+    try:
+        previos = {f["nombre_archivo"]: f for f in conn.execute("SELECT * FROM archivos")}
+        trabajos, origenes = [], {}
+        for ruta_json in rutas_json:
+            nombre = os.path.basename(ruta_json)
+            origen = _origen(ruta_json)
+            if origen is None: continue
+            previo = previos.get(nombre)
+            if previo and previo["validado"] and (previo["fuente"], previo["bytes"], previo["mtime"], previo["tipos"] or TIPOS_LEGADO) == (origen["fuente"], origen["bytes"], origen["mtime"], clave):
+                continue
+            origenes[nombre] = origen
+            trabajos.append((ruta_json, tipos, origen["fuente"]))
+        if not trabajos: return 0
+
+        logging.info(f"🗂️ Indexando ocid de {len(trabajos)} meses...")
+        def guardar(ruta_json, filas):
+            nombre = os.path.basename(ruta_json)
+            origen = origenes[nombre]
+            with conn:
+                conn.execute("DELETE FROM ocurrencias WHERE nombre_archivo = ?", (nombre,))
+                conn.executemany(
+                    "INSERT INTO ocurrencias (ocid, nombre_archivo, id_convocatoria, fecha, posicion, largo, valido) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(o, nombre, idc, fecha, pos, largo, valido) for o, idc, fecha, pos, largo, valido in filas]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO archivos (nombre_archivo, fuente, bytes, mtime, registros, indexado, tipos, validado) VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                    (nombre, origen["fuente"], origen["bytes"], origen["mtime"], len(filas), time.strftime("%Y-%m-%dT%H:%M:%S"), clave)
+                )
+
+        if procesos > 1 and len(trabajos) > 1:
+            with ProcessPoolExecutor(max_workers=procesos) as exe:
+                for ruta_json, filas in exe.map(_escanear_trabajo, trabajos):
+                    guardar(ruta_json, filas)
+        else:
+            for trabajo in trabajos:
+                guardar(*_escanear_trabajo(trabajo))
+        return len(trabajos)
+    finally:
+        conn.close()
+
+def reemplazados(nombre_archivo: str, ruta: Optional[str] = None) -> Set[str]:
+    """
+    ocids de este mes cuya versión más nueva está en otro mes: el cargador no los escribe.
+    Más nueva = mayor fecha de compiledRelease; a igual fecha gana el archivo de nombre mayor.
+    Solo compiten las versiones válidas de los otros meses: si la más nueva va a cuarentena, se carga esta.
+    Un ocid que no está en el índice no aparece aquí, así que con el índice desactualizado se carga igual.
+    """
+    ruta = ruta or RUTA_INDICE
+    if not os.path.exists(ruta): return set()
+    conn = conectar(ruta)
+    try:
+        filas = conn.execute("""
+            WITH mio AS (
+                SELECT ocid, MAX(COALESCE(fecha, '')) AS fecha FROM ocurrencias
+                WHERE nombre_archivo = ? GROUP BY ocid
+            )
+            SELECT mio.ocid FROM mio WHERE EXISTS (
+                SELECT 1 FROM ocurrencias p
+                WHERE p.ocid = mio.ocid AND p.nombre_archivo <> ? AND p.valido = 1
+                  AND (COALESCE(p.fecha, '') > mio.fecha OR (COALESCE(p.fecha, '') = mio.fecha AND p.nombre_archivo > ?))
+            )
+        """, (nombre_archivo, nombre_archivo, nombre_archivo))
+        return {f[0] for f in filas}
+    finally:
+        conn.close()
+
+def olvidar(nombres_vigentes: Iterable[str], ruta: Optional[str] = None) -> int:
+    """Quita del índice los meses que ya no están en la entrada (para que no sigan ganando)."""
+    vigentes = set(nombres_vigentes)
+    conn = conectar(ruta)
+    try:
+        sobran = [f[0] for f in conn.execute("SELECT nombre_archivo FROM archivos") if f[0] not in vigentes]
+        with conn:
+            for nombre in sobran:
+                conn.execute("DELETE FROM ocurrencias WHERE nombre_archivo = ?", (nombre,))
+                conn.execute("DELETE FROM archivos WHERE nombre_archivo = ?", (nombre,))
+        return len(sobran)
+    finally:
+        conn.close()
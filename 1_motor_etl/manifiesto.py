@@ -0,0 +1,144 @@
+"""
+Manifiesto del data lake (1_database/manifiesto.db).
+
+Lo escribe descargador.py y lo leen cargador.py y el router /api/etl:
+- descargas: estado actual de cada mes (URL, validadores HTTP, bytes, digests, formato, verificación SHA).
+- historial_descargas: un registro por intento, para ver el throughput de OECE en el tiempo.
+SQLite local: no requiere credenciales de MySQL y sobrevive a que la BD esté caída.
+"""
+import os
+import json
+import time
+import sqlite3
+from typing import Dict, List, Optional, Set
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(script_dir)
+RUTA_MANIFIESTO = os.path.join(parent_dir, "1_database", "manifiesto.db")
+
+COLUMNAS = (
+    "anio", "mes", "url", "sha_url", "etag", "last_modified", "content_length", "formato", "algoritmo",
+    "digest_crudo", "digest_json", "sha_verificado", "bytes_json", "disponible",
+    "estado", "mensaje", "duracion_s", "actualizado", "parcial",
+)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS descargas (
+    nombre_base     TEXT PRIMARY KEY,
+    anio            INTEGER,
+    mes             INTEGER,
+    url             TEXT,
+    sha_url         TEXT,
+    etag            TEXT,
+    last_modified   TEXT,
+    content_length  INTEGER,
+    formato         TEXT,
+    algoritmo       TEXT,
+    digest_crudo    TEXT,
+    digest_json     TEXT,
+    sha_verificado  INTEGER,
+    bytes_json      INTEGER,
+    disponible      INTEGER DEFAULT 0,
+    estado          TEXT,
+    mensaje         TEXT,
+    duracion_s      REAL,
+    actualizado     TEXT,
+    parcial         TEXT
+);
+CREATE TABLE IF NOT EXISTS historial_descargas (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre_base  TEXT NOT NULL,
+    inicio       TEXT NOT NULL,
+    duracion_s   REAL,
+    bytes_red    INTEGER,
+    estado       TEXT,
+    mensaje      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_historial_inicio ON historial_descargas (inicio);
+"""
+
+def conectar(ruta: Optional[str] = None) -> sqlite3.Connection:
+    ruta = ruta or RUTA_MANIFIESTO
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    conn = sqlite3.connect(ruta, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(ESQUEMA)
+    return conn
+
+def _fila_a_dict(fila: sqlite3.Row) -> Dict:
+    d = {k: fila[k] for k in fila.keys() if fila[k] is not None}
+    if "parcial" in d: d["parcial"] = json.loads(d["parcial"])
+    if "sha_verificado" in d: d["sha_verificado"] = bool(d["sha_verificado"])
+    return d
+
+def leer(nombre_base: str, ruta: Optional[str] = None) -> Dict:
+    conn = conectar(ruta)
+    try:
+        fila = conn.execute("SELECT * FROM descargas WHERE nombre_base = ?", (nombre_base,)).fetchone()
+        return _fila_a_dict(fila) if fila else {}
+    finally:
+        conn.close()
+
+def guardar(nombre_base: str, meta: Dict, ruta: Optional[str] = None):
+    """Upsert del estado de un mes. Las claves de meta que no son columnas se ignoran."""
+    valores = {k: meta.get(k) for k in COLUMNAS}
+    if valores["parcial"] is not None: valores["parcial"] = json.dumps(valores["parcial"])
+    if valores["anio"] is None and nombre_base[:4].isdigit():
+        valores["anio"], valores["mes"] = int(nombre_base[:4]), int(nombre_base[5:7])
+
+    columnas = ", ".join(COLUMNAS)
+    marcas = ", ".join("?" for _ in COLUMNAS)
+    actualizacion = ", ".join(f"{c}=excluded.{c}" for c in COLUMNAS)
+    conn = conectar(ruta)
+    try:
+        with conn:
+            conn.execute(
+                f"INSERT INTO descargas (nombre_base, {columnas}) VALUES (?, {marcas}) "
+                f"ON CONFLICT(nombre_base) DO UPDATE SET {actualizacion}",
+                (nombre_base, *[valores[c] for c in COLUMNAS])
+            )
+    finally:
+        conn.close()
+
+def registrar_intento(nombre_base: str, inicio: float, duracion_s: float, bytes_red: int,
+                      estado: str, mensaje: str = "", ruta: Optional[str] = None):
+    conn = conectar(ruta)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO historial_descargas (nombre_base, inicio, duracion_s, bytes_red, estado, mensaje) VALUES (?, ?, ?, ?, ?, ?)",
+                (nombre_base, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(inicio)), round(duracion_s, 3), bytes_red, estado, mensaje)
+            )
+            conn.execute("UPDATE descargas SET estado = ?, mensaje = ?, duracion_s = ? WHERE nombre_base = ?",
+                         (estado, mensaje, round(duracion_s, 3), nombre_base))
+    finally:
+        conn.close()
+
+def listar(ruta: Optional[str] = None) -> List[Dict]:
+    conn = conectar(ruta)
+    try:
+        return [_fila_a_dict(f) for f in conn.execute("SELECT * FROM descargas ORDER BY nombre_base")]
+    finally:
+        conn.close()
+
+def rechazados(ruta: Optional[str] = None) -> Set[str]:
+    """nombre_base de los meses cuyo último JSON no coincidió con su SHA (el archivo quedó en cuarentena)."""
+    conn = conectar(ruta)
+    try:
+        return {f["nombre_base"] for f in conn.execute("SELECT nombre_base FROM descargas WHERE sha_verificado = 0")}
+    finally:
+        conn.close()
+
+def archivos_disponibles(ruta: Optional[str] = None) -> List[Dict]:
+    """Meses con JSON final en disco y SHA no rechazado: lo que el cargador puede procesar."""
+    conn = conectar(ruta)
+    try:
+        filas = conn.execute("""
+            SELECT * FROM descargas
+            WHERE disponible = 1 AND (sha_verificado IS NULL OR sha_verificado = 1)
+            ORDER BY nombre_base
+        """)
+        return [_fila_a_dict(f) for f in filas]
+    finally:
+        conn.close()
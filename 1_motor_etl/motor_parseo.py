@@ -0,0 +1,214 @@
+"""
+Motor de parseo de los JSON OCDS de SEACE.
+
+En vez de construir un dict por cada registro con ijson y recién ahí descartar los que no son
+del tipo de procedimiento buscado, el archivo se corta en trozos de bytes (un trozo = un registro),
+se descartan a nivel de bytes los que no contienen el tipo buscado y solo el resto se parsea con
+orjson (o json si orjson no está instalado).
+
+Corte de registros: la secuencia  },{"ocid":  nunca puede estar dentro de un string JSON
+(la comilla sin escapar lo cerraría y lo que sigue no sería JSON válido), así que es un punto
+de corte candidato exacto. Entre candidatos se lleva la profundidad real de llaves/corchetes
+ignorando los strings, y se corta donde vuelve a cero.
+Si el archivo no es un record package reconocible se usa ijson con el backend más rápido disponible.
+"""
+import re
+import json
+import logging
+from itertools import chain
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import ijson
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- 1. BACKENDS ---
+def _elegir_backend_ijson():
+    for nombre in ("yajl2_c", "yajl2_cffi", "yajl2", "python"):
+        try:
+            return ijson.get_backend(nombre)
+        except Exception:
+            continue
+    return ijson
+
+BACKEND_IJSON = _elegir_backend_ijson()
+_loads = orjson.loads if orjson is not None else json.loads
+
+def describir_backend() -> str:
+    trozos = "orjson" if orjson is not None else "json"
+    return f"trozos+{trozos}, respaldo ijson/{getattr(BACKEND_IJSON, 'backend_name', '?')}"
+
+# --- 2. PREFILTRO EN BYTES ---
+def patron_tipos(tipos: Iterable[str]) -> "re.Pattern[bytes]":
+    """
+    Regex de bytes que encuentra "<tipo>" tal como puede venir escrito en el JSON:
+    UTF-8 directo o con escapes \\uXXXX (en minúsculas o mayúsculas). Es un filtro conservador:
+    el valor exacto del campo se sigue comprobando sobre el registro ya parseado.
+    """
+    alternativas = []
+    for tipo in tipos:
+        partes = []
+        for ch in tipo:
+            if ord(ch) < 128:
+                partes.append(re.escape(ch.encode()))
+                continue
+            hexa = f"{ord(ch):04x}".encode()
+            escape = rb"\\u" + b"".join(b"[%c%c]" % (c, c ^ 0x20) if c >= ord("a") else bytes([c]) for c in hexa)
+            partes.append(b"(?:" + re.escape(ch.encode("utf-8")) + b"|" + escape + b")")
+        alternativas.append(b'"' + b"".join(partes) + b'"')
+    return re.compile(b"|".join(alternativas))
+
+# --- 3. CORTE DE REGISTROS ---
+BLOQUE_LECTURA = 16 * 1024 * 1024
+LIMITE_CABECERA = 64 * 1024 * 1024  # hasta dónde se busca el inicio de "records"
+
+INICIO_RECORDS = re.compile(rb'"records"\s*:\s*\[\s*')
+ANCLA = re.compile(rb'\}(\s*,\s*)\{\s*"ocid"\s*:')
+FIN_ARREGLO = re.compile(rb'\}\s*\]')
+_NO_ESTRUCTURA = bytes(c for c in range(256) if c not in b'"{}[]')
+_CADENA = re.compile(rb'"[^"]*"')
+
+class FormatoNoSoportado(Exception):
+    pass
+
+def _estructura(trozo: bytes) -> Optional[Tuple[int, int]]:
+    """
+    (variación de profundidad, cuánto baja como máximo) de llaves/corchetes fuera de strings.
+    None si el trozo termina dentro de un string. El trozo debe empezar fuera de un string.
+    Todo son operaciones de bytes en C: se quitan los escapes que afectan comillas, se deja solo
+    el esqueleto "{}[], se borran los strings y luego los pares {} [] hasta que solo quedan
+    cierres seguidos de aperturas.
+    """
+    if b'\\"' in trozo:
+        trozo = trozo.replace(b"\\\\", b"").replace(b'\\"', b"")
+    esqueleto = trozo.translate(None, _NO_ESTRUCTURA).replace(b'""', b"")
+    if b'"' in esqueleto:  # algún string contiene llaves o corchetes: camino exacto
+        esqueleto = _CADENA.sub(b"", esqueleto)
+        if b'"' in esqueleto: return None
+    while True:
+        reducido = esqueleto.replace(b"{}", b"").replace(b"[]", b"")
+        if len(reducido) == len(esqueleto): break
+        esqueleto = reducido
+    aperturas = len(esqueleto.lstrip(b"}]"))
+    cierres = len(esqueleto) - aperturas
+    return aperturas - cierres, cierres
+
+def _inicio_registros(f: BinaryIO, tam_bloque: int):
+    """(buffer, posición del primer registro en el buffer, offset del buffer en el archivo)."""
+    buf = f.read(tam_bloque)
+    base = 0
+    if buf.startswith(b"\xef\xbb\xbf"): buf, base = buf[3:], 3
+    sin_espacios = buf.lstrip()
+    if sin_espacios.startswith(b"["):  # arreglo suelto de registros
+        return buf, len(buf) - len(sin_espacios) + 1, base
+    while True:
+        m = INICIO_RECORDS.search(buf)
+        if m: return buf, m.end(), base
+        mas = f.read(tam_bloque) if len(buf) < LIMITE_CABECERA else b""
+        if not mas: raise FormatoNoSoportado("No se encontró el arreglo 'records'")
+        buf += mas
+
+def _cerrar_ultimo(buf: bytes, inicio: int, seg: int, acum: int, hasta: Optional[int] = None) -> bytes:
+    """El último registro no tiene ancla después: termina en el } seguido del ] que cierra el arreglo."""
+    for m in FIN_ARREGLO.finditer(buf, seg, hasta if hasta is not None else len(buf)):
+        fin = m.start() + 1
+        e = _estructura(buf[seg:fin])
+        if e is not None and acum + e[0] == 0:
+            return buf[inicio:fin]
+    raise ValueError("JSON truncado: no se encontró el cierre del arreglo de registros")
+
+def trozos_con_posicion(f: BinaryIO, tam_bloque: int = BLOQUE_LECTURA) -> Iterator[Tuple[int, bytes]]:
+    """(offset en el archivo, bytes) de cada registro de un record package OCDS (o de un arreglo suelto)."""
+    buf, pos, base = _inicio_registros(f, tam_bloque)
+    while True:
+        while pos < len(buf) and buf[pos] in b" \t\r\n": pos += 1
+        if pos < len(buf): break
+        mas = f.read(tam_bloque)
+        if not mas: return
+        buf += mas
+    if buf[pos:pos + 1] == b"]": return
+    if buf[pos:pos + 1] != b"{": raise FormatoNoSoportado("El arreglo de registros no contiene objetos")
+
+    inicio = seg = pos   # inicio del registro actual / inicio del segmento aún no contado
+    acum = 0
+    while True:
+        for m in ANCLA.finditer(buf, seg):
+            fin = m.start() + 1
+            d, baja = _estructura(buf[seg:fin])
+            if acum - baja < 0:  # el arreglo de registros se cerró dentro de este segmento
+                yield base + inicio, _cerrar_ultimo(buf, inicio, seg, acum, fin)
+                return
+            acum += d
+            seg = m.end(1)
+            if acum == 0:
+                yield base + inicio, buf[inicio:fin]
+                inicio = seg
+        mas = f.read(tam_bloque)
+        if not mas: break
+        buf = buf[inicio:] + mas
+        base += inicio
+        seg -= inicio
+        inicio = 0
+    yield base + inicio, _cerrar_ultimo(buf, inicio, seg, acum)
+
+def trozos_registros(f: BinaryIO, tam_bloque: int = BLOQUE_LECTURA) -> Iterator[bytes]:
+    """Bytes de cada registro, leyendo por bloques."""
+    for _, trozo in trozos_con_posicion(f, tam_bloque):
+        yield trozo
+
+def cargar_trozo(trozo: bytes) -> List[Dict]:
+    """Un trozo es normalmente un registro; si algún registro no empieza por "ocid" pueden venir varios juntos."""
+    try:
+        return [_loads(trozo)]
+    except ValueError:
+        return _loads(b"[" + trozo + b"]")
+
+# --- 4. ITERADORES ---
+def _iterar_ijson(f: BinaryIO) -> Iterator[Dict]:
+    parser = BACKEND_IJSON.items(f, "records.item", use_float=True)
+    primer = next(parser, None)
+    if primer is None:
+        f.seek(0)
+        parser = BACKEND_IJSON.items(f, "item", use_float=True)
+    else:
+        parser = chain([primer], parser)
+    yield from parser
+
+def iterar_json_con_posicion(ruta_json: str, patron: Optional["re.Pattern[bytes]"] = None) -> Iterator[Tuple[Optional[int], Optional[int], Dict]]:
+    """
+    (offset, largo, registro) de un JSON OCDS: archivo[offset:offset+largo] es el texto del registro.
+    Si un trozo trae varios registros comparten offset/largo; con el respaldo ijson ambos son None.
+    """
+    with open(ruta_json, "rb") as f:
+        trozos = trozos_con_posicion(f)
+        try:
+            primero = next(trozos, None)
+        except FormatoNoSoportado as e:
+            logging.debug(f"{ruta_json}: {e}. Usando ijson.")
+            f.seek(0)
+            for r in _iterar_ijson(f):
+                yield None, None, r
+            return
+        if primero is None: return
+        for offset, trozo in chain([primero], trozos):
+            if patron is not None and not patron.search(trozo): continue
+            for r in cargar_trozo(trozo):
+                yield offset, len(trozo), r
+
+def iterar_json(ruta_json: str, patron: Optional["re.Pattern[bytes]"] = None) -> Iterator[Dict]:
+    """
+    Registros de un JSON OCDS. Con 'patron' solo se parsean los trozos que lo contienen
+    (los registros devueltos pueden igual no cumplir el filtro: es un prefiltro).
+    """
+    for _, _, r in iterar_json_con_posicion(ruta_json, patron):
+        yield r
+
+def iterar_lineas(lineas: Iterable[bytes], patron: Optional["re.Pattern[bytes]"] = None) -> Iterator[Dict]:
+    """Mismo prefiltro sobre NDJSON (una línea = un registro)."""
+    for linea in lineas:
+        if not linea.strip(): continue
+        if patron is not None and not patron.search(linea): continue
+        yield _loads(linea)
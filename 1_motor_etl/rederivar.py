@@ -0,0 +1,182 @@
+"""
+Re-deriva columnas de Licitaciones_Cabecera cuando cambia una regla de reglas_mapeo,
+sin volver a descargar ni recargar los meses.
+
+Por cada mes cargado compara versiones_reglas con las versiones actuales. Las reglas
+desactualizadas se vuelven a aplicar sobre los registros guardados en disco (caché Parquet si está
+vigente, si no partes NDJSON o el JSON) y solo las filas cuyo valor cambió se suben a una tabla
+temporal y se aplican con un único UPDATE ... JOIN por mes.
+Solo se tocan las filas cuyo archivo_origen es el mes: son las que salieron de ese registro.
+Cada mes se filtra con los tipos de procedimiento con que se cargó (control_cargas.tipos_cargados),
+no con los de CARGADOR_TIPOS, porque versiones_reglas marca el mes completo.
+
+Los meses cargados antes de versiones_reglas no tienen versiones: la primera pasada revisa todo
+(y escribe solo lo que difiere). Las huellas de huellas_registros no se recalculan, así que en la
+próxima recarga del mes esas filas cuentan como actualizadas una vez.
+
+Uso:
+    python rederivar.py                                   # reglas con versión nueva, todos los meses
+    python rederivar.py --reglas estado --simular         # cuenta cambios sin escribir
+    python rederivar.py --reglas estado --meses 2024-01_seace_v3.json --forzar
+"""
+import os
+import time
+import logging
+import argparse
+from typing import Dict, Iterator, List, Tuple
+
+import cargador
+import reglas_mapeo
+import cache_parquet
+import almacen_ndjson
+from cargador import safe_str, TIPO_DEFECTO, CARPETA_ENTRADA
+
+LOTE_STAGING = 5000
+EJEMPLOS_SIMULACION = 5
+
+# --- 1. REGISTROS GUARDADOS ---
+def _desde_parquet(nombre_base: str, reglas: List[str], tipos) -> Iterator[Tuple[str, Dict]]:
+    """(id_convocatoria, dict con forma de compiledRelease) reconstruido desde la caché columnar."""
+    columnas = ["ocid", "id_convocatoria", "tipo_procedimiento", "categoria", "estado_tender", "estado_item", "comprador_id"]
+    partes_de = {}
+    if "ubicacion" in reglas:
+        for p in cache_parquet.filas_mes("partes", nombre_base, ["ocid", "id_parte", "departamento", "provincia", "distrito"]):
+            partes_de.setdefault(p["ocid"], []).append({
+                "id": p["id_parte"],
+                "address": {"department": p["departamento"], "region": p["provincia"], "locality": p["distrito"]},
+            })
+    for f in cache_parquet.filas_mes("licitaciones", nombre_base, columnas):
+        if tipos is not None and f["tipo_procedimiento"] not in tipos: continue
+        if not f["id_convocatoria"]: continue
+        yield safe_str(f["id_convocatoria"], 100), {
+            "tender": {"mainProcurementCategory": f["categoria"], "status": f["estado_tender"],
+                       "items": [{"statusDetails": f["estado_item"]}] if f["estado_item"] is not None else []},
+            "buyer": {"id": f["comprador_id"]},
+            "parties": partes_de.get(f["ocid"], []),
+        }
+
+def _desde_registros(ruta_json: str, tipos) -> Iterator[Tuple[str, Dict]]:
+    for r in almacen_ndjson.iterar_registros_archivo(ruta_json, patron=cargador.patron_de(tipos)):
+        if not r: continue
+        compiled = r.get('compiledRelease', {})
+        tender = compiled.get('tender', {})
+        if tipos is not None and tender.get('procurementMethodDetails') not in tipos: continue
+        id_conv = safe_str(tender.get('id'), 100)
+        if id_conv: yield id_conv, compiled
+
+def registros_guardados(archivo: str, reglas: List[str], tipos):
+    """(fuente, iterador) con la fuente más barata disponible para el mes, o (None, None)."""
+    ruta_json = os.path.join(CARPETA_ENTRADA, archivo)
+    if cache_parquet.disponible() and cache_parquet.vigente(ruta_json, tipos):
+        return "parquet", _desde_parquet(archivo[:-5], reglas, tipos)
+    if cache_parquet.firma_origen(ruta_json) is not None:
+        return "registros", _desde_registros(ruta_json, tipos)
+    return None, None
+
+# --- 2. VERSIONES ---
+def tipos_cargados(cursor, archivo: str):
+    """Tipos con que se cargó el mes (None = todos); las filas previas sin clave son de Licitación Pública."""
+    cursor.execute("SELECT tipos_cargados FROM control_cargas WHERE nombre_archivo = %s", (archivo,))
+    fila = cursor.fetchone()
+    return cargador.leer_tipos(((fila[0] if fila else None) or TIPO_DEFECTO).split("|"))
+
+def reglas_pendientes(cursor, archivo: str, reglas: List[str], forzar: bool) -> List[str]:
+    if forzar: return list(reglas)
+    cursor.execute("SELECT regla, version FROM versiones_reglas WHERE nombre_archivo = %s", (archivo,))
+    aplicadas = dict(cursor.fetchall())
+    return [r for r in reglas if aplicadas.get(r) != reglas_mapeo.REGLAS[r].version]
+
+# --- 3. RE-DERIVACIÓN ---
+def rederivar_mes(conn, archivo: str, reglas: List[str], simular: bool = False) -> Dict:
+    """Recalcula las columnas de 'reglas' para las filas del mes y escribe solo las que cambiaron."""
+    columnas = reglas_mapeo.columnas(reglas)
+    cursor = conn.cursor()
+    try:
+        fuente, registros = registros_guardados(archivo, reglas, tipos_cargados(cursor, archivo))
+        if fuente is None:
+            raise FileNotFoundError(f"{archivo}: no hay JSON, partes NDJSON ni caché Parquet en disco")
+
+        cursor.execute(f"SELECT id_convocatoria, {', '.join(columnas)} FROM Licitaciones_Cabecera WHERE archivo_origen = %s", (archivo,))
+        actuales = {fila[0]: tuple(fila[1:]) for fila in cursor.fetchall()}
+
+        nuevos = {}
+        for id_conv, compiled in registros:
+            if id_conv not in actuales: continue
+            d = reglas_mapeo.derivar(compiled, reglas)
+            nuevos[id_conv] = tuple(d[c] for c in columnas)  # a igual id gana el último, como en la carga
+        cambios = [(id_conv, *valores) for id_conv, valores in nuevos.items() if valores != actuales[id_conv]]
+
+        por_columna = {c: sum(1 for f in cambios if f[i + 1] != actuales[f[0]][i]) for i, c in enumerate(columnas)}
+        resumen = {"fuente": fuente, "revisadas": len(nuevos), "cambiadas": len(cambios), "por_columna": por_columna}
+        if simular:
+            resumen["ejemplos"] = [(f[0], actuales[f[0]], f[1:]) for f in cambios[:EJEMPLOS_SIMULACION]]
+            return resumen
+
+        if cambios:
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS stg_rederivar")
+            cursor.execute(f"CREATE TEMPORARY TABLE stg_rederivar SELECT id_convocatoria, {', '.join(columnas)} FROM Licitaciones_Cabecera LIMIT 0")
+            cursor.execute("ALTER TABLE stg_rederivar ADD PRIMARY KEY (id_convocatoria)")
+            marcas = ", ".join(["%s"] * (len(columnas) + 1))
+            for i in range(0, len(cambios), LOTE_STAGING):
+                cursor.executemany(f"INSERT INTO stg_rederivar (id_convocatoria, {', '.join(columnas)}) VALUES ({marcas})",
+                                   cambios[i:i + LOTE_STAGING])
+            sets = ", ".join(f"c.{col} = s.{col}" for col in columnas)
+            cursor.execute(f"""
+                UPDATE Licitaciones_Cabecera c JOIN stg_rederivar s ON s.id_convocatoria = c.id_convocatoria
+                SET {sets} WHERE c.archivo_origen = %s
+            """, (archivo,))
+            cursor.execute("DROP TEMPORARY TABLE stg_rederivar")
+        cargador.registrar_versiones_reglas(cursor, archivo, reglas)
+        conn.commit()
+        return resumen
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Re-deriva columnas tras cambiar reglas de mapeo, sin recargar")
+    parser.add_argument("--reglas", nargs="+", choices=sorted(reglas_mapeo.REGLAS), default=sorted(reglas_mapeo.REGLAS))
+    parser.add_argument("--meses", nargs="+", default=None, help="Archivos (p. ej. 2024-01_seace_v3.json); por defecto todos los cargados")
+    parser.add_argument("--forzar", action="store_true", help="Re-deriva aunque la versión registrada sea la actual")
+    parser.add_argument("--simular", action="store_true", help="Solo cuenta y muestra los cambios, sin escribir")
+    args = parser.parse_args()
+
+    logging.info(f"🚀 REDERIVAR ({', '.join(f'{r} v{reglas_mapeo.REGLAS[r].version}' for r in args.reglas)})"
+                 + (" [simulación]" if args.simular else ""))
+    conn = cargador.obtener_conexion()
+    try:
+        cargador.preparar_tablas_control(conn)
+        cursor = conn.cursor()
+        cursor.execute("SELECT nombre_archivo FROM control_cargas WHERE estado = 'EXITO' ORDER BY nombre_archivo")
+        archivos = [f[0] for f in cursor.fetchall()]
+        if args.meses:
+            pedidos = {m if m.endswith(".json") else f"{m}.json" for m in args.meses}
+            archivos = [a for a in archivos if a in pedidos]
+
+        total = 0
+        for archivo in archivos:
+            reglas = reglas_pendientes(cursor, archivo, args.reglas, args.forzar)
+            if not reglas: continue
+            inicio = time.time()
+            try:
+                resumen = rederivar_mes(conn, archivo, reglas, args.simular)
+            except Exception as e:
+                logging.error(f"❌ {archivo}: {e}")
+                continue
+            total += resumen["cambiadas"]
+            detalle = ", ".join(f"{c} {n}" for c, n in resumen["por_columna"].items() if n)
+            logging.info(f"🔁 {archivo} [{', '.join(reglas)}] desde {resumen['fuente']}: {resumen['revisadas']} revisadas, "
+                         f"{resumen['cambiadas']} cambiadas" + (f" ({detalle})" if detalle else "") + f" en {time.time() - inicio:.1f}s")
+            for id_conv, antes, despues in resumen.get("ejemplos", []):
+                logging.info(f"   {id_conv}: {antes} -> {despues}")
+        cursor.close()
+        logging.info(f"🏁 {total} filas {'por cambiar' if args.simular else 'actualizadas'}.")
+    except KeyboardInterrupt: logging.warning("🛑 Interrumpido.")
+    finally:
+        if conn.is_connected(): conn.close()
+
+if __name__ == "__main__":
+    main()
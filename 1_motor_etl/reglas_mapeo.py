@@ -0,0 +1,98 @@
+"""
+Reglas de mapeo OCDS -> columnas derivadas de Licitaciones_Cabecera.
+
+Cada regla declara las columnas que produce y una versión. Al corregir una regla (p. ej. los
+estados de BUG_CRITICO_ESTADOS_CORREGIDO.md) se sube su versión: rederivar.py recalcula solo esas
+columnas desde los registros guardados en disco (caché Parquet o partes NDJSON/JSON) y actualiza
+solo las filas cuyo valor cambió, sin vaciar y recargar la base.
+
+cargador.py usa las mismas funciones (derivar) y registra en versiones_reglas con qué versión
+quedó derivado cada mes.
+
+Las reglas reciben el compiledRelease (o un dict con la misma forma); solo leen tender, buyer y parties.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# --- 1. TABLAS DE TRADUCCIÓN ---
+TRADUCTOR_CATEGORIA = {
+    'goods': 'BIENES', 'works': 'OBRAS', 'services': 'SERVICIOS', 'consultingServices': 'CONSULTORIA'
+}
+
+ESTADOS_TENDER = {
+    'active': 'CONVOCADO', 'complete': 'CONTRATADO', 'cancelled': 'CANCELADO', 'unsuccessful': 'DESIERTO',
+    'withdrawn': 'NULO', 'planned': 'PROGRAMADO', 'awarded': 'ADJUDICADO'
+}
+
+def _safe_str(val, max_len=None):
+    if val is None: return ""
+    s = str(val).strip()
+    if max_len and len(s) > max_len: return s[:max_len]
+    return s
+
+# --- 2. REGLAS ---
+def determinar_estado(tender_status, item_status):
+    st_item = _safe_str(item_status)
+    if st_item: return st_item.upper()
+
+    st = _safe_str(tender_status).lower()
+    if not st: return "DESCONOCIDO"
+    return ESTADOS_TENDER.get(st, st.upper())
+
+def traducir_categoria(cat_ingles):
+    cat_safe = _safe_str(cat_ingles)
+    return TRADUCTOR_CATEGORIA.get(cat_safe, cat_safe.upper() if cat_safe else "OTROS")
+
+def ubicacion_comprador(buyer: Dict, parties: List[Dict]) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+    """(ubicacion_completa, departamento, provincia, distrito) de la parte que es el comprador."""
+    for p in parties:
+        if p.get('id') == buyer.get('id'):
+            addr = p.get('address') or {}
+            dep = _safe_str(addr.get('department'), 100)
+            prov = _safe_str(addr.get('region'), 100)
+            dist = _safe_str(addr.get('locality'), 100)
+            partes = [x for x in [dep, prov, dist] if x]
+            return (" / ".join(partes) if partes else "PERU"), dep, prov, dist
+    return "PERU", None, None, None
+
+def _regla_categoria(compiled):
+    return (traducir_categoria((compiled.get('tender') or {}).get('mainProcurementCategory')),)
+
+def _regla_estado(compiled):
+    tender = compiled.get('tender') or {}
+    items = tender.get('items') or []
+    return (determinar_estado(tender.get('status'), items[0].get('statusDetails') if items else None),)
+
+def _regla_ubicacion(compiled):
+    return ubicacion_comprador(compiled.get('buyer') or {}, compiled.get('parties') or [])
+
+class Regla:
+    def __init__(self, nombre, version, columnas, funcion):
+        self.nombre = nombre
+        self.version = version
+        self.columnas = columnas
+        self.funcion = funcion
+
+    def aplicar(self, compiled) -> Dict:
+        return dict(zip(self.columnas, self.funcion(compiled)))
+
+# Subir 'version' cada vez que cambie el resultado de una regla
+REGLAS = {
+    r.nombre: r for r in (
+        Regla("categoria", 1, ("categoria",), _regla_categoria),
+        Regla("estado", 1, ("estado_proceso",), _regla_estado),
+        Regla("ubicacion", 1, ("ubicacion_completa", "departamento", "provincia", "distrito"), _regla_ubicacion),
+    )
+}
+
+def derivar(compiled, reglas: Optional[Iterable[str]] = None) -> Dict:
+    """{columna: valor} de las reglas indicadas (todas por defecto)."""
+    valores = {}
+    for nombre in (reglas if reglas is not None else REGLAS):
+        valores.update(REGLAS[nombre].aplicar(compiled))
+    return valores
+
+def versiones() -> Dict[str, int]:
+    return {nombre: r.version for nombre, r in REGLAS.items()}
+
+def columnas(reglas: Iterable[str]) -> List[str]:
+    return [c for nombre in reglas for c in REGLAS[nombre].columnas]
@@ -1,18 +1,64 @@
+"""
+Enriquecimiento de adjudicaciones con la API de contratos de SEACE (prod4.seace.gob.pe:9000):
+entidad financiera de las garantías y miembros de consorcios (API o PDF del contrato).
+
+Motor async (por defecto, requiere aiohttp):
+- un único ClientSession con conexiones keep-alive reutilizadas (sin handshake TLS por contrato),
+- consultas simultáneas ajustadas por control_ritmo (AIMD hasta `--concurrencia`, con pausa del host
+  si se degrada) y timeouts por fase (conexión, lectura, total); 429/5xx/timeouts se reintentan
+  antes de darse por fallidos (ERROR_*),
+- las adjudicaciones pendientes se reclaman de la DB por páginas mientras se consulta, y los
+  resultados se escriben en lotes de `--lote-escritura` en una sola transacción.
+Sin aiohttp (o con --motor hilos) se usa un pool de hilos con una requests.Session compartida.
+bench_spider.py compara ambos con el spider anterior contra una API falsa local.
+Las respuestas de la API se leen y guardan en cache_contratos.py (compartida con etl_consorcios_ai.py):
+un contrato ya consultado dentro del TTL no vuelve a pedirse, y uno vencido se revalida (304).
+
+Cola de trabajo: cada página se reclama con SELECT ... FOR UPDATE SKIP LOCKED y queda a nombre del
+proceso (host:pid) con un lease de `--lease` segundos, que se renueva mientras el proceso sigue
+guardando resultados. Varios spiders (en uno o varios hosts) pueden correr a la vez sin repetir
+contratos; si uno muere, sus leases vencen y otro los retoma. Un resultado cuya fila ya no está a
+nuestro nombre (lease vencido y retomado por otro) se descarta sin escribir.
+Prioridad: contratos nunca intentados, de la adjudicación más reciente a la más antigua; una parte
+de cada página se reserva a reintentos vencidos. ERROR_CONEXION / ERROR_API_xxx no se guardan en
+entidad_financiera: la fila queda pendiente con backoff exponencial (30 min, 1 h, 2 h... hasta 2 días)
+hasta `--max-intentos`, y cada intento queda en historial_spider.
+Requiere MySQL 8.0+ / MariaDB 10.6+ (SKIP LOCKED).
+
+Uso:
+    python spider_garantias.py --concurrencia 64 --max 20000
+    python spider_garantias.py --trabajador vps2-a &   # otro proceso en paralelo
+"""
 import sys
+import json
+import socket
 import requests
 import mysql.connector
 from mysql.connector import Error
 import os
 import time
+import random
+import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
+from control_ritmo import ControlRitmo, clasificar_estado, retry_after, SOBRECARGA
+from cache_contratos import CacheContratos, encabezados_condicionales
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # Sin aiohttp se usa el motor de hilos
+
 # --- CONFIGURACIÓN INICIAL ---
 # Parche de codificación para Windows
 if sys.platform.startswith('win'):
-    try: 
+    try:
         sys.stdout.reconfigure(encoding='utf-8')
         sys.stderr.reconfigure(encoding='utf-8')
     except: pass
@@ -44,193 +90,606 @@ HEADERS = {
     "Referer": "https://prod4.seace.gob.pe/"
 }
 
+# Ritmo y tamaños (se pueden cambiar por CLI). La concurrencia real la ajusta control_ritmo entre
+# CONCURRENCIA_INICIAL y CONCURRENCIA_DEFECTO (máximo) según latencia y 429/5xx de prod4
+CONCURRENCIA_DEFECTO = int(os.getenv("SPIDER_CONCURRENCIA", "32"))
+CONCURRENCIA_INICIAL = 4
+REINTENTOS_SOBRECARGA = 3
+BACKOFF_BASE = 1.0
+LOTE_LECTURA = 200      # adjudicaciones por página de la DB (se acota con lote_para_lease)
+LOTE_ESCRITURA = 200    # resultados por transacción
+LEASE_SEGUNDOS = int(os.getenv("SPIDER_LEASE", "900"))  # cuánto tiempo es nuestra una página reclamada
+RITMO_MINIMO = 0.5      # contratos/s en el peor caso (host pausado, reintentos): una página debe caber en medio lease
+TIMEOUTS = {"conexion": 10, "lectura": 15, "total": 30, "pdf": 60}  # segundos por fase
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
 
-# --- GESTIÓN DE BASE DE DATOS ---
+# --- 1. GESTIÓN DE BASE DE DATOS ---
 def obtener_conexion():
     try: return mysql.connector.connect(**DB_CONFIG)
-    except Error as e: 
+    except Error as e:
         logging.error(f"Error DB: {e}")
         return None
 
-def obtener_pendientes():
-    conn = obtener_conexion()
-    if not conn: return []
+# Cola de trabajo sobre la propia tabla: quién tiene reclamada la fila y hasta cuándo, y cuántas
+# veces se intentó. Los ERROR_* no se guardan en entidad_financiera: la fila sigue pendiente con
+# spider_ultimo_error y spider_proximo_intento (backoff exponencial) hasta MAX_INTENTOS.
+COLUMNAS_COLA = [("spider_trabajador", "VARCHAR(100) NULL"), ("spider_lease_hasta", "DATETIME NULL"),
+                 ("spider_intentos", "INT NOT NULL DEFAULT 0"), ("spider_proximo_intento", "DATETIME NULL"),
+                 ("spider_ultimo_error", "VARCHAR(255) NULL")]
+INDICE_COLA = "idx_cola_prioridad (entidad_financiera, spider_intentos, fecha_adjudicacion)"
+
+DDL_HISTORIAL = """
+    CREATE TABLE IF NOT EXISTS historial_spider (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        id_adjudicacion VARCHAR(100) NOT NULL,
+        resultado VARCHAR(255),
+        trabajador VARCHAR(100),
+        fecha DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_adjudicacion (id_adjudicacion, fecha)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+MAX_INTENTOS = int(os.getenv("SPIDER_MAX_INTENTOS", "8"))
+REINTENTO_BASE = 1800             # segundos hasta el 2º intento; luego se duplica
+REINTENTO_MAX = 2 * 24 * 3600     # tope de espera entre intentos
+FRACCION_REINTENTOS = 0.2         # parte de cada página reservada a reintentos vencidos
+
+def es_reintentable(banco: str) -> bool:
+    """ERROR_CONEXION / ERROR_API_xxx. CONTRATO_NO_ENCONTRADO_API (404) es una respuesta, no un fallo."""
+    return banco.startswith("ERROR")
+
+def id_trabajador() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def preparar_cola(conn):
     cursor = conn.cursor()
-    # Buscamos registros que les falte el banco O que sean consorcios sin procesar
-    # Nota: Asumimos que si entidad_financiera es NULL, no hemos pasado por aquí.
-    sql = """
-        SELECT id_adjudicacion, id_contrato, ganador_nombre 
-        FROM Licitaciones_Adjudicaciones 
-        WHERE (id_contrato IS NOT NULL AND id_contrato != '')
-          AND (entidad_financiera IS NULL) 
-        LIMIT 50 
+    # Crear columna en BD si no existe (Solo bancos, la tabla consorcios debe existir aparte)
+    # idx_cola_spider (entidad_financiera, id_adjudicacion) lo creaba la primera versión de la cola con
+    # leases, que reclamaba por id; con la prioridad por fecha e intentos lo reemplaza idx_cola_prioridad
+    for ddl in (["ADD COLUMN entidad_financiera VARCHAR(255)"] + [f"ADD COLUMN {c} {t}" for c, t in COLUMNAS_COLA]
+                + [f"ADD INDEX {INDICE_COLA}", "DROP INDEX idx_cola_spider"]):
+        try: cursor.execute(f"ALTER TABLE Licitaciones_Adjudicaciones {ddl}")
+        except Error: pass  # ya existe
+    cursor.execute(DDL_HISTORIAL)
+    # Los ERROR_* que guardaban las versiones anteriores vuelven a la cola como reintentos
+    cursor.execute("""
+        UPDATE Licitaciones_Adjudicaciones
+        SET spider_ultimo_error = entidad_financiera, entidad_financiera = NULL,
+            spider_intentos = GREATEST(spider_intentos, 1), spider_proximo_intento = NOW()
+        WHERE entidad_financiera LIKE 'ERROR%'
+    """)
+    if cursor.rowcount > 0:
+        logging.info(f"♻️ {cursor.rowcount} adjudicaciones con ERROR_* pasan a la cola de reintentos.")
+    conn.commit()
+    cursor.close()
+
+SQL_RECLAMAR = """
+    SELECT id_adjudicacion, id_contrato, ganador_nombre
+    FROM Licitaciones_Adjudicaciones
+    WHERE (id_contrato IS NOT NULL AND id_contrato != '')
+      AND (entidad_financiera IS NULL)
+      AND (spider_lease_hasta IS NULL OR spider_lease_hasta < NOW())
+      AND {condicion}
+    ORDER BY {orden}
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+# Nunca intentados, de la adjudicación más reciente a la más antigua
+SQL_NUEVOS = SQL_RECLAMAR.format(condicion="spider_intentos = 0", orden="fecha_adjudicacion DESC")
+# Reintentos vencidos: primero los que llevan menos intentos, y entre ellos los más recientes
+SQL_REINTENTOS = SQL_RECLAMAR.format(condicion="spider_intentos BETWEEN 1 AND %s AND spider_proximo_intento <= NOW()",
+                                     orden="spider_intentos, fecha_adjudicacion DESC")
+
+def reclamar_pendientes(conn, trabajador: str, limite: int, lease: int = LEASE_SEGUNDOS,
+                        max_intentos: int = MAX_INTENTOS) -> List[Tuple]:
+    """
+    Reclama una página de adjudicaciones sin entidad financiera: hasta FRACCION_REINTENTOS de reintentos
+    vencidos y el resto nunca intentadas (así los fallos no frenan el trabajo nuevo ni se quedan sin turno).
+    Salta las filas bloqueadas o con lease vigente de otro trabajador y deja las elegidas a nuestro nombre.
     """
-    cursor.execute(sql)
-    pendientes = cursor.fetchall()
-    conn.close()
-    return pendientes
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute(SQL_REINTENTOS, (max_intentos - 1, max(1, int(limite * FRACCION_REINTENTOS))))
+        filas = cursor.fetchall()
+        cursor.execute(SQL_NUEVOS, (limite - len(filas),))
+        filas += cursor.fetchall()
+        if filas:
+            marcas = ", ".join(["%s"] * len(filas))
+            cursor.execute(f"""
+                UPDATE Licitaciones_Adjudicaciones
+                SET spider_trabajador = %s, spider_lease_hasta = NOW() + INTERVAL %s SECOND
+                WHERE id_adjudicacion IN ({marcas})
+            """, (trabajador, lease, *(f[0] for f in filas)))
+        conn.commit()
+        return filas
+    except Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
 
-def guardar_garantias(resultados):
-    if not resultados: return
-    conn = obtener_conexion()
-    if not conn: return
+def lote_para_lease(lote_lectura: int, lease: int = LEASE_SEGUNDOS) -> int:
+    """Página que se alcanza a procesar a RITMO_MINIMO en la mitad del lease (la otra mitad es margen)."""
+    return max(1, min(lote_lectura, int(lease * RITMO_MINIMO / 2)))
+
+def renovar_leases(conn, trabajador: str, lease: int = LEASE_SEGUNDOS) -> int:
+    """Extiende el lease de lo reclamado y aún sin resultado (páginas que tardan más de lo previsto)."""
     cursor = conn.cursor()
-    sql = "UPDATE Licitaciones_Adjudicaciones SET entidad_financiera = %s WHERE id_adjudicacion = %s"
     try:
-        cursor.executemany(sql, resultados)
+        cursor.execute("""
+            UPDATE Licitaciones_Adjudicaciones SET spider_lease_hasta = NOW() + INTERVAL %s SECOND
+            WHERE spider_trabajador = %s AND entidad_financiera IS NULL
+        """, (lease, trabajador))
         conn.commit()
-    except Error as e:
-        logging.error(f"❌ Error guardando garantías: {e}")
+        return cursor.rowcount
     finally:
         cursor.close()
-        conn.close()
 
-def guardar_consorcio_db(id_contrato, miembros):
-    conn = obtener_conexion()
-    if not conn: return
+def liberar_leases(conn, trabajador: str) -> int:
+    """Devuelve a la cola lo reclamado y no terminado (al salir, p. ej. con Ctrl+C)."""
     cursor = conn.cursor()
-    sql = """
-        INSERT INTO Detalle_Consorcios (id_contrato, ruc_miembro, nombre_miembro, porcentaje_participacion)
-        VALUES (%s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE fecha_registro=NOW()
+    try:
+        cursor.execute("""
+            UPDATE Licitaciones_Adjudicaciones SET spider_trabajador = NULL, spider_lease_hasta = NULL
+            WHERE spider_trabajador = %s AND entidad_financiera IS NULL
+        """, (trabajador,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+def paginas(leer_lote: Callable, lote_lectura: int = LOTE_LECTURA, maximo: int = 0):
+    """
+    Páginas de 'leer_lote(n)' hasta que la cola no entregue nada. Lo reclamado queda con lease, así
+    que no hace falta cursor: cada llamada trae lo siguiente por prioridad, incluidos los leases
+    vencidos de trabajadores caídos y los reintentos que se vencen mientras corre.
     """
+    total = 0
+    while not maximo or total < maximo:
+        lote = leer_lote(min(lote_lectura, maximo - total) if maximo else lote_lectura)
+        if not lote: return
+        yield lote
+        total += len(lote)
+
+SQL_CONSORCIO = """
+    INSERT INTO Detalle_Consorcios (id_contrato, ruc_miembro, nombre_miembro, porcentaje_participacion)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE fecha_registro=NOW()
+"""
+
+def filas_consorcio(id_contrato, miembros) -> List[Tuple]:
     datos = []
     for m in miembros:
         ruc = str(m.get('nroDocumento') or m.get('ruc') or 'S/N')[:20]
         nombre = str(m.get('nombreRazonSocial') or m.get('nombre') or 'DESCONOCIDO')[:500]
         part = m.get('porcentajeParticipacion') or 0.0
         datos.append((id_contrato, ruc, nombre, part))
-    
+    return datos
+
+SQL_FALLO = """
+    UPDATE Licitaciones_Adjudicaciones
+    SET spider_ultimo_error = %s,
+        spider_proximo_intento = IF(spider_intentos + 1 >= %s, NULL,
+                                    NOW() + INTERVAL LEAST(%s * POW(2, spider_intentos), %s) SECOND),
+        spider_intentos = spider_intentos + 1,
+        spider_trabajador = NULL, spider_lease_hasta = NULL
+    WHERE id_adjudicacion = %s AND (%s IS NULL OR spider_trabajador = %s)
+"""
+
+def guardar_resultados(conn, resultados: List[Dict], trabajador: Optional[str] = None, max_intentos: int = MAX_INTENTOS):
+    """
+    Bancos, miembros de consorcio e historial de intentos de un lote, en una sola transacción.
+    Los ERROR_* quedan pendientes con su próximo intento (sin proximo_intento si se agotaron).
+    Con 'trabajador' solo se escriben las filas que siguen a su nombre: si el lease venció y otro
+    spider la retomó, el resultado se descarta (lo escribirá ese otro).
+    """
+    if not resultados: return
+    cursor = conn.cursor()
     try:
-        if datos: cursor.executemany(sql, datos)
+        if trabajador is not None:
+            marcas = ", ".join(["%s"] * len(resultados))
+            cursor.execute(f"""
+                SELECT id_adjudicacion FROM Licitaciones_Adjudicaciones
+                WHERE id_adjudicacion IN ({marcas}) AND spider_trabajador = %s
+                FOR UPDATE
+            """, (*(r["id_adj"] for r in resultados), trabajador))
+            propios = {f[0] for f in cursor.fetchall()}
+            perdidos = len(resultados) - sum(1 for r in resultados if r["id_adj"] in propios)
+            if perdidos:
+                logging.warning(f"⚠️ {perdidos} resultados descartados: su lease venció y otro trabajador retomó la fila.")
+            resultados = [r for r in resultados if r["id_adj"] in propios]
+        consorcios = [f for r in resultados for f in filas_consorcio(r["id_contrato"], r["miembros"])]
+        if consorcios: cursor.executemany(SQL_CONSORCIO, consorcios)
+        fallos = [r for r in resultados if es_reintentable(r["banco"])]
+        hechos = [r for r in resultados if not es_reintentable(r["banco"])]
+        if hechos:
+            cursor.executemany("""
+                UPDATE Licitaciones_Adjudicaciones
+                SET entidad_financiera = %s, spider_intentos = spider_intentos + 1, spider_proximo_intento = NULL,
+                    spider_ultimo_error = NULL, spider_trabajador = NULL, spider_lease_hasta = NULL
+                WHERE id_adjudicacion = %s AND (%s IS NULL OR spider_trabajador = %s)
+            """, [(r["banco"], r["id_adj"], trabajador, trabajador) for r in hechos])
+        if fallos:
+            cursor.executemany(SQL_FALLO, [(r["banco"], max_intentos, REINTENTO_BASE, REINTENTO_MAX, r["id_adj"], trabajador, trabajador)
+                                           for r in fallos])
+        if resultados:
+            cursor.executemany("INSERT INTO historial_spider (id_adjudicacion, resultado, trabajador) VALUES (%s, %s, %s)",
+                               [(r["id_adj"], r["banco"], trabajador) for r in resultados])
         conn.commit()
     except Error as e:
-        logging.error(f"❌ Error guardando consorcio {id_contrato}: {e}")
+        conn.rollback()
+        logging.error(f"❌ Error guardando lote de {len(resultados)} garantías: {e}")
     finally:
         cursor.close()
-        conn.close()
 
-# --- WORKER PRINCIPAL ---
-def procesar_contrato(item):
+# --- 2. INTERPRETACIÓN DE LA RESPUESTA ---
+def interpretar_contrato(data: Dict, nombre_ganador) -> Tuple[str, List[Dict], Optional[str], str]:
+    """
+    (entidad financiera, miembros del consorcio, id del PDF a descargar, estado del consorcio).
+    ValueError si la respuesta no es un objeto JSON; las partes con otra forma se ignoran.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("la respuesta no es un objeto JSON")
+    # --- 1. EXTRACCIÓN DE GARANTÍAS (BANCOS) ---
+    garantias = data.get('listaGarantiaContrato') or []
+    if not isinstance(garantias, list): garantias = []
+    emisores = set()
+    for g in garantias:
+        banco = g.get('entidadEmisora') if isinstance(g, dict) else None
+        if isinstance(banco, str) and banco.strip():
+            banco_limpio = banco.strip().upper().replace("BANCO", "").strip()
+            emisores.add(banco_limpio)
+    res_banco = " | ".join(sorted(emisores)) if emisores else "SIN_GARANTIA"
+
+    # --- 2. EXTRACCIÓN DE CONSORCIOS (LÓGICA HÍBRIDA) ---
+    # Solo si el nombre del ganador indica que es un consorcio
+    if "CONSORCIO" not in str(nombre_ganador).upper():
+        return res_banco, [], None, "NO_CONSORCIO"
+
+    # A) INTENTO API
+    contratista = data.get('contratista', {})
+    miembros = []
+    if isinstance(contratista, dict):
+        miembros = contratista.get('listaMiembrosConsorcio') or contratista.get('listaConsorciados') or []
+    miembros = [m for m in miembros if isinstance(m, dict)] if isinstance(miembros, list) else []
+    if miembros:
+        return res_banco, miembros, None, "OK_API"
+
+    # B) INTENTO PDF (PLAN B)
+    id_pdf = None
+    if data.get("idDocumentoConsorcio"):
+        id_pdf = data.get("idDocumentoConsorcio")
+    elif data.get("idDocumento2") and "CONTRATO" in str(data.get("archivoAdjunto2", "")).upper():
+        id_pdf = data.get("idDocumento2")
+    return res_banco, [], id_pdf, "PDF_PENDIENTE" if id_pdf else "PDF_NOT_FOUND"
+
+def banco_por_estado(status: int) -> str:
+    return "CONTRATO_NO_ENCONTRADO_API" if status == 404 else f"ERROR_API_{status}"
+
+ERROR_RESPUESTA = "ERROR_RESPUESTA"  # 200 con un cuerpo que no se puede interpretar: se reintenta como los ERROR_API
+
+def ruta_pdf(id_contrato) -> str:
+    return os.path.join(CARPETA_EVIDENCIA, f"Consorcio_{id_contrato}.pdf")
+
+# --- 3. MOTOR DE HILOS (requests.Session compartida) ---
+def crear_sesion(pool: int) -> requests.Session:
+    sesion = requests.Session()
+    sesion.headers.update(HEADERS)
+    sesion.verify = False
+    adaptador = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+def espera_reintento(intento: int) -> float:
+    return BACKOFF_BASE * (2 ** intento) * random.uniform(0.5, 1.5)
+
+def buscar_en_cache(cache: Optional[CacheContratos], id_contrato) -> Optional[Dict]:
+    """Entrada guardada con su JSON en 'data' (buscar_json); sin caché o si no se puede leer, None (se pide a la API)."""
+    if cache is None: return None
+    try:
+        return cache.buscar_json(id_contrato)
+    except Exception as e:
+        logging.warning(f"⚠️ Caché de contratos no disponible para {id_contrato}: {e}")
+        return None
+
+def resolver_con_cache(cache: Optional[CacheContratos], id_contrato, entrada: Optional[Dict], status, cuerpo: bytes, headers):
+    """
+    (status, JSON) final de una consulta a la API: aplica un 304 sobre la entrada guardada o guarda la
+    respuesta nueva. Un 200 que no es un objeto JSON no se guarda (interpretar_contrato lo deja como
+    ERROR_RESPUESTA y se reintenta contra la API); un fallo de la caché no hace fallar la consulta.
+    """
+    if status == 304 and entrada:
+        status, data = entrada["status"], entrada["data"]
+        accion = lambda: cache.renovar(id_contrato)
+    else:
+        try:
+            data = json.loads(cuerpo) if status == 200 else None
+        except ValueError:
+            return status, None
+        if status == 200 and not isinstance(data, dict): return status, data
+        accion = lambda: cache.guardar(id_contrato, status, cuerpo, headers)
+    if cache is not None:
+        try: accion()
+        except Exception as e: logging.warning(f"⚠️ No se pudo guardar el contrato {id_contrato} en la caché: {e}")
+    return status, data
+
+def procesar_contrato(item, sesion: requests.Session, control: ControlRitmo, tiempos: Dict = TIMEOUTS,
+                      cache: Optional[CacheContratos] = None) -> Dict:
     id_adj, id_contrato, nombre_ganador = item
-    url = URL_API_CONTRATO.format(id_contrato)
-    
-    res_banco = "NO_INFO"
-    info_consorcio = "NO_CONSORCIO" # Estados: OK_API, PDF_DOWNLOADED, ERROR
-    
+    res = {"id_adj": id_adj, "id_contrato": id_contrato, "banco": "NO_INFO", "miembros": [], "consorcio": "NO_CONSORCIO"}
+    entrada = buscar_en_cache(cache, id_contrato)
+    if entrada and entrada["fresca"]:
+        status, data = entrada["status"], entrada["data"]
+    else:
+        status, data = None, None
+        # 429 / 5xx / timeouts se reintentan aquí (el control baja el ritmo o pausa el host) antes de darlos por error
+        for intento in range(REINTENTOS_SOBRECARGA + 1):
+            control.entrar()
+            inicio = time.monotonic()
+            try:
+                r = sesion.get(URL_API_CONTRATO.format(id_contrato), headers=encabezados_condicionales(entrada),
+                               timeout=(tiempos["conexion"], tiempos["lectura"]))
+                cuerpo = r.content
+            except Exception:
+                control.registrar(SOBRECARGA)
+                status = None
+            else:
+                control.registrar(clasificar_estado(r.status_code), time.monotonic() - inicio, retry_after(r.headers))
+                status, data = resolver_con_cache(cache, id_contrato, entrada, r.status_code, cuerpo, r.headers)
+            if status is not None and clasificar_estado(status) != SOBRECARGA: break
+            if intento < REINTENTOS_SOBRECARGA: time.sleep(espera_reintento(intento))
+
+    if status is None:
+        res["banco"] = "ERROR_CONEXION"
+        return res
+    if status != 200:
+        res["banco"] = banco_por_estado(status)
+        return res
     try:
-        r = requests.get(url, headers=HEADERS, verify=False, timeout=15)
-        
-        if r.status_code == 200:
-            data = r.json()
-            
-            # --- 1. EXTRACCIÓN DE GARANTÍAS (BANCOS) ---
-            garantias = data.get('listaGarantiaContrato') or []
-            emisores = set()
-            for g in garantias:
-                banco = g.get('entidadEmisora')
-                if banco: 
-                    banco_limpio = banco.strip().upper().replace("BANCO", "").strip()
-                    emisores.add(banco_limpio)
-            
-            if emisores: res_banco = " | ".join(sorted(emisores))
-            else: res_banco = "SIN_GARANTIA"
-
-            # --- 2. EXTRACCIÓN DE CONSORCIOS (LÓGICA HÍBRIDA) ---
-            # Solo si el nombre del ganador indica que es un consorcio
-            if "CONSORCIO" in str(nombre_ganador).upper():
-                contratista = data.get('contratista', {})
-                miembros = []
-                
-                # A) INTENTO API
-                if isinstance(contratista, dict):
-                    miembros = contratista.get('listaMiembrosConsorcio') or contratista.get('listaConsorciados') or []
-                
-                if miembros:
-                    guardar_consorcio_db(id_contrato, miembros)
-                    info_consorcio = "OK_API"
+        res["banco"], res["miembros"], id_pdf, res["consorcio"] = interpretar_contrato(data, nombre_ganador)
+    except Exception as e:
+        logging.warning(f"⚠️ Contrato {id_contrato}: respuesta no interpretable ({e})")
+        res["banco"] = ERROR_RESPUESTA
+        return res
+    if id_pdf:
+        control.entrar()
+        registrado = False
+        try:
+            with sesion.get(URL_DESCARGA_DOC.format(id_pdf), stream=True, timeout=(tiempos["conexion"], tiempos["pdf"])) as r_pdf:
+                control.registrar(clasificar_estado(r_pdf.status_code), espera=retry_after(r_pdf.headers))
+                registrado = True
+                if r_pdf.status_code == 200:
+                    with open(ruta_pdf(id_contrato), 'wb') as f:
+                        for chunk in r_pdf.iter_content(chunk_size=64 * 1024):
+                            f.write(chunk)
+                    res["consorcio"] = "PDF_DOWNLOADED"
                 else:
-                    # B) INTENTO PDF (PLAN B)
-                    id_pdf = None
-                    nombre_pdf = f"Consorcio_{id_contrato}.pdf"
-                    
-                    if data.get("idDocumentoConsorcio"):
-                        id_pdf = data.get("idDocumentoConsorcio")
-                    elif data.get("idDocumento2") and "CONTRATO" in str(data.get("archivoAdjunto2", "")).upper():
-                        id_pdf = data.get("idDocumento2")
-                    
-                    if id_pdf:
-                        # Descargar PDF
-                        url_pdf = URL_DESCARGA_DOC.format(id_pdf)
-                        ruta_pdf = os.path.join(CARPETA_EVIDENCIA, nombre_pdf)
-                        try:
-                            with requests.get(url_pdf, headers=HEADERS, stream=True, verify=False, timeout=30) as r_pdf:
-                                if r_pdf.status_code == 200:
-                                    with open(ruta_pdf, 'wb') as f:
-                                        for chunk in r_pdf.iter_content(chunk_size=1024):
-                                            f.write(chunk)
-                                    info_consorcio = "PDF_DOWNLOADED"
-                        except:
-                            info_consorcio = "ERROR_PDF"
-                    else:
-                        info_consorcio = "PDF_NOT_FOUND"
-
-        elif r.status_code == 404:
-            res_banco = "CONTRATO_NO_ENCONTRADO_API"
+                    res["consorcio"] = f"ERROR_PDF_{r_pdf.status_code}"
+        except Exception:
+            # Un fallo al leer el cuerpo o escribir el archivo no es sobrecarga del host (y ya se registró)
+            if not registrado: control.registrar(SOBRECARGA)
+            res["consorcio"] = "ERROR_PDF"
+    return res
+
+def enriquecer_hilos(leer_lote: Callable, guardar: Callable, control: ControlRitmo, lote_lectura: int = LOTE_LECTURA,
+                     maximo: int = 0, tiempos: Dict = TIMEOUTS, al_terminar: Optional[Callable] = None,
+                     cache: Optional[CacheContratos] = None) -> int:
+    """Tantos hilos como el máximo del control; cuántos consultan a la vez lo decide el control."""
+    sesion = crear_sesion(control.maximo)
+    total = 0
+    with ThreadPoolExecutor(max_workers=control.maximo) as executor:
+        for lote in paginas(leer_lote, lote_lectura, maximo):
+            resultados = list(executor.map(lambda item: procesar_contrato(item, sesion, control, tiempos, cache), lote))
+            guardar(resultados)
+            if al_terminar:
+                for r in resultados: al_terminar(r)
+            total += len(lote)
+    sesion.close()
+    return total
+
+# --- 4. MOTOR ASYNC (UN CLIENTSESSION KEEP-ALIVE) ---
+class SpiderAsync:
+    def __init__(self, control: ControlRitmo, tiempos: Dict = TIMEOUTS, cache: Optional[CacheContratos] = None):
+        self.control = control
+        self.tiempos = tiempos
+        self.cache = cache
+        self.sesion = None
+
+    async def __aenter__(self):
+        conector = aiohttp.TCPConnector(limit=self.control.maximo, limit_per_host=self.control.maximo,
+                                        keepalive_timeout=60, ttl_dns_cache=300, ssl=False)
+        self.sesion = aiohttp.ClientSession(
+            connector=conector, headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=self.tiempos["total"], sock_connect=self.tiempos["conexion"],
+                                          sock_read=self.tiempos["lectura"])
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.sesion.close()
+
+    async def _descargar_pdf(self, id_pdf, ruta: str) -> str:
+        timeout = aiohttp.ClientTimeout(total=self.tiempos["pdf"], sock_connect=self.tiempos["conexion"],
+                                        sock_read=self.tiempos["lectura"])
+        await self.control.entrar_async()
+        try:
+            async with self.sesion.get(URL_DESCARGA_DOC.format(id_pdf), timeout=timeout) as r:
+                contenido = await r.read() if r.status == 200 else None
+                self.control.registrar(clasificar_estado(r.status), espera=retry_after(r.headers))
+        except Exception:
+            self.control.registrar(SOBRECARGA)
+            raise
+        if contenido is None: return f"ERROR_PDF_{r.status}"
+        await asyncio.to_thread(_escribir, ruta, contenido)
+        return "PDF_DOWNLOADED"
+
+    async def consultar(self, item) -> Dict:
+        id_adj, id_contrato, nombre_ganador = item
+        res = {"id_adj": id_adj, "id_contrato": id_contrato, "banco": "NO_INFO", "miembros": [], "consorcio": "NO_CONSORCIO"}
+        entrada = await asyncio.to_thread(buscar_en_cache, self.cache, id_contrato) if self.cache is not None else None
+        if entrada and entrada["fresca"]:
+            status, data = entrada["status"], entrada["data"]
         else:
-            res_banco = f"ERROR_API_{r.status_code}"
-            
-    except Exception as e:
-        res_banco = "ERROR_CONEXION"
+            status, data = None, None
+            # 429 / 5xx / timeouts se reintentan aquí (el control baja el ritmo o pausa el host) antes de darlos por error
+            for intento in range(REINTENTOS_SOBRECARGA + 1):
+                await self.control.entrar_async()
+                inicio = time.monotonic()
+                try:
+                    async with self.sesion.get(URL_API_CONTRATO.format(id_contrato), headers=encabezados_condicionales(entrada)) as r:
+                        recibido, espera, cuerpo = r.status, retry_after(r.headers), await r.read()
+                except Exception:
+                    self.control.registrar(SOBRECARGA)
+                    status = None
+                else:
+                    self.control.registrar(clasificar_estado(recibido), time.monotonic() - inicio, espera)
+                    status, data = await asyncio.to_thread(resolver_con_cache, self.cache, id_contrato, entrada, recibido, cuerpo, r.headers)
+                if status is not None and clasificar_estado(status) != SOBRECARGA: break
+                if intento < REINTENTOS_SOBRECARGA: await asyncio.sleep(espera_reintento(intento))
+
+        if status is None:
+            res["banco"] = "ERROR_CONEXION"
+            return res
+        if status != 200:
+            res["banco"] = banco_por_estado(status)
+            return res
+        try:
+            res["banco"], res["miembros"], id_pdf, res["consorcio"] = interpretar_contrato(data, nombre_ganador)
+        except Exception as e:
+            logging.warning(f"⚠️ Contrato {id_contrato}: respuesta no interpretable ({e})")
+            res["banco"] = ERROR_RESPUESTA
+            return res
+        if id_pdf:
+            try:
+                res["consorcio"] = await self._descargar_pdf(id_pdf, ruta_pdf(id_contrato))
+            except Exception:
+                res["consorcio"] = "ERROR_PDF"
+        return res
+
+def _escribir(ruta: str, contenido: bytes):
+    with open(ruta, 'wb') as f:
+        f.write(contenido)
+
+async def enriquecer_async(leer_lote: Callable, guardar: Callable, control: ControlRitmo,
+                           lote_lectura: int = LOTE_LECTURA, lote_escritura: int = LOTE_ESCRITURA, maximo: int = 0,
+                           tiempos: Dict = TIMEOUTS, al_terminar: Optional[Callable] = None,
+                           cache: Optional[CacheContratos] = None) -> int:
+    """
+    Lector -> cola -> consultas (tantas como permita el control) -> escritor por lotes.
+    'leer_lote(n)' (reclamar_pendientes) y 'guardar(resultados)' son bloqueantes (DB) y corren en hilos aparte.
+    """
+    trabajadores = control.maximo
+    entrada = asyncio.Queue(maxsize=trabajadores * 2)        # backpressure: no se lee más de lo que se consulta
+    salida = asyncio.Queue(maxsize=lote_escritura * 2)
+    leidos = 0
+
+    async def lector():
+        nonlocal leidos
+        origen = paginas(leer_lote, lote_lectura, maximo)
+        while (lote := await asyncio.to_thread(next, origen, None)) is not None:
+            for item in lote: await entrada.put(item)
+            leidos += len(lote)
+        for _ in range(trabajadores): await entrada.put(None)
 
-    return (res_banco, id_adj, info_consorcio)
+    async def trabajador(spider: SpiderAsync):
+        while (item := await entrada.get()) is not None:
+            await salida.put(await spider.consultar(item))
+        await salida.put(None)
+
+    async def escritor():
+        pendientes, activos = [], trabajadores
+        while activos:
+            r = await salida.get()
+            if r is None:
+                activos -= 1
+            else:
+                pendientes.append(r)
+                if al_terminar: al_terminar(r)
+            if len(pendientes) >= lote_escritura or (pendientes and not activos):
+                await asyncio.to_thread(guardar, pendientes)
+                pendientes = []
+
+    async with SpiderAsync(control, tiempos, cache) as spider:
+        await asyncio.gather(lector(), escritor(), *(trabajador(spider) for _ in range(trabajadores)))
+    return leidos
 
 # --- MAIN ---
 def main():
-    logging.info("🕷️ SPIDER UNIFICADO V2.0 (Bancos + Consorcios)")
-    
-    # Crear columna en BD si no existe (Solo bancos, la tabla consorcios debe existir aparte)
-    conn = obtener_conexion()
-    if conn:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--motor", choices=["async", "hilos"], default="async", help="async (aiohttp) o pool de hilos con sesión compartida")
+    parser.add_argument("--concurrencia", type=int, default=CONCURRENCIA_DEFECTO, help="Máximo de consultas simultáneas a la API de contratos")
+    parser.add_argument("--concurrencia-inicial", type=int, default=CONCURRENCIA_INICIAL, help="Punto de partida del control AIMD")
+    parser.add_argument("--max", type=int, default=0, help="Adjudicaciones a procesar en esta ejecución (0 = todas)")
+    parser.add_argument("--lote-lectura", type=int, default=LOTE_LECTURA)
+    parser.add_argument("--lote-escritura", type=int, default=LOTE_ESCRITURA)
+    parser.add_argument("--timeout-conexion", type=float, default=TIMEOUTS["conexion"])
+    parser.add_argument("--timeout-lectura", type=float, default=TIMEOUTS["lectura"])
+    parser.add_argument("--timeout-total", type=float, default=TIMEOUTS["total"])
+    parser.add_argument("--trabajador", default=None, help="Nombre en la cola de trabajo (por defecto host:pid)")
+    parser.add_argument("--lease", type=int, default=LEASE_SEGUNDOS, help="Segundos que una página reclamada es de este proceso")
+    parser.add_argument("--sin-cache", action="store_true", help="No leer ni escribir la caché de respuestas (cache_contratos.py)")
+    parser.add_argument("--max-intentos", type=int, default=MAX_INTENTOS, help="Intentos por contrato antes de dejar de reintentar un ERROR_*")
+    args = parser.parse_args()
+    tiempos = {**TIMEOUTS, "conexion": args.timeout_conexion, "lectura": args.timeout_lectura, "total": args.timeout_total}
+
+    if args.motor == "async" and aiohttp is None:
+        logging.warning("⚠️ aiohttp no está instalado. Usando el pool de hilos.")
+        args.motor = "hilos"
+    control = ControlRitmo("prod4", inicial=args.concurrencia_inicial, maximo=args.concurrencia)
+    lote_lectura = lote_para_lease(args.lote_lectura, args.lease)
+    if lote_lectura < args.lote_lectura:
+        logging.warning(f"⚠️ --lote-lectura {args.lote_lectura} no cabe en un lease de {args.lease}s: se usan páginas de {lote_lectura}.")
+    trabajador = args.trabajador or id_trabajador()
+    cache = None if args.sin_cache else CacheContratos()
+    logging.info(f"🕷️ SPIDER UNIFICADO V3.4 (Bancos + Consorcios, motor {args.motor}, concurrencia {args.concurrencia_inicial}-{args.concurrencia} adaptativa, trabajador {trabajador})")
+
+    conn_lectura, conn_escritura = obtener_conexion(), obtener_conexion()
+    if not conn_lectura or not conn_escritura: return
+    # Cada página es una lectura nueva: sin autocommit la sesión seguiría viendo la foto de la primera
+    conn_lectura.autocommit = True
+    preparar_cola(conn_escritura)
+
+    conteo = {"ok": 0, "errores": 0}
+    inicio = time.time()
+    def al_terminar(r):
+        conteo["errores" if r["banco"].startswith("ERROR") else "ok"] += 1
+        if r["consorcio"] == "PDF_DOWNLOADED":
+            logging.info(f"   📂 PDF Descargado para adjudicación {r['id_adj']}")
+        hechos = conteo["ok"] + conteo["errores"]
+        if hechos % 1000 == 0:
+            logging.info(f"⚡ {hechos} procesados ({hechos / (time.time() - inicio):.1f}/s, {conteo['errores']} con error) | {control}")
+
+    renovado = {"hora": time.monotonic()}
+    def guardar(resultados):
+        guardar_resultados(conn_escritura, resultados, trabajador, args.max_intentos)
+        # Lo reclamado y aún en cola sigue siendo nuestro mientras haya progreso
+        if time.monotonic() - renovado["hora"] > args.lease / 3:
+            try: renovar_leases(conn_escritura, trabajador, args.lease)
+            except Error as e: logging.warning(f"⚠️ No se pudieron renovar los leases: {e}")
+            renovado["hora"] = time.monotonic()
+
+    leer = lambda n: reclamar_pendientes(conn_lectura, trabajador, n, args.lease, args.max_intentos)
+    try:
+        if args.motor == "async":
+            total = asyncio.run(enriquecer_async(leer, guardar, control, lote_lectura, args.lote_escritura,
+                                                 args.max, tiempos, al_terminar, cache))
+        else:
+            total = enriquecer_hilos(leer, guardar, control, lote_lectura, args.max, tiempos, al_terminar, cache)
+        dur = time.time() - inicio
+        logging.info(f"🏁 Finalizado. Total procesados: {total} en {dur:.1f}s ({total / dur if dur else 0:.1f}/s, {conteo['errores']} con error, quedan para reintento)")
+        logging.info(f"🚦 {control}")
+        if cache is not None: logging.info(f"🗄️ {cache}")
+    except KeyboardInterrupt: logging.warning("🛑 Interrumpido.")
+    finally:
         try:
-            cursor = conn.cursor()
-            cursor.execute("ALTER TABLE Licitaciones_Adjudicaciones ADD COLUMN entidad_financiera VARCHAR(255)")
-        except: pass
-        conn.close()
-
-    total_procesados = 0
-    ciclos = 0
-    
-    while ciclos < 50: 
-        pendientes = obtener_pendientes()
-        if not pendientes:
-            logging.info("🏁 No hay más pendientes.")
-            break
-            
-        logging.info(f"⚡ Procesando lote de {len(pendientes)}...")
-        
-        datos_para_update_bancos = []
-        
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {executor.submit(procesar_contrato, item): item for item in pendientes}
-            for future in as_completed(futures):
-                res_banco, id_adj, estado_consorcio = future.result()
-                
-                # Preparamos update masivo de bancos
-                datos_para_update_bancos.append((res_banco, id_adj))
-                
-                # Log rápido de qué pasó con el consorcio
-                if estado_consorcio == "PDF_DOWNLOADED":
-                    logging.info(f"   📂 PDF Descargado para adjudicación {id_adj}")
-                
-                total_procesados += 1
-
-        # Guardamos bancos en lote
-        guardar_garantias(datos_para_update_bancos)
-        ciclos += 1
-    
-    logging.info(f"🏁 Finalizado. Total procesados: {total_procesados}")
+            liberados = liberar_leases(conn_escritura, trabajador)
+            if liberados: logging.info(f"↩️ {liberados} adjudicaciones reclamadas sin terminar vuelven a la cola.")
+        except Error as e: logging.warning(f"⚠️ No se pudieron liberar los leases (vencerán solos): {e}")
+        conn_lectura.close()
+        conn_escritura.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
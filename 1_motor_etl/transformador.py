@@ -0,0 +1,162 @@
+"""
+Transformación por lotes: registros OCDS crudos -> filas de Licitaciones_Cabecera y Licitaciones_Adjudicaciones.
+
+En vez de llamar safe_str / safe_float / limpiar_fecha campo por campo dentro del bucle de cada
+registro, el lote se procesa por etapas:
+1. extraer: una pasada que deja los valores crudos en listas por columna,
+2. limpiar: cada columna se limpia entera, con atajo para el tipo habitual (str, float) y las
+   fechas validadas una sola vez por día distinto (caché), no una vez por registro,
+3. derivar: reglas de reglas_mapeo (categoría, estado, ubicación) de los registros que se escriben,
+4. armar: tuplas en el orden de COLUMNAS_CABECERA / COLUMNAS_ADJUDICACION y la huella de cada registro.
+Produce exactamente las mismas filas que el bucle por registro anterior; bench_transformador.py
+mide filas/s de cada etapa y lo comprueba.
+"""
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import reglas_mapeo
+
+# --- 1. LIMPIEZA DE UN VALOR ---
+def safe_str(val, max_len=None):
+    if val is None: return ""
+    s = str(val).strip()
+    if max_len and len(s) > max_len: return s[:max_len]
+    return s
+
+def safe_float(val):
+    if val is None: return 0.0
+    try:
+        return float(val)
+    except:
+        return 0.0
+
+@lru_cache(maxsize=65536)
+def _dia_valido(dia):
+    try:
+        datetime.strptime(dia, '%Y-%m-%d')
+        return dia
+    except ValueError: return None
+
+def limpiar_fecha(f):
+    """
+    Recorta la fecha a YYYY-MM-DD.
+    """
+    if not f: return None
+    # Cortamos estrictamente a los primeros 10 caracteres (YYYY-MM-DD); cada día se valida una sola vez
+    return _dia_valido(str(f)[:10])
+
+def huella_registro(cabecera, adjudicaciones):
+    """Hash estable de lo que se escribe para un ocid (cabecera sin archivo_origen + sus adjudicaciones)."""
+    return hashlib.blake2b(repr((cabecera[:-1], adjudicaciones)).encode("utf-8"), digest_size=16).hexdigest()
+
+# --- 2. LIMPIEZA POR COLUMNAS ---
+def limpiar_textos(columna: List, max_len=None) -> List[str]:
+    return [v.strip()[:max_len] if type(v) is str else safe_str(v, max_len) for v in columna]
+
+def limpiar_montos(columna: List) -> List[float]:
+    return [v if type(v) is float else safe_float(v) for v in columna]
+
+def limpiar_fechas(columna: List) -> List:
+    return [_dia_valido(v[:10]) if type(v) is str and v else limpiar_fecha(v) for v in columna]
+
+# --- 3. ETAPAS ---
+def extraer(registros: List[Dict]) -> Dict[str, List]:
+    """Valores crudos por columna. Las adjudicaciones llevan 'registro' (índice del registro dueño)."""
+    c = {k: [] for k in ("compiled", "id_conv", "ocid", "titulo", "descripcion", "comprador", "tipo_proc",
+                         "monto", "moneda", "fecha")}
+    a = {k: [] for k in ("registro", "id_adj", "id_contrato", "ganador", "ruc", "monto", "fecha")}
+    for i, r in enumerate(registros):
+        compiled = r.get('compiledRelease', {})
+        tender = compiled.get('tender', {})
+        c["compiled"].append(compiled)
+        c["id_conv"].append(tender.get('id'))
+        c["ocid"].append(r.get('ocid'))
+        c["titulo"].append(tender.get('title'))
+        c["descripcion"].append(tender.get('description'))
+        c["comprador"].append(compiled.get('buyer', {}).get('name'))
+        c["tipo_proc"].append(tender.get('procurementMethodDetails'))
+        c["monto"].append(tender.get('value', {}).get('amount'))
+        c["moneda"].append(tender.get('value', {}).get('currency', 'PEN'))
+        # --- CORRECCIÓN CRÍTICA: FECHA --- compiled.get('date') porque r.get('date') viene vacío
+        c["fecha"].append(compiled.get('date'))
+
+        mapa_contratos = {}
+        for ct in compiled.get('contracts', []):
+            aw_id = ct.get('awardID')
+            c_id = ct.get('id')
+            if aw_id and c_id:
+                mapa_contratos[str(aw_id)] = safe_str(c_id, 100)
+        for aw in compiled.get('awards', []):
+            id_adj_raw = aw.get('id')
+            sups = aw.get('suppliers', [])
+            a["registro"].append(i)
+            a["id_adj"].append(id_adj_raw)
+            a["id_contrato"].append(mapa_contratos.get(str(id_adj_raw), None))
+            a["ganador"].append(sups[0].get('name') if sups else "DESCONOCIDO")
+            a["ruc"].append(sups[0].get('id') if sups else None)
+            a["monto"].append(aw.get('value', {}).get('amount'))
+            a["fecha"].append(aw.get('date'))
+    return {"cabecera": c, "adjudicacion": a}
+
+def limpiar(columnas: Dict[str, Dict[str, List]]) -> Dict[str, Dict[str, List]]:
+    c, a = columnas["cabecera"], columnas["adjudicacion"]
+    c.update(
+        id_conv=limpiar_textos(c["id_conv"], 100), ocid=limpiar_textos(c["ocid"], 100),
+        titulo=limpiar_textos(c["titulo"], 4000), descripcion=limpiar_textos(c["descripcion"], 4000),
+        comprador=limpiar_textos(c["comprador"], 500), monto=limpiar_montos(c["monto"]),
+        moneda=limpiar_textos(c["moneda"], 10), fecha=limpiar_fechas(c["fecha"]),
+    )
+    a.update(
+        id_adj=limpiar_textos(a["id_adj"], 100), ganador=limpiar_textos(a["ganador"], 500),
+        ruc=limpiar_textos(a["ruc"], 50), monto=limpiar_montos(a["monto"]), fecha=limpiar_fechas(a["fecha"]),
+    )
+    return columnas
+
+def seleccionar(columnas: Dict[str, Dict[str, List]], reemplazados=frozenset()) -> Tuple[List[int], int]:
+    """Índices de los registros que se escriben: con id_convocatoria y sin versión más nueva en otro mes."""
+    c = columnas["cabecera"]
+    elegidos, n_reemplazados = [], 0
+    for i, (id_conv, ocid) in enumerate(zip(c["id_conv"], c["ocid"])):
+        if not id_conv: continue
+        if ocid in reemplazados:
+            n_reemplazados += 1
+            continue
+        elegidos.append(i)
+    return elegidos, n_reemplazados
+
+def derivar(columnas: Dict[str, Dict[str, List]], elegidos: List[int]) -> Dict[int, Dict]:
+    compiled = columnas["cabecera"]["compiled"]
+    return {i: reglas_mapeo.derivar(compiled[i]) for i in elegidos}
+
+def armar(columnas: Dict[str, Dict[str, List]], elegidos: List[int], derivados: Dict[int, Dict], nombre_archivo: str):
+    """(cabeceras, adjudicaciones, huellas) listas para EscritorLotes."""
+    c, a = columnas["cabecera"], columnas["adjudicacion"]
+    adj_de = {}
+    for j, i in enumerate(a["registro"]):
+        if a["id_adj"][j]: adj_de.setdefault(i, []).append(j)
+
+    cabeceras, adjudicaciones, huellas = [], [], {}
+    for i in elegidos:
+        d = derivados[i]
+        id_conv = c["id_conv"][i]
+        cabecera = (
+            id_conv, c["ocid"][i], c["titulo"][i], c["descripcion"][i], c["comprador"][i], d['categoria'], c["tipo_proc"][i],
+            c["monto"][i], c["moneda"][i], c["fecha"][i], d['estado_proceso'], d['ubicacion_completa'],
+            d['departamento'], d['provincia'], d['distrito'], nombre_archivo
+        )
+        cabeceras.append(cabecera)
+        propias = [(a["id_adj"][j], a["id_contrato"][j], id_conv, a["ganador"][j], a["ruc"][j],
+                    a["monto"][j], a["fecha"][j], 'ADJUDICADO') for j in adj_de.get(i, ())]
+        adjudicaciones.extend(propias)
+        # Si no cambió desde la última carga, el escritor lo descarta
+        if c["ocid"][i]: huellas[id_conv] = huella_registro(cabecera, propias)
+    return cabeceras, adjudicaciones, huellas
+
+def transformar_lote(registros: List[Dict], nombre_archivo: str, reemplazados=frozenset()):
+    """(cabeceras, adjudicaciones, huellas, n_reemplazados) de un lote de registros ya filtrados por tipo."""
+    columnas = limpiar(extraer(registros))
+    elegidos, n_reemplazados = seleccionar(columnas, reemplazados)
+    cabeceras, adjudicaciones, huellas = armar(columnas, elegidos, derivar(columnas, elegidos), nombre_archivo)
+    return cabeceras, adjudicaciones, huellas, n_reemplazados
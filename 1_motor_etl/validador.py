@@ -0,0 +1,215 @@
+"""
+Validación de registros OCDS durante el parseo (antes de transformarlos).
+
+Dos capas, ambas compiladas una sola vez al importar:
+1. Esquema: subconjunto de OCDS que el cargador necesita (tipos de tender, value, items, awards,
+   suppliers, parties...). Con fastjsonschema si está instalado; si no, un compilador mínimo
+   del mismo subconjunto (type, required, properties, items, minLength).
+2. Invariantes de negocio:
+   - ERROR: el registro no se carga y va a cuarentena (ocid o id_convocatoria vacíos, id que no
+     entra en VARCHAR(100) y chocaría con otro al truncarse).
+   - AVISO: el registro se carga igual pero queda anotado (fecha inválida -> NULL, monto que se
+     convierte a 0.0, adjudicación sin id o sin proveedor...). Es lo que antes había que buscar
+     después con auditoria_datos_null.py.
+
+Uso:
+    errores, avisos = validador.validar(registro)
+"""
+import json
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# --- 1. ESQUEMA (SUBCONJUNTO OCDS) ---
+_TEXTO = {"type": ["string", "null"]}
+_ID = {"type": ["string", "integer"]}
+_VALOR = {
+    "type": "object",
+    "properties": {"amount": {"type": ["number", "string", "null"]}, "currency": _TEXTO},
+}
+_DIRECCION = {
+    "type": "object",
+    "properties": {"department": _TEXTO, "region": _TEXTO, "locality": _TEXTO},
+}
+
+ESQUEMA_REGISTRO = {
+    "type": "object",
+    "required": ["ocid", "compiledRelease"],
+    "properties": {
+        "ocid": {"type": "string", "minLength": 1},
+        "compiledRelease": {
+            "type": "object",
+            "required": ["tender"],
+            "properties": {
+                "date": _TEXTO,
+                "tender": {
+                    "type": "object",
+                    "required": ["id"],
+                    "properties": {
+                        "id": _ID,
+                        "title": _TEXTO,
+                        "description": _TEXTO,
+                        "procurementMethodDetails": {"type": "string"},
+                        "mainProcurementCategory": _TEXTO,
+                        "status": _TEXTO,
+                        "value": _VALOR,
+                        "items": {"type": "array", "items": {"type": "object", "properties": {"statusDetails": _TEXTO}}},
+                    },
+                },
+                "buyer": {"type": "object", "properties": {"id": {"type": ["string", "integer", "null"]}, "name": _TEXTO}},
+                "parties": {"type": "array", "items": {"type": "object", "properties": {"address": _DIRECCION}}},
+                "awards": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": ["string", "integer", "null"]},
+                            "date": _TEXTO,
+                            "value": _VALOR,
+                            "suppliers": {"type": "array", "items": {"type": "object", "properties": {"id": {"type": ["string", "integer", "null"]}, "name": _TEXTO}}},
+                        },
+                    },
+                },
+                "contracts": {"type": "array", "items": {"type": "object", "properties": {"id": {"type": ["string", "integer", "null"]}, "awardID": {"type": ["string", "integer", "null"]}}}},
+            },
+        },
+    },
+}
+
+class RegistroInvalido(Exception):
+    pass
+
+_TIPOS = {
+    "object": (dict,), "array": (list,), "string": (str,), "integer": (int,),
+    "number": (int, float), "boolean": (bool,), "null": (type(None),),
+}
+
+def _compilar(esquema: Dict, ruta: str = "data") -> Callable:
+    """Compila el subconjunto de JSON Schema a una función que lanza RegistroInvalido."""
+    tipos = esquema.get("type")
+    tipos = [tipos] if isinstance(tipos, str) else (tipos or [])
+    clases = tuple(c for t in tipos for c in _TIPOS[t])
+    rechaza_bool = "boolean" not in tipos  # en Python bool es int, en JSON Schema no
+    requeridos = esquema.get("required", [])
+    largo_min = esquema.get("minLength")
+    propiedades = list({k: _compilar(v, f"{ruta}.{k}") for k, v in esquema.get("properties", {}).items()}.items())
+    elementos = _compilar(esquema["items"], f"{ruta}[]") if "items" in esquema else None
+    descripcion_tipo = " or ".join(tipos)
+
+    def validar(valor):
+        if clases and (not isinstance(valor, clases) or (rechaza_bool and isinstance(valor, bool))):
+            raise RegistroInvalido(f"{ruta} must be {descripcion_tipo}")
+        if isinstance(valor, dict):
+            for k in requeridos:
+                if k not in valor: raise RegistroInvalido(f"{ruta} must contain ['{k}'] properties")
+            for k, sub in propiedades:
+                if k in valor: sub(valor[k])
+        elif isinstance(valor, list) and elementos is not None:
+            for v in valor: elementos(v)
+        elif largo_min is not None and isinstance(valor, str) and len(valor) < largo_min:
+            raise RegistroInvalido(f"{ruta} must be longer than or equal to {largo_min} characters")
+    return validar
+
+if fastjsonschema is not None:
+    _validar_esquema_fast = fastjsonschema.compile(ESQUEMA_REGISTRO)
+    def _validar_esquema(registro):
+        try:
+            _validar_esquema_fast(registro)
+        except fastjsonschema.JsonSchemaValueException as e:
+            raise RegistroInvalido(e.message)
+else:
+    _validar_esquema = _compilar(ESQUEMA_REGISTRO)
+
+def describir_backend() -> str:
+    return "fastjsonschema" if fastjsonschema is not None else "esquema compilado (sin fastjsonschema)"
+
+# --- 2. INVARIANTES DE NEGOCIO ---
+LARGO_ID = 100  # VARCHAR(100) de id_convocatoria / ocid / id_adjudicacion
+
+@lru_cache(maxsize=65536)
+def _dia_valido(dia: str) -> bool:
+    try:
+        datetime.strptime(dia, '%Y-%m-%d')
+        return True
+    except ValueError:
+        return False
+
+def _fecha_valida(valor) -> bool:
+    return isinstance(valor, str) and _dia_valido(valor[:10])
+
+def _monto_valido(valor) -> Optional[str]:
+    """None si el monto se carga tal cual; si no, el motivo."""
+    if valor is None: return None
+    try:
+        monto = float(valor)
+    except (TypeError, ValueError):
+        return f"monto no numérico {valor!r} (se carga 0.0)"
+    if monto < 0: return f"monto negativo {monto}"
+    return None
+
+def invariantes(registro: Dict) -> Tuple[List[str], List[str]]:
+    """(errores, avisos) de un registro que ya cumple el esquema."""
+    errores, avisos = [], []
+    compiled = registro["compiledRelease"]
+    tender = compiled["tender"]
+
+    ocid = registro["ocid"].strip()
+    id_conv = str(tender["id"]).strip()
+    if not ocid: errores.append("ocid vacío")
+    if not id_conv: errores.append("tender.id (id_convocatoria) vacío")
+    if len(ocid) > LARGO_ID: errores.append(f"ocid de {len(ocid)} caracteres (máximo {LARGO_ID})")
+    if len(id_conv) > LARGO_ID: errores.append(f"tender.id de {len(id_conv)} caracteres (máximo {LARGO_ID})")
+
+    if not _fecha_valida(compiled.get("date")):
+        avisos.append(f"compiledRelease.date inválida {compiled.get('date')!r} (fecha_publicacion NULL)")
+    motivo = _monto_valido((tender.get("value") or {}).get("amount"))
+    if motivo: avisos.append(f"tender.value: {motivo}")
+
+    vistos = set()
+    for i, aw in enumerate(compiled.get("awards", [])):
+        id_adj = aw.get("id")
+        if id_adj is None or not str(id_adj).strip():
+            avisos.append(f"awards[{i}] sin id (no se carga)")
+            continue
+        id_adj = str(id_adj).strip()
+        if id_adj in vistos: avisos.append(f"awards[{i}] id {id_adj!r} repetido (queda la última)")
+        vistos.add(id_adj)
+        if len(id_adj) > LARGO_ID: avisos.append(f"awards[{i}] id de {len(id_adj)} caracteres (se trunca)")
+        if not aw.get("suppliers"): avisos.append(f"awards[{i}] sin proveedor (ganador DESCONOCIDO)")
+        if aw.get("date") and not _fecha_valida(aw["date"]):
+            avisos.append(f"awards[{i}].date inválida {aw['date']!r}")
+        motivo = _monto_valido((aw.get("value") or {}).get("amount"))
+        if motivo: avisos.append(f"awards[{i}].value: {motivo}")
+    return errores, avisos
+
+# --- 3. API ---
+def validar(registro) -> Tuple[List[str], List[str]]:
+    """(errores, avisos). Con errores el registro no debe cargarse."""
+    try:
+        _validar_esquema(registro)
+    except RegistroInvalido as e:
+        return [f"esquema: {e}"], []
+    return invariantes(registro)
+
+def tipo_procedimiento(registro) -> Optional[str]:
+    """procurementMethodDetails sin suponer la forma del registro (para filtrar antes de validar)."""
+    compiled = registro.get("compiledRelease") if isinstance(registro, dict) else None
+    tender = compiled.get("tender") if isinstance(compiled, dict) else None
+    return tender.get("procurementMethodDetails") if isinstance(tender, dict) else None
+
+def identificadores(registro) -> Tuple[Optional[str], Optional[str]]:
+    """(ocid, id_convocatoria) recortados a LARGO_ID, o None si no se pueden leer."""
+    ocid = registro.get("ocid") if isinstance(registro, dict) else None
+    compiled = registro.get("compiledRelease") if isinstance(registro, dict) else None
+    tender = compiled.get("tender") if isinstance(compiled, dict) else None
+    id_conv = tender.get("id") if isinstance(tender, dict) else None
+    return (str(ocid).strip()[:LARGO_ID] or None if ocid is not None else None,
+            str(id_conv).strip()[:LARGO_ID] or None if id_conv is not None else None)
+
+def serializar(registro) -> str:
+    return json.dumps(registro, ensure_ascii=False, default=str)
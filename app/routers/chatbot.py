@@ -8,6 +8,7 @@ from sqlalchemy import text, inspect
 from sqlalchemy.exc import SQLAlchemyError
 from groq import Groq
 from app.database import get_db, engine
+from app.utils.procedimientos import TIPOS_DEFECTO, TODOS
 
 # Initialize Router
 router = APIRouter(
@@ -211,6 +212,18 @@ class ChatService:
         
         allowed_tables_str = ", ".join(allowed_tables)
         sensitive_tables_str = ", ".join(sensitive_tables)
+
+        # Same default scope as the dashboards (app/utils/procedimientos.filtro_tipo)
+        if not TIPOS_DEFECTO or TODOS in TIPOS_DEFECTO:
+            scope_rules = "- No default procurement-method filter: all tipo_procedimiento values are in scope."
+        else:
+            tipos_str = ", ".join("'" + t.replace("'", "''") + "'" for t in TIPOS_DEFECTO)
+            scope_rules = (
+                f"- Every query over licitaciones_cabecera MUST filter tipo_procedimiento IN ({tipos_str}),\n"
+                "  unless the user explicitly asks for another procurement method or for all of them.\n"
+                "- licitaciones_adjudicaciones has no tipo_procedimiento: JOIN licitaciones_cabecera c ON\n"
+                f"  a.id_convocatoria = c.id_convocatoria and filter c.tipo_procedimiento IN ({tipos_str})."
+            )
         
         system_prompt = f"""You are AURA, an expert MySQL Database Assistant.
 Goal: Generate ONE safe, READ-ONLY MySQL query that answers the user using ONLY the provided schema.
@@ -245,6 +258,9 @@ JOIN RULES (CRITICAL FOR ACCURACY):
 - If a join is needed but the join key is not clear from schema, return:
   CLARIFY: ¿Con qué campo se relacionan estas tablas? (por ejemplo id_convocatoria, ocid, id_contrato)
 
+PROCUREMENT METHOD SCOPE (same as the dashboards):
+{scope_rules}
+
 LOCATION HINTS:
 - Major cities (Lima, Arequipa, Cusco, Trujillo, etc.) → check departamento first
 - Smaller cities/districts (Tarapoto, Chiclayo, Iquitos, etc.) → check distrito or provincia
@@ -6,8 +6,10 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.database import get_db
+from app.utils.procedimientos import filtro_tipo
 from typing import Optional
 from decimal import Decimal
+from datetime import date
 
 router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
@@ -33,9 +35,10 @@ def get_dashboard_kpis(
         if estado:
             where_clauses.append("estado_proceso = :estado")
             params['estado'] = estado
-        if tipo_procedimiento:
-            where_clauses.append("tipo_procedimiento = :tipo_proc")
-            params['tipo_proc'] = tipo_procedimiento
+        # Sin tipo explícito: los tipos por defecto del dashboard (Licitación Pública)
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        if filtro:
+            where_clauses.append(filtro)
         if categoria:
             where_clauses.append("categoria = :categoria")
             params['categoria'] = categoria
@@ -145,26 +148,40 @@ def get_dashboard_kpis(
 
 
 @router.get("/filter-options")
-def get_filter_options(db: Session = Depends(get_db)):
+def get_filter_options(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     """
     Get all available filter options for dropdowns (Raw SQL version).
+    Options come from the same procedure types the dashboards show; the types list itself is not scoped.
     """
     try:
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        y_tipo = f" AND {filtro}" if filtro else ""
+
         # Estados
-        estados = db.execute(text("SELECT DISTINCT estado_proceso FROM licitaciones_cabecera WHERE estado_proceso IS NOT NULL AND estado_proceso != '' ORDER BY estado_proceso")).fetchall()
+        estados = db.execute(text(f"SELECT DISTINCT estado_proceso FROM licitaciones_cabecera WHERE estado_proceso IS NOT NULL AND estado_proceso != ''{y_tipo} ORDER BY estado_proceso"), params).fetchall()
         
         # Categorias
-        categorias = db.execute(text("SELECT DISTINCT categoria FROM licitaciones_cabecera WHERE categoria IS NOT NULL AND categoria != '' ORDER BY categoria")).fetchall()
+        categorias = db.execute(text(f"SELECT DISTINCT categoria FROM licitaciones_cabecera WHERE categoria IS NOT NULL AND categoria != ''{y_tipo} ORDER BY categoria"), params).fetchall()
         
         # Departamentos
-        deptos = db.execute(text("SELECT DISTINCT departamento FROM licitaciones_cabecera WHERE departamento IS NOT NULL AND departamento != '' ORDER BY departamento")).fetchall()
+        deptos = db.execute(text(f"SELECT DISTINCT departamento FROM licitaciones_cabecera WHERE departamento IS NOT NULL AND departamento != ''{y_tipo} ORDER BY departamento"), params).fetchall()
         
         # Tipos Entidad
         tipos = db.execute(text("SELECT DISTINCT tipo_procedimiento FROM licitaciones_cabecera WHERE tipo_procedimiento IS NOT NULL AND tipo_procedimiento != '' ORDER BY tipo_procedimiento")).fetchall()
         
         # Aseguradoras (check if table exists or has data)
         try:
-            aseguradoras = db.execute(text("SELECT DISTINCT entidad_financiera FROM licitaciones_adjudicaciones WHERE entidad_financiera IS NOT NULL AND entidad_financiera != '' ORDER BY entidad_financiera")).fetchall()
+            filtro_c = filtro_tipo(tipo_procedimiento, params, "c.tipo_procedimiento")
+            aseguradoras = db.execute(text(f"""
+                SELECT DISTINCT a.entidad_financiera FROM licitaciones_adjudicaciones a
+                JOIN licitaciones_cabecera c ON c.id_convocatoria = a.id_convocatoria
+                WHERE a.entidad_financiera IS NOT NULL AND a.entidad_financiera != ''{f" AND {filtro_c}" if filtro_c else ""}
+                ORDER BY a.entidad_financiera
+            """), params).fetchall()
         except:
             aseguradoras = []
 
@@ -186,56 +203,76 @@ def get_filter_options(db: Session = Depends(get_db)):
         }
 
 @router.get("/distribution-by-type")
-def get_distribution_by_type(db: Session = Depends(get_db)):
+def get_distribution_by_type(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     try:
-        sql = text("""
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        sql = text(f"""
             SELECT 
                 categoria as name,
                 COUNT(*) as value,
                 COALESCE(SUM(monto_estimado), 0) as amount
             FROM licitaciones_cabecera
             WHERE categoria IS NOT NULL AND categoria != ''
+            {("AND " + filtro) if filtro else ""}
             GROUP BY categoria
             ORDER BY value DESC
         """)
-        result = db.execute(sql).fetchall()
+        result = db.execute(sql, params).fetchall()
         data = [{"name": row[0], "value": row[1], "amount": float(row[2])} for row in result]
         return {"data": data}
     except Exception as e:
         return {"data": [], "error": str(e)}
 
 @router.get("/stats-by-status")
-def get_stats_by_status(db: Session = Depends(get_db)):
+def get_stats_by_status(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     try:
-        sql = text("""
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        sql = text(f"""
             SELECT 
                 estado_proceso as name,
                 COUNT(*) as value
             FROM licitaciones_cabecera
             WHERE estado_proceso IS NOT NULL AND estado_proceso != ''
+            {("AND " + filtro) if filtro else ""}
             GROUP BY estado_proceso
             ORDER BY value DESC
         """)
-        result = db.execute(sql).fetchall()
+        result = db.execute(sql, params).fetchall()
         data = [{"name": row[0], "value": row[1]} for row in result]
         return {"data": data}
     except Exception as e:
         return {"data": [], "error": str(e)}
 
 @router.get("/monthly-trend")
-def get_monthly_trend(year: int = 2024, db: Session = Depends(get_db)):
+def get_monthly_trend(
+    year: int = 2024,
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     try:
-        sql = text("""
+        params = {"desde": date(year, 1, 1), "hasta": date(year + 1, 1, 1)}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        # Rango en vez de YEAR(fecha_publicacion) para que use el índice (tipo_procedimiento, fecha_publicacion)
+        sql = text(f"""
             SELECT 
                 MONTH(fecha_publicacion) as mes,
                 COUNT(*) as count,
                 COALESCE(SUM(monto_estimado), 0) as amount
             FROM licitaciones_cabecera
-            WHERE YEAR(fecha_publicacion) = :year
+            WHERE fecha_publicacion >= :desde AND fecha_publicacion < :hasta
+            {("AND " + filtro) if filtro else ""}
             GROUP BY MONTH(fecha_publicacion)
             ORDER BY mes
         """)
-        result = db.execute(sql, {"year": year}).fetchall()
+        result = db.execute(sql, params).fetchall()
         
         months = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
         data = []
@@ -253,63 +290,78 @@ def get_monthly_trend(year: int = 2024, db: Session = Depends(get_db)):
         return {"data": [], "error": str(e)}
 
 @router.get("/department-ranking")
-def get_department_ranking(db: Session = Depends(get_db)):
+def get_department_ranking(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     try:
-        sql = text("""
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        sql = text(f"""
             SELECT 
                 departamento as name,
                 COUNT(*) as count,
                 COALESCE(SUM(monto_estimado), 0) as amount
             FROM licitaciones_cabecera
             WHERE departamento IS NOT NULL AND departamento != ''
+            {("AND " + filtro) if filtro else ""}
             GROUP BY departamento
             ORDER BY count DESC
             LIMIT 10
         """)
-        result = db.execute(sql).fetchall()
+        result = db.execute(sql, params).fetchall()
         data = [{"name": row[0], "count": row[1], "amount": float(row[2])} for row in result]
         return {"data": data}
     except Exception as e:
         return {"data": [], "error": str(e)}
 
 @router.get("/financial-entities-ranking")
-def get_financial_entities_ranking(db: Session = Depends(get_db)):
+def get_financial_entities_ranking(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
+    params = {}
+    filtro = filtro_tipo(tipo_procedimiento, params, "c.tipo_procedimiento")
+    y_tipo = f"AND {filtro}" if filtro else ""
     try:
         # Use licitaciones_adjudicaciones for entities (Insurers) if available
         # OR licitaciones_cabecera 'comprador' (Entities buying) if preferred?
         # The name "Financial Entities" implies Insurers.
-        sql = text("""
+        sql = text(f"""
             SELECT 
-                entidad_financiera as name,
+                a.entidad_financiera as name,
                 COUNT(*) as count,
-                COALESCE(SUM(monto_adjudicado), 0) as amount
-            FROM licitaciones_adjudicaciones
-            WHERE entidad_financiera IS NOT NULL 
-              AND entidad_financiera != '' 
-              AND entidad_financiera != 'SIN_GARANTIA'
-              AND entidad_financiera != 'ERROR_API_500'
-            GROUP BY entidad_financiera
+                COALESCE(SUM(a.monto_adjudicado), 0) as amount
+            FROM licitaciones_adjudicaciones a
+            JOIN licitaciones_cabecera c ON c.id_convocatoria = a.id_convocatoria
+            WHERE a.entidad_financiera IS NOT NULL 
+              AND a.entidad_financiera != '' 
+              AND a.entidad_financiera != 'SIN_GARANTIA'
+              AND a.entidad_financiera != 'ERROR_API_500'
+              {y_tipo}
+            GROUP BY a.entidad_financiera
             ORDER BY count DESC
             LIMIT 10
         """)
-        result = db.execute(sql).fetchall()
+        result = db.execute(sql, params).fetchall()
         data = [{"name": row[0], "count": row[1], "amount": float(row[2])} for row in result]
         return {"data": data}
     except Exception as e:
          # Fallback to Comprador if Adjudicaciones is empty or fails
         try:
-             sql_fallback = text("""
+             sql_fallback = text(f"""
                 SELECT 
                     comprador as name,
                     COUNT(*) as count,
                     COALESCE(SUM(monto_estimado), 0) as amount
-                FROM licitaciones_cabecera
+                FROM licitaciones_cabecera c
                 WHERE comprador IS NOT NULL AND comprador != ''
+                {y_tipo}
                 GROUP BY comprador
                 ORDER BY count DESC
                 LIMIT 10
             """)
-             result = db.execute(sql_fallback).fetchall()
+             result = db.execute(sql_fallback, params).fetchall()
              data = [{"name": row[0], "count": row[1], "amount": float(row[2])} for row in result]
              return {"data": data}
         except:
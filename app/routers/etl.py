@@ -5,14 +5,19 @@ import subprocess
 import sys
 import os
 import logging
-from fastapi import APIRouter, HTTPException
-from typing import Dict, List
+import sqlite3
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, List, Optional
 from datetime import datetime
 import asyncio
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/etl", tags=["ETL"])
 
+# Manifiesto que escribe 1_motor_etl/descargador.py (SQLite local)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MANIFIESTO_DB = os.path.join(PROJECT_ROOT, "1_database", "manifiesto.db")
+
 # Global state for ETL execution
 etl_state = {
     "is_running": False,
@@ -37,6 +42,48 @@ class ETLHistoryItem(BaseModel):
     status: str
     details: str
 
+class DescargaManifiestoItem(BaseModel):
+    nombre_base: str
+    anio: Optional[int] = None
+    mes: Optional[int] = None
+    url: Optional[str] = None
+    estado: Optional[str] = None
+    mensaje: Optional[str] = None
+    disponible: bool = False
+    bytes_json: Optional[int] = None
+    content_length: Optional[int] = None
+    formato: Optional[str] = None
+    algoritmo: Optional[str] = None
+    digest_json: Optional[str] = None
+    sha_verificado: Optional[bool] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    duracion_s: Optional[float] = None
+    actualizado: Optional[str] = None
+
+class HistorialDescargaItem(BaseModel):
+    nombre_base: str
+    inicio: str
+    duracion_s: Optional[float] = None
+    bytes_red: Optional[int] = None
+    mb_por_segundo: Optional[float] = None
+    estado: Optional[str] = None
+    mensaje: Optional[str] = None
+
+def _consultar_manifiesto(sql: str, params: tuple = ()) -> List[dict]:
+    if not os.path.exists(MANIFIESTO_DB):
+        return []
+    try:
+        conn = sqlite3.connect(f"file:{MANIFIESTO_DB}?mode=ro", uri=True, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Error reading download manifest: {e}")
+        raise HTTPException(status_code=500, detail=f"Error reading download manifest: {str(e)}")
+
 @router.post("/execute", response_model=ETLExecutionResponse)
 async def execute_etl():
     """
@@ -166,6 +213,33 @@ async def get_etl_history():
     
     return history
 
+@router.get("/descargas", response_model=List[DescargaManifiestoItem])
+async def get_download_manifest(anio: Optional[int] = Query(None, description="Filter by year")):
+    """
+    Get the per-month download manifest (validators, size, checksum, SHA verification).
+    """
+    sql = "SELECT * FROM descargas"
+    params = ()
+    if anio:
+        sql += " WHERE anio = ?"
+        params = (anio,)
+    filas = _consultar_manifiesto(sql + " ORDER BY nombre_base", params)
+    return [DescargaManifiestoItem(**{**f, "disponible": bool(f.get("disponible"))}) for f in filas]
+
+@router.get("/descargas/historial", response_model=List[HistorialDescargaItem])
+async def get_download_history(limit: int = Query(100, ge=1, le=1000)):
+    """
+    Get the most recent download attempts with throughput, to spot OECE slowdowns.
+    """
+    filas = _consultar_manifiesto("""
+        SELECT nombre_base, inicio, duracion_s, bytes_red, estado, mensaje
+        FROM historial_descargas ORDER BY id DESC LIMIT ?
+    """, (limit,))
+    for f in filas:
+        if f["duracion_s"] and f["bytes_red"]:
+            f["mb_por_segundo"] = round(f["bytes_red"] / f["duracion_s"] / 1024 / 1024, 2)
+    return [HistorialDescargaItem(**f) for f in filas]
+
 @router.post("/stop")
 async def stop_etl():
     """
@@ -1,10 +1,12 @@
 """
 Raw SQL licitaciones endpoint - bypasses SQLAlchemy mapper issues
 """
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.database import get_db
+from app.utils.procedimientos import filtro_tipo
+from app.utils import registro_crudo
 from typing import Optional
 from datetime import date
 
@@ -19,6 +21,7 @@ def get_licitaciones(
     estado: Optional[str] = Query(None),
     categoria: Optional[str] = Query(None),
     departamento: Optional[str] = Query(None),
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
     db: Session = Depends(get_db)
 ):
     """
@@ -43,6 +46,10 @@ def get_licitaciones(
         if departamento:
             where_clauses.append("departamento = :departamento")
             params['departamento'] = departamento
+        # Sin tipo explícito: los tipos por defecto del dashboard (Licitación Pública)
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        if filtro:
+            where_clauses.append(filtro)
         
         where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
         
@@ -130,6 +137,18 @@ def get_licitaciones(
         }
 
 
+@router.get("/{id_convocatoria}/raw")
+def get_licitacion_raw(id_convocatoria: str):
+    """
+    Source OCDS compiledRelease of a tender, read straight from the month file on disk
+    (memory-mapped, via the ocid index built by cargador.py). Accepts id_convocatoria or ocid.
+    """
+    resultado = registro_crudo.registro_mas_reciente(id_convocatoria)
+    if resultado is None:
+        raise HTTPException(status_code=404, detail=f"Licitación {id_convocatoria} no está en el índice OCDS")
+    return resultado
+
+
 @router.get("/{id_convocatoria}")
 def get_licitacion_detail(
     id_convocatoria: str,
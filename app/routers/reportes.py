@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func, case, text
 from typing import Optional, List, Any
 from pydantic import BaseModel
 from app.database import get_db
+from app.utils.procedimientos import filtro_tipo
 from app.models.seace import LicitacionesCabecera, LicitacionesAdjudicaciones
 from datetime import datetime
 
@@ -20,6 +21,7 @@ class ReporteFiltros(BaseModel):
     aseguradora: Optional[str] = None
     year: Optional[str] = None
     mes: Optional[str] = None
+    tipo_procedimiento: Optional[str] = None  # None = dashboard default types, '*' = all
 
 class GenerarReporteRequest(BaseModel):
     tipo: str  # 'entidad', 'departamento', 'categoria', 'estado', 'personalizado'
@@ -53,6 +55,9 @@ def generar_reporte(request: GenerarReporteRequest, db: Session = Depends(get_db
     where_clauses = ["a.entidad_financiera IS NOT NULL", "a.entidad_financiera != ''", "a.entidad_financiera != 'SIN_GARANTIA'"] if tipo == 'entidad' else ["1=1"]
     
     # Apply filters to WHERE
+    filtro = filtro_tipo(filtros.tipo_procedimiento, params, "c.tipo_procedimiento")
+    if filtro:
+        where_clauses.append(filtro)
     if filtros.departamento:
         where_clauses.append("UPPER(c.departamento) = UPPER(:departamento)")
         params['departamento'] = filtros.departamento
@@ -205,19 +210,25 @@ def generar_reporte(request: GenerarReporteRequest, db: Session = Depends(get_db
         }
 
 @router.get("/resumen-ejecutivo")
-def get_resumen_ejecutivo(db: Session = Depends(get_db)):
+def get_resumen_ejecutivo(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     """
     Endpoint for EcommerceMetrics card.
     Returns total tenders and total adjudicated amount.
     """
     try:
-        sql = text("""
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        sql = text(f"""
             SELECT 
                 COUNT(*) as total_licitaciones,
                 COALESCE(SUM(monto_estimado), 0) as monto_total
             FROM licitaciones_cabecera
+            {f"WHERE {filtro}" if filtro else ""}
         """)
-        result = db.execute(sql).fetchone()
+        result = db.execute(sql, params).fetchone()
         
         return {
             "success": True,
@@ -230,23 +241,29 @@ def get_resumen_ejecutivo(db: Session = Depends(get_db)):
         return {"success": False, "error": str(e)}
 
 @router.get("/por-departamento")
-def get_reporte_por_departamento(db: Session = Depends(get_db)):
+def get_reporte_por_departamento(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     """
     Endpoint for DemographicCard.
     Returns list of departments with count and amount.
     """
     try:
-        sql = text("""
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        sql = text(f"""
             SELECT 
                 departamento,
                 COUNT(*) as total,
                 COALESCE(SUM(monto_estimado), 0) as monto_total
             FROM licitaciones_cabecera
             WHERE departamento IS NOT NULL AND departamento != ''
+            {f"AND {filtro}" if filtro else ""}
             GROUP BY departamento
             ORDER BY total DESC
         """)
-        result = db.execute(sql).fetchall()
+        result = db.execute(sql, params).fetchall()
         
         departamentos = []
         for row in result:
@@ -266,13 +283,19 @@ def get_reporte_por_departamento(db: Session = Depends(get_db)):
         return {"success": False, "error": str(e)}
 
 @router.get("/por-provincia/{departamento}")
-def get_reporte_por_provincia(departamento: str, db: Session = Depends(get_db)):
+def get_reporte_por_provincia(
+    departamento: str,
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     """
     Endpoint for DemographicCard drill-down.
     Returns list of provinces for a specific department.
     """
     try:
-        sql = text("""
+        params = {"dept": departamento}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        sql = text(f"""
             SELECT 
                 provincia,
                 COUNT(*) as total,
@@ -281,10 +304,11 @@ def get_reporte_por_provincia(departamento: str, db: Session = Depends(get_db)):
             WHERE departamento = :dept 
               AND provincia IS NOT NULL 
               AND provincia != ''
+              {f"AND {filtro}" if filtro else ""}
             GROUP BY provincia
             ORDER BY total DESC
         """)
-        result = db.execute(sql, {"dept": departamento}).fetchall()
+        result = db.execute(sql, params).fetchall()
         
         provincias = []
         for row in result:
@@ -304,13 +328,18 @@ def get_reporte_por_provincia(departamento: str, db: Session = Depends(get_db)):
         return {"success": False, "error": str(e)}
 
 @router.get("/por-tiempo")
-def get_reporte_por_tiempo(db: Session = Depends(get_db)):
+def get_reporte_por_tiempo(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     """
     Endpoint for StatisticsChart.
     Returns tenders grouped by year and month.
     """
     try:
-        sql = text("""
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        sql = text(f"""
             SELECT 
                 YEAR(fecha_publicacion) as anio,
                 MONTH(fecha_publicacion) as mes_num,
@@ -318,10 +347,11 @@ def get_reporte_por_tiempo(db: Session = Depends(get_db)):
                 COUNT(*) as total
             FROM licitaciones_cabecera
             WHERE fecha_publicacion IS NOT NULL
+            {f"AND {filtro}" if filtro else ""}
             GROUP BY YEAR(fecha_publicacion), MONTH(fecha_publicacion)
             ORDER BY anio DESC, mes_num ASC
         """)
-        result = db.execute(sql).fetchall()
+        result = db.execute(sql, params).fetchall()
         
         # Process data into expected format: { "2024": { months: [], licitaciones: [] } }
         data = {}
@@ -349,17 +379,22 @@ def get_reporte_por_tiempo(db: Session = Depends(get_db)):
         return {"success": False, "error": str(e)}
 
 @router.get("/por-entidad-financiera")
-def get_reporte_por_entidad_financiera(db: Session = Depends(get_db)):
+def get_reporte_por_entidad_financiera(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     """
     Endpoint for TopEntidadesFinancieras.
     """
     try:
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params, "c.tipo_procedimiento")
         # Check if we have data in adjudicaciones
         check_sql = text("SELECT COUNT(*) FROM licitaciones_adjudicaciones")
         count = db.execute(check_sql).scalar()
         
         if count > 0:
-            sql = text("""
+            sql = text(f"""
                 SELECT 
                     entidad_financiera,
                     COUNT(*) as total,
@@ -371,11 +406,12 @@ def get_reporte_por_entidad_financiera(db: Session = Depends(get_db)):
                   AND a.entidad_financiera != ''
                   AND a.entidad_financiera != 'SIN_GARANTIA'
                   AND a.entidad_financiera NOT LIKE '%ERROR%'
+                  {f"AND {filtro}" if filtro else ""}
                 GROUP BY entidad_financiera
                 ORDER BY total DESC
                 LIMIT 20
             """)
-            result = db.execute(sql).fetchall()
+            result = db.execute(sql, params).fetchall()
             entidades = []
             for row in result:
                 entidades.append({
@@ -399,21 +435,27 @@ def get_reporte_por_entidad_financiera(db: Session = Depends(get_db)):
         return {"success": False, "error": str(e)}
 
 @router.get("/por-estado")
-def get_reporte_por_estado(db: Session = Depends(get_db)):
+def get_reporte_por_estado(
+    tipo_procedimiento: Optional[str] = Query(None, description="Filter by tipo_procedimiento ('*' = all)"),
+    db: Session = Depends(get_db)
+):
     """
     Endpoint for MonthlySalesChart (Licitaciones por Estado).
     """
     try:
-        sql = text("""
+        params = {}
+        filtro = filtro_tipo(tipo_procedimiento, params)
+        sql = text(f"""
             SELECT 
                 estado_proceso,
                 COUNT(*) as total
             FROM licitaciones_cabecera
             WHERE estado_proceso IS NOT NULL AND estado_proceso != ''
+            {f"AND {filtro}" if filtro else ""}
             GROUP BY estado_proceso
             ORDER BY total DESC
         """)
-        result = db.execute(sql).fetchall()
+        result = db.execute(sql, params).fetchall()
         
         estados = []
         for row in result:
@@ -7,6 +7,7 @@ from datetime import datetime, timedelta, timezone
 from typing import List
 from app.models.notification import NotificationType, NotificationPriority
 from app.services.notification_service import notification_service
+from app.utils.procedimientos import filtro_tipo
 import logging
 
 logger = logging.getLogger(__name__)
@@ -103,12 +104,15 @@ class NotificationTriggers:
         
         try:
             # Buscar licitaciones nuevas (últimas 24 horas)
-            query = text("""
+            params = {}
+            filtro = filtro_tipo(None, params, "l.tipo_procedimiento")
+            query = text(f"""
                 SELECT DISTINCT l.id_convocatoria, l.descripcion, l.comprador, 
                        l.monto_estimado, l.departamento, u.id as user_id
                 FROM licitaciones_cabecera l
                 CROSS JOIN usuarios u
                 WHERE l.fecha_publicacion >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
+                {f"AND {filtro}" if filtro else ""}
                 AND u.activo = 1
                 AND NOT EXISTS (
                     SELECT 1 FROM notification_tracking nt
@@ -120,7 +124,7 @@ class NotificationTriggers:
                 LIMIT 50
             """)
             
-            result = db.execute(query)
+            result = db.execute(query, params)
             
             for row in result:
                 monto_texto = f"S/ {row.monto_estimado:,.2f}" if row.monto_estimado else "No especificado"
@@ -160,7 +164,9 @@ class NotificationTriggers:
         notifications_created = 0
         
         try:
-            query = text("""
+            params = {}
+            filtro = filtro_tipo(None, params, "l.tipo_procedimiento")
+            query = text(f"""
                 SELECT DISTINCT a.id_adjudicacion, a.id_convocatoria, a.ganador_nombre,
                        a.monto_adjudicado, a.fecha_adjudicacion, l.descripcion,
                        u.id as user_id
@@ -168,6 +174,7 @@ class NotificationTriggers:
                 JOIN licitaciones_cabecera l ON a.id_convocatoria = l.id_convocatoria
                 CROSS JOIN usuarios u
                 WHERE a.fecha_adjudicacion >= DATE_SUB(NOW(), INTERVAL 12 HOUR)
+                {f"AND {filtro}" if filtro else ""}
                 AND u.activo = 1
                 AND NOT EXISTS (
                     SELECT 1 FROM notification_tracking nt
@@ -178,7 +185,7 @@ class NotificationTriggers:
                 LIMIT 50
             """)
             
-            result = db.execute(query)
+            result = db.execute(query, params)
             
             for row in result:
                 monto_texto = f"S/ {row.monto_adjudicado:,.2f}" if row.monto_adjudicado else "Monto no especificado"
@@ -218,12 +225,15 @@ class NotificationTriggers:
         
         try:
             # Ejemplo: Detectar licitaciones que cambiaron a estado "CANCELADA" o "DESIERTA"
-            query = text("""
+            params = {}
+            filtro = filtro_tipo(None, params, "l.tipo_procedimiento")
+            query = text(f"""
                 SELECT DISTINCT l.id_convocatoria, l.descripcion, l.estado, u.id as user_id
                 FROM licitaciones_cabecera l
                 CROSS JOIN usuarios u
                 WHERE l.estado IN ('CANCELADA', 'DESIERTA', 'SUSPENDIDA')
                 AND l.fecha_actualizacion >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
+                {f"AND {filtro}" if filtro else ""}
                 AND u.activo = 1
                 AND NOT EXISTS (
                     SELECT 1 FROM notification_tracking nt
@@ -235,7 +245,7 @@ class NotificationTriggers:
                 LIMIT 30
             """)
             
-            result = db.execute(query)
+            result = db.execute(query, params)
             
             for row in result:
                 estado_emoji = {
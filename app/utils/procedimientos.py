@@ -0,0 +1,33 @@
+"""
+Default procurement-method scope for dashboard queries.
+
+The ETL can load every procurement method (1_motor_etl/cargador.py --tipos), but the dashboards
+were built for Licitación Pública. Queries without an explicit tipo_procedimiento are scoped to
+DASHBOARD_TIPOS (comma separated, "*" = all methods) so their numbers do not change when the
+full universe is loaded, and so they hit the indexes led by tipo_procedimiento.
+"""
+import os
+from typing import Dict, Optional
+
+TODOS = "*"
+TIPOS_DEFECTO = [t.strip() for t in os.getenv("DASHBOARD_TIPOS", "Licitación Pública").split(",") if t.strip()]
+
+
+def filtro_tipo(tipo_procedimiento: Optional[str], params: Dict, columna: str = "tipo_procedimiento") -> Optional[str]:
+    """
+    WHERE condition for the requested method (adds its bind params), or None when nothing is filtered.
+    tipo_procedimiento="*" asks explicitly for all methods.
+    """
+    if tipo_procedimiento == TODOS or (not tipo_procedimiento and (not TIPOS_DEFECTO or TODOS in TIPOS_DEFECTO)):
+        return None
+    if tipo_procedimiento:
+        params["tipo_proc"] = tipo_procedimiento
+        return f"{columna} = :tipo_proc"
+    if len(TIPOS_DEFECTO) == 1:
+        params["tipo_proc"] = TIPOS_DEFECTO[0]
+        return f"{columna} = :tipo_proc"
+    marcas = []
+    for i, tipo in enumerate(TIPOS_DEFECTO):
+        params[f"tipo_proc_{i}"] = tipo
+        marcas.append(f":tipo_proc_{i}")
+    return f"{columna} IN ({', '.join(marcas)})"
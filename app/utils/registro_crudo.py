@@ -0,0 +1,149 @@
+"""
+Direct read of one OCDS record from the monthly files on disk, without scanning the month.
+
+Uses 1_database/indice_ocid.db, written by 1_motor_etl/indice_ocid.py (ocid / id_convocatoria ->
+month, offset, length): only the record's bytes are read from the JSON, so a lookup takes
+milliseconds even when the month weighs several GB. If only the NDJSON parts of the month are
+left, only the part holding the record is read.
+
+The month file is opened just for the read and closed right away: on Windows an open handle or
+mapping would block the downloader from replacing or deleting that month while the API is up.
+Offsets are only trusted while the file still has the size and mtime recorded in the index.
+
+Standard library only (plus zstandard when the parts are zstd compressed).
+
+Usage:
+    python -m app.utils.registro_crudo 1234567          # id_convocatoria or ocid
+"""
+import io
+import os
+import sys
+import json
+import gzip
+import sqlite3
+from typing import Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CARPETA_DATABASE = os.path.join(PROJECT_ROOT, "1_database")
+RUTA_INDICE = os.path.join(CARPETA_DATABASE, "indice_ocid.db")
+
+
+class RegistroNoEncontrado(Exception):
+    pass
+
+
+# --- 1. LOCATION ---
+def ubicar(identificador: str, ruta_indice: Optional[str] = None) -> List[Dict]:
+    """Occurrences of an ocid or id_convocatoria across all months, newest first."""
+    ruta_indice = ruta_indice or RUTA_INDICE
+    if not os.path.exists(ruta_indice): return []
+    conn = sqlite3.connect(f"file:{ruta_indice}?mode=ro", uri=True, timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        filas = conn.execute("""
+            SELECT o.ocid, o.id_convocatoria, o.nombre_archivo, o.fecha, o.posicion, o.largo, a.fuente, a.bytes, a.mtime
+            FROM ocurrencias o JOIN archivos a ON a.nombre_archivo = o.nombre_archivo
+            WHERE o.ocid = ? OR o.id_convocatoria = ?
+            ORDER BY COALESCE(o.fecha, '') DESC, o.nombre_archivo DESC, o.posicion DESC
+        """, (identificador, identificador))
+        return [dict(f) for f in filas]
+    finally:
+        conn.close()
+
+
+# --- 2. JSON SLICE ---
+def leer_bytes(ruta_json: str, posicion: int, largo: int, firma: Optional[tuple] = None) -> bytes:
+    """
+    Slice of the month's JSON. With 'firma' (size, mtime from the index) it fails if the file
+    changed since it was indexed. The handle is closed before returning.
+    """
+    with open(ruta_json, "rb") as f:
+        st = os.fstat(f.fileno())
+        if firma is not None and (st.st_size, st.st_mtime) != tuple(firma):
+            raise RegistroNoEncontrado(f"{os.path.basename(ruta_json)} changed since it was indexed (stale offsets)")
+        f.seek(posicion)
+        return f.read(largo)
+
+
+def _elegir(crudo: bytes, ocid: str) -> Dict:
+    """The slice is normally one record; if several come glued together, the one with the ocid is picked."""
+    try:
+        candidatos = [json.loads(crudo)]
+    except ValueError:
+        candidatos = json.loads(b"[" + crudo + b"]")
+    for r in candidatos:
+        if isinstance(r, dict) and r.get("ocid") == ocid: return r
+    raise RegistroNoEncontrado(f"{ocid} is not in the indexed slice")
+
+
+# --- 3. NDJSON PARTS ---
+def _linea_ndjson(carpeta: str, nombre_base: str, numero: int, firma: Optional[tuple] = None) -> bytes:
+    carpeta_mes = os.path.join(carpeta, "ndjson", nombre_base)
+    with open(os.path.join(carpeta_mes, "indice.json"), encoding="utf-8") as f:
+        indice = json.load(f)
+    if firma is not None and (indice["origen"]["bytes"], indice["origen"]["mtime"]) != tuple(firma):
+        raise RegistroNoEncontrado(f"{nombre_base}: NDJSON parts changed since they were indexed")
+    acumulado = 0
+    for parte in indice["partes"]:
+        if numero < acumulado + parte["registros"]:
+            ruta = os.path.join(carpeta_mes, parte["archivo"])
+            if indice["compresion"] == "zstd":
+                if zstandard is None: raise RuntimeError("The parts are zstd compressed and 'zstandard' is missing")
+                lineas = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(ruta, "rb"), closefd=True))
+            else:
+                lineas = gzip.open(ruta, "rb")
+            with lineas:
+                for i, linea in enumerate(lineas):
+                    if i == numero - acumulado: return linea
+        acumulado += parte["registros"]
+    raise RegistroNoEncontrado(f"{nombre_base}: there is no record {numero}")
+
+
+# --- 4. API ---
+def leer_registro(ubicacion: Dict, carpeta: Optional[str] = None) -> Dict:
+    """Full OCDS record (ocid, releases, compiledRelease) for a location returned by ubicar()."""
+    carpeta = carpeta or CARPETA_DATABASE
+    nombre = ubicacion["nombre_archivo"]
+    firma = (ubicacion["bytes"], ubicacion["mtime"]) if ubicacion.get("bytes") is not None else None
+    if ubicacion["fuente"] == "json":
+        ruta = os.path.join(carpeta, nombre)
+        if ubicacion["posicion"] is None or not os.path.exists(ruta):
+            raise RegistroNoEncontrado(f"{nombre}: no offset, or the JSON is no longer on disk")
+        return _elegir(leer_bytes(ruta, ubicacion["posicion"], ubicacion["largo"], firma), ubicacion["ocid"])
+    return _elegir(_linea_ndjson(carpeta, nombre[:-5], ubicacion["posicion"], firma), ubicacion["ocid"])
+
+
+def registro_mas_reciente(identificador: str, ruta_indice: Optional[str] = None, carpeta: Optional[str] = None) -> Optional[Dict]:
+    """
+    {ocid, id_convocatoria, archivo, fecha, compiledRelease} of the newest version, or None if the
+    identifier is not indexed (the ETL's cargador.py builds the index before each load).
+    """
+    for ubicacion in ubicar(identificador, ruta_indice):
+        try:
+            registro = leer_registro(ubicacion, carpeta)
+        except (OSError, ValueError, RegistroNoEncontrado):
+            continue  # month moved, deleted or changed after indexing: try the next occurrence
+        return {
+            "ocid": ubicacion["ocid"],
+            "id_convocatoria": ubicacion["id_convocatoria"],
+            "archivo": ubicacion["nombre_archivo"],
+            "fecha": ubicacion["fecha"],
+            "compiledRelease": registro.get("compiledRelease"),
+        }
+    return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    resultado = registro_mas_reciente(sys.argv[1])
+    if resultado is None:
+        print(f"❌ {sys.argv[1]} is not in the index")
+        sys.exit(1)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
@@ -26,7 +26,12 @@ CREATE TABLE IF NOT EXISTS Licitaciones_Cabecera (
     INDEX idx_comprador (comprador(255)),
     INDEX idx_estado (estado_proceso),
     INDEX idx_categoria (categoria),
-    INDEX idx_departamento (departamento)
+    INDEX idx_departamento (departamento),
+    -- Carga de todos los procedimientos: los dashboards filtran por tipo y agregan monto
+    INDEX idx_tipo_fecha (tipo_procedimiento, fecha_publicacion, monto_estimado),
+    INDEX idx_tipo_estado (tipo_procedimiento, estado_proceso),
+    INDEX idx_tipo_categoria (tipo_procedimiento, categoria, monto_estimado),
+    INDEX idx_tipo_departamento (tipo_procedimiento, departamento, monto_estimado)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Tabla de adjudicaciones
@@ -48,12 +53,28 @@ CREATE TABLE IF NOT EXISTS Licitaciones_Adjudicaciones (
         END
     ) STORED,
     fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP,
+    spider_trabajador VARCHAR(100) NULL,
+    spider_lease_hasta DATETIME NULL,
+    spider_intentos INT NOT NULL DEFAULT 0,
+    spider_proximo_intento DATETIME NULL,
+    spider_ultimo_error VARCHAR(255) NULL,
     FOREIGN KEY (id_convocatoria) REFERENCES Licitaciones_Cabecera(id_convocatoria)
         ON DELETE CASCADE ON UPDATE CASCADE,
     INDEX idx_convocatoria (id_convocatoria),
     INDEX idx_ruc (ganador_ruc),
     INDEX idx_fecha_adj (fecha_adjudicacion),
-    INDEX idx_tipo_garantia (tipo_garantia)
+    INDEX idx_tipo_garantia (tipo_garantia),
+    INDEX idx_cola_prioridad (entidad_financiera, spider_intentos, fecha_adjudicacion)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Historial de consultas del spider a la API de contratos (un registro por intento)
+CREATE TABLE IF NOT EXISTS historial_spider (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    id_adjudicacion VARCHAR(100) NOT NULL,
+    resultado VARCHAR(255),
+    trabajador VARCHAR(100),
+    fecha DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_adjudicacion (id_adjudicacion, fecha)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Tabla de contratos
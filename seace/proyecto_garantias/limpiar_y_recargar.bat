@@ -20,7 +20,7 @@ set GARANTIAS_EMAIL_TO=yanfrancochaupincsco@gmail.com
 set GARANTIAS_GEMINI_API_KEY=YOUR_API_KEY_HERE
 
 echo 1. Limpiando datos actuales...
-python -c "import mysql.connector; conn = mysql.connector.connect(host='localhost', user='root', password='123456789', database='garantias_seace'); cursor = conn.cursor(); cursor.execute('DELETE FROM Licitaciones_Adjudicaciones'); cursor.execute('DELETE FROM Licitaciones_Cabecera'); cursor.execute('DELETE FROM control_cargas'); conn.commit(); print('OK - Datos limpiados'); conn.close()"
+python -c "import mysql.connector; conn = mysql.connector.connect(host='localhost', user='root', password='123456789', database='garantias_seace'); cursor = conn.cursor(); cursor.execute('DELETE FROM Licitaciones_Adjudicaciones'); cursor.execute('DELETE FROM Licitaciones_Cabecera'); cursor.execute('DELETE FROM control_cargas'); cursor.execute('SHOW TABLES LIKE %s', ('huellas_registros',)); cursor.fetchall() and cursor.execute('DELETE FROM huellas_registros'); conn.commit(); print('OK - Datos limpiados'); conn.close()"
 
 if errorlevel 1 (
     echo ERROR: No se pudieron limpiar los datos